@@ -3,28 +3,71 @@
 """
 ZwCAD 批量读取标注并回写序号 - 增强版（融合美观GUI）
 运行前：pip install pywin32 openpyxl
+
+无参数运行打开图形界面；带文件参数时无界面批处理并输出JSON结果：
+    python GetCADAnnotInfoAndWriteBackSeqNo.py D:\\图纸\\*.dwg --config 配置.json --json 结果.json
 """
 
 import os
 import sys
 import shutil
 import time
-import pythoncom
-import openpyxl
 import queue
 import threading
+import multiprocessing
 import ctypes
-from openpyxl.utils import get_column_letter
-import win32com.client as win32
-from win32com.client import constants as cst
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from tkinter.font import Font
+import fnmatch
+import math
+import re
+import json
+import random
+import hashlib
+import tempfile
+import secrets
+import argparse
+import ast
+import configparser
+import glob
+import sqlite3
+import tracemalloc
+from array import array
+import signal
+from multiprocessing.connection import Listener, Client
+import csv
+import bisect
+from contextlib import contextmanager
+import logging
+import logging.handlers
+from collections import deque
+from collections import namedtuple
+from functools import lru_cache
+
+# 以下模块按需导入：tkinter 仅界面使用，openpyxl 仅写Excel时使用，pywin32 仅连接ZwCAD时使用
+tk = ttk = filedialog = messagebox = None
+pythoncom = win32 = None
+
+def load_gui_modules():
+    """导入 tkinter（无界面批处理不需要）"""
+    global tk, ttk, filedialog, messagebox
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+
+def load_com_modules():
+    """导入 pywin32（离线DXF/模拟CAD不需要）"""
+    global pythoncom, win32
+    import pythoncom
+    import win32com.client as win32
+
+# 离线DXF后端（cad_backends.py）与模拟CAD（cad_simulator.py）在用到时才导入，二者按模块名导入本脚本；
+# 作为脚本运行（__main__，工作进程中为 __mp_main__）时同样以模块名登记，保证读到的是同一份配置
+sys.modules.setdefault("GetCADAnnotInfoAndWriteBackSeqNo", sys.modules[__name__])
 
 # ==========  用户可改区域  ==========
 ZWCAD_EXE = r"C:\Program Files\ZWSOFT\ZWCAD 2023\ZWCAD.exe"
 WORK_DIR  = r"D:\CAD标识\标识后"
 EXCEL_NAME= "数值表.xlsx"
+# 是否生成Excel报表（无界面批处理只需要JSON结果时可关闭）
+EXCEL_ENABLED = True
 # 序号文字高度（可调整）
 TEXT_HEIGHT = 2.5
 # 序号偏移量（Y轴向上偏移，避免遮挡原标注）
@@ -33,11 +76,360 @@ TEXT_OFFSET_Y = 3.0
 SUPPORT_FONT = "gbcbig.shx"  # 备选：hztxt.shx、hzfs.shx
 # 使用带括号数字而非带圈数字（避免字体兼容性问题）
 USE_BRACKET_NUMBERS = True  # True: 使用(1)(2)(3); False: 使用①②③
+# 回写序号所在的专用图层及其颜色（1=红色，序号文字颜色随层）
+LABEL_LAYER = "SEQ_NO"
+LABEL_COLOR = 1
+# 增量回写：比对图中已有的序号（LABEL_LAYER 图层上的 (n) 文字），未变化的保留、变化的原位修改、多余的删除（False=每次全部新增）
+INCREMENTAL_LABELS = True
+# 序号避让：在候选位置中选第一个不与标注文字、已放置序号重叠的位置（False=全部放在标注上方 TEXT_OFFSET_Y 处）
+LABEL_AVOID_OVERLAP = True
+# 候选位置（相对标注位置的 (dx, dy)，按顺序尝试）；None=按 TEXT_OFFSET_Y 自动生成上、下、右、左及斜向三圈
+LABEL_CANDIDATE_OFFSETS = None
+# CAD就绪检测（秒）：启动/打开文档的最长等待，以及轮询的初始/最大间隔（指数退避）
+CAD_START_TIMEOUT = 60
+DOC_OPEN_TIMEOUT = 30
+READY_POLL_INITIAL = 0.05
+READY_POLL_MAX = 1.0
+# 并行进程数：1 为单实例串行；大于1时每个进程启动独立的ZwCAD实例
+WORKER_COUNT = 1
+# 看门狗：单张图纸的处理时限（秒），超时则终止工作进程并结束其CAD进程，由新进程接替；
+# None=不限制。设置后即使 WORKER_COUNT 为1，ZwCAD也在受监控的工作进程中运行
+FILE_TIMEOUT = None
+# 超时、工作进程异常退出或CAD进程崩溃/断开的图纸重试的次数，用完后记为失败
+FILE_RETRIES = 1
+# CAD实例回收：处理N张图纸后重启（0=不按数量），或CAD进程内存超过N MB时重启（0=不检查）
+CAD_RECYCLE_FILES = 0
+CAD_RECYCLE_MEMORY_MB = 0
+# 常驻CAD会话服务地址（"主机:端口"，先用 --serve 启动服务）：批处理向服务租用已预热的ZwCAD，
+# 结束后归还而不退出；None=每批自行启动/关闭ZwCAD。服务不可用时自动退回本地启动
+CAD_SESSION_ADDRESS = None
+# 会话服务的连接口令：连接通道会反序列化收到的数据，知道口令即可在服务端执行代码，所以不提供默认值。
+# None=依次取环境变量 CAD_SEQNO_SESSION_AUTHKEY、当前用户的口令文件（服务端首次启动时随机生成，仅本用户可读）
+CAD_SESSION_AUTHKEY = None
+# 服务端保持预热的ZwCAD实例数（每个实例一个进程，同时服务的批处理数）
+CAD_SESSION_INSTANCES = 1
+# CAD后端："auto" DXF文件离线解析、DWG文件用ZwCAD；"zwcad" 全部用ZwCAD；"dxf" 全部离线解析
+CAD_BACKEND = "auto"
+# Excel流式写入：整批共用一个工作簿，结束时一次性保存（内存占用低，但中途无法保存检查点）
+EXCEL_WRITE_ONLY = True
+# 每处理N张图纸保存一次检查点（0=不保存；仅非流式模式有效）
+EXCEL_CHECKPOINT_EVERY = 0
+# 流水线深度：写Excel/写缓存在独立线程中进行，与下一张图纸的CAD处理重叠；
+# 输出阶段积压超过该数量时CAD阶段等待（0=不使用流水线，按顺序执行）
+PIPELINE_DEPTH = 2
+# 提取时在CAD端用选择集过滤，只让标注/文字实体经过COM（失败时退回遍历ModelSpace）
+EXTRACT_USE_SELECTION_SET = True
+# 只提取这些图层上的标注（空列表=全部图层，支持通配符，如 ["DIM*", "标注"]）
+EXTRACT_LAYERS = []
+# 只提取该范围内的标注 (xmin, ymin, xmax, ymax)，None=不限制
+EXTRACT_WINDOW = None
+# 提取块参照中的标注与属性（同一块定义只读取一次，按插入点、比例、旋转换算到各个块参照）
+EXTRACT_BLOCKS = True
+# 同时记录每个标注实体的图层与句柄（COM后端每个实体多两次COM调用，只保存在内存中，不写入缓存）
+EXTRACT_METADATA = False
+# 合并重复标注（炸开/重叠复制产生的同内容、同位置标注只保留第一条），以及判定为同一位置的距离
+DEDUP_ENABLED = True
+DEDUP_TOLERANCE = 0.01
+# 序号顺序："rows" 从上到下分行、行内从左到右 / "path" 从左上角起的最近邻路径 / "extraction" CAD遍历顺序
+SEQUENCE_ORDER = "rows"
+# 分行的行高：Y坐标与本行首个标注相差不超过该值的标注归为同一行（None=4倍 TEXT_HEIGHT）
+SEQUENCE_ROW_BAND = None
+# 编号分区（如多个图框/视口）[(xmin, ymin, xmax, ymax), ...]：按列表顺序逐区编号，区外的标注排在最后
+SEQUENCE_ZONES = []
+# 按图纸内容哈希缓存提取/回写结果，未变化的图纸直接复用；中断的批次可断点续跑
+CACHE_ENABLED = True
+# 缓存目录（None=输出目录下的 .cache 子目录，清空输出目录时不会被删除）
+CACHE_DIR = None
+# 日志级别（DEBUG / INFO / WARNING / ERROR），低于该级别的日志不显示也不写入文件
+LOG_LEVEL = "INFO"
+# 日志文件（后台线程写入，按大小滚动）：None=输出目录下 logs\seqno.log，False=不写日志文件
+LOG_FILE = None
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 3
+# 批次结束时在输出目录导出各阶段耗时与吞吐统计（metrics.json / metrics.csv）
+METRICS_EXPORT = True
+# COM调用剖析：统计每个COM属性/方法的调用次数、耗时分布与调用函数，每张图纸输出报告到输出目录下 profile（有少量额外开销）
+COM_PROFILE = False
+# 剖析时同时写出逐次调用轨迹（Chrome trace 格式，可用 chrome://tracing 或 Perfetto 查看）
+COM_TRACE = False
+# 标注数据库（SQLite）：记录每张图纸的标注与序号，可跨图纸查询（--query）、按需生成Excel（--export-excel）
+STORE_ENABLED = True
+# 数据库文件（None=输出目录下 store\annotations.sqlite，清空输出目录时保留）
+STORE_PATH = None
+# 热文件夹服务（--watch）：监视的输入目录，新增或修改的图纸自动排队处理；结果发布目录（None=输出目录下 outbox）
+WATCH_DIR = None
+WATCH_OUTBOX = None
+# 输入目录的轮询间隔（秒）；文件大小与修改时间持续不变超过 WATCH_SETTLE_SECONDS 秒才视为复制完成
+WATCH_POLL_INTERVAL = 2.0
+WATCH_SETTLE_SECONDS = 5.0
+# 每批最多处理的图纸数（积压较多时分成小批次，结果逐批发布）
+WATCH_BATCH_SIZE = 10
+# 使用模拟CAD代替ZwCAD（无CAD环境下测试/压测批处理流程）
+SIMULATE_CAD = False
+# 模拟参数：每次调用延迟/抖动（秒）、忙拒绝概率、第N次调用后崩溃、启动耗时（秒）
+SIMULATION_PROFILE = {"latency": 0.0005, "jitter": 0.0, "busy_rate": 0.0, "crash_after": None, "startup_time": 0.5}
 # ====================================
 
+# 需要同步到工作进程中的用户配置项
+USER_SETTING_NAMES = (
+    "ZWCAD_EXE", "WORK_DIR", "EXCEL_NAME", "EXCEL_ENABLED", "TEXT_HEIGHT", "TEXT_OFFSET_Y",
+    "SUPPORT_FONT", "USE_BRACKET_NUMBERS", "LABEL_LAYER", "LABEL_COLOR", "LABEL_AVOID_OVERLAP",
+    "LABEL_CANDIDATE_OFFSETS", "INCREMENTAL_LABELS", "CAD_START_TIMEOUT", "DOC_OPEN_TIMEOUT",
+    "READY_POLL_INITIAL", "READY_POLL_MAX", "WORKER_COUNT", "CAD_BACKEND",
+    "FILE_TIMEOUT", "FILE_RETRIES", "CAD_RECYCLE_FILES", "CAD_RECYCLE_MEMORY_MB",
+    "CAD_SESSION_ADDRESS", "CAD_SESSION_AUTHKEY", "CAD_SESSION_INSTANCES",
+    "EXCEL_WRITE_ONLY", "EXCEL_CHECKPOINT_EVERY", "PIPELINE_DEPTH",
+    "EXTRACT_USE_SELECTION_SET", "EXTRACT_LAYERS", "EXTRACT_WINDOW", "EXTRACT_BLOCKS", "EXTRACT_METADATA",
+    "SEQUENCE_ORDER", "SEQUENCE_ROW_BAND", "SEQUENCE_ZONES", "DEDUP_ENABLED", "DEDUP_TOLERANCE",
+    "SIMULATE_CAD", "SIMULATION_PROFILE", "CACHE_ENABLED", "CACHE_DIR", "STORE_ENABLED", "STORE_PATH",
+    "WATCH_DIR", "WATCH_OUTBOX", "WATCH_POLL_INTERVAL", "WATCH_SETTLE_SECONDS", "WATCH_BATCH_SIZE",
+    "LOG_LEVEL", "LOG_FILE", "LOG_FILE_MAX_BYTES", "LOG_FILE_BACKUP_COUNT", "METRICS_EXPORT",
+    "COM_PROFILE", "COM_TRACE",
+)
+
+# ==========  就绪检测（替代固定等待）  ==========
+def wait_until(probe, timeout, initial=None, max_interval=None, factor=2.0):
+    """指数退避轮询 probe()，返回真值即就绪；probe 抛异常视为未就绪
+
+    返回 (probe结果, 实际等待秒数)，超过 timeout 抛出 TimeoutError。
+    """
+    interval = READY_POLL_INITIAL if initial is None else initial
+    max_interval = READY_POLL_MAX if max_interval is None else max_interval
+    start = time.perf_counter()
+    deadline = start + timeout
+    last_error = None
+    while True:
+        try:
+            result = probe()
+            if result:
+                return result, time.perf_counter() - start
+        except Exception as e:
+            last_error = e
+        now = time.perf_counter()
+        if now >= deadline:
+            detail = f"：{str(last_error)}" if last_error else ""
+            raise TimeoutError(f"等待超过{timeout}秒仍未就绪{detail}")
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * factor, max_interval)
+
+def is_cad_quiescent(cad):
+    """CAD是否处于空闲（无命令执行）状态；接口不支持状态查询时视为空闲"""
+    for method_name in ("GetZcadState", "GetAcadState"):
+        try:
+            state = getattr(cad, method_name)()
+        except Exception:
+            continue
+        try:
+            return bool(state.IsQuiescent)
+        except Exception:
+            return False  # 状态可查询但读取失败（CAD正忙）时视为未空闲
+    return True
+
+def wait_cad_ready(cad, timeout=None):
+    """等待CAD进入空闲状态，返回实际等待秒数"""
+    timeout = CAD_START_TIMEOUT if timeout is None else timeout
+    _, waited = wait_until(lambda: is_cad_quiescent(cad), timeout)
+    return waited
+
+def wait_document_ready(cad, doc, timeout=None):
+    """等待文档可访问（ModelSpace可读取）且CAD空闲，返回实际等待秒数"""
+    timeout = DOC_OPEN_TIMEOUT if timeout is None else timeout
+    _, waited = wait_until(lambda: doc.ModelSpace is not None and is_cad_quiescent(cad), timeout)
+    return waited
+
+# ==========  COM调用剖析  ==========
+# 日志中列出的耗时最多的调用条数（完整统计见报告文件）
+COM_PROFILE_TOP = 10
+# 由 (所属对象类型, 属性/方法名) 推断返回对象的类型，用于报告中的调用名；"[]" 表示遍历集合得到的元素
+# 未列出的按属性名命名（如 Document.ModelSpace → ModelSpace）
+_COM_CHILD_TYPES = {
+    ("Application", "ActiveDocument"): "Document", ("Documents", "Open"): "Document",
+    ("Documents", "Add"): "Document", ("Documents", "Item"): "Document", ("Documents", "[]"): "Document",
+    ("Document", "ActiveLayer"): "Layer", ("Document", "ActiveTextStyle"): "TextStyle",
+    ("SelectionSets", "Add"): "SelectionSet", ("SelectionSets", "Item"): "SelectionSet",
+    ("Layers", "Add"): "Layer", ("Layers", "Item"): "Layer",
+    ("TextStyles", "Add"): "TextStyle", ("TextStyles", "Item"): "TextStyle",
+    ("Blocks", "Item"): "Block", ("Block", "[]"): "Entity",
+    ("ModelSpace", "[]"): "Entity", ("ModelSpace", "Item"): "Entity", ("ModelSpace", "AddText"): "Entity",
+    ("SelectionSet", "[]"): "Entity", ("Entity", "GetAttributes"): "Attribute",
+}
+
+class ComCallProfiler:
+    """按 (调用名, 调用函数) 累计COM调用次数、总耗时与耗时分布；trace 开启时保留逐次调用记录"""
+    # 耗时分布的分档上限（秒）
+    BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1)
+    BUCKET_LABELS = ("<10us", "<100us", "<1ms", "<10ms", "<100ms", ">=100ms")
+
+    def __init__(self):
+        self.trace = False
+        self.reset()
+
+    def reset(self):
+        self.stats = {}
+        self.events = []
+        self.started = time.perf_counter()
+
+    def record(self, name, caller, start, elapsed):
+        entry = self.stats.get((name, caller))
+        if entry is None:
+            entry = self.stats[(name, caller)] = [0, 0.0, [0] * len(self.BUCKET_LABELS)]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2][bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+        if self.trace:
+            self.events.append((name, caller, start, elapsed))
+
+    def report(self, entities=None):
+        """汇总：总调用次数与耗时、平均每个实体的调用次数，以及按总耗时排序的各调用明细"""
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        calls = sum(entry[0] for _, entry in rows)
+        return {"calls": calls,
+                "seconds": round(sum(entry[1] for _, entry in rows), 6),
+                "calls_per_entity": round(calls / entities, 2) if entities else None,
+                "by_call": [{"call": name, "caller": caller, "count": count, "seconds": round(total, 6),
+                             "mean_us": round(total / count * 1e6, 1),
+                             "histogram": dict(zip(self.BUCKET_LABELS, histogram))}
+                            for (name, caller), (count, total, histogram) in rows]}
+
+    def write_trace(self, path):
+        """写出 Chrome trace（每次调用一个完整事件，时间单位微秒，类别为调用函数）"""
+        pid = os.getpid()
+        events = [{"name": name, "cat": caller, "ph": "X", "pid": pid, "tid": 0,
+                   "ts": round((start - self.started) * 1e6, 1), "dur": round(elapsed * 1e6, 1)}
+                  for name, caller, start, elapsed in self.events]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+com_profiler = ComCallProfiler()
+
+def is_simulated(value):
+    """是否为模拟CAD（cad_simulator）的对象；按类属性判断，不触发COM调用，也不需要导入模拟CAD"""
+    return getattr(type(value), "_simulated", False)
+
+def _is_com_object(value):
+    # win32com 的动态调度对象把接口保存在实例字典的 _oleobj_ 中
+    return "_oleobj_" in getattr(value, "__dict__", ()) or is_simulated(value)
+
+def wrap_com(value, type_name):
+    """COM对象（及COM对象组成的元组，如 GetAttributes 的结果）包装为 ComProxy，其他值原样返回"""
+    if _is_com_object(value):
+        return ComProxy(value, type_name)
+    if isinstance(value, (tuple, list)) and value and _is_com_object(value[0]):
+        return type(value)(ComProxy(item, type_name) for item in value)
+    return value
+
+def unwrap_com(value):
+    """取出 ComProxy 包装的原始COM对象（传给COM方法的参数、按类型判断CAD对象时使用）"""
+    return value._com_target if isinstance(value, ComProxy) else value
+
+class _ComMethod:
+    """ComProxy 上取得的方法：调用时计时并记录，参数中的 ComProxy 先还原"""
+    __slots__ = ("method", "name", "type_name")
+
+    def __init__(self, method, type_name, name):
+        self.method = method
+        self.type_name = type_name
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        caller = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        try:
+            result = self.method(*[unwrap_com(a) for a in args], **kwargs)
+        finally:
+            com_profiler.record(f"{self.type_name}.{self.name}()", caller, start, time.perf_counter() - start)
+        return wrap_com(result, _COM_CHILD_TYPES.get((self.type_name, self.name), self.name))
+
+class ComProxy:
+    """包装 ensure_zwcad 返回的COM对象：属性读写、方法调用与遍历逐次计入 com_profiler
+
+    返回的COM对象同样被包装，所以从 Application 出发得到的文档、集合、实体上的调用都会被统计。
+    """
+    __slots__ = ("_com_target", "_com_type")
+
+    def __init__(self, target, type_name):
+        object.__setattr__(self, "_com_target", target)
+        object.__setattr__(self, "_com_type", type_name)
+
+    def __getattr__(self, name):
+        caller = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        try:
+            value = getattr(self._com_target, name)
+        finally:
+            elapsed = time.perf_counter() - start
+        if callable(value) and not _is_com_object(value):
+            return _ComMethod(value, self._com_type, name)
+        com_profiler.record(f"{self._com_type}.{name}", caller, start, elapsed)
+        return wrap_com(value, _COM_CHILD_TYPES.get((self._com_type, name), name))
+
+    def __setattr__(self, name, value):
+        caller = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        try:
+            setattr(self._com_target, name, unwrap_com(value))
+        finally:
+            com_profiler.record(f"{self._com_type}.{name}=", caller, start, time.perf_counter() - start)
+
+    def __iter__(self):
+        type_name = self._com_type
+        item_type = _COM_CHILD_TYPES.get((type_name, "[]"), "Item")
+        caller = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        try:
+            iterator = iter(self._com_target)
+        finally:
+            com_profiler.record(f"{type_name}._NewEnum", caller, start, time.perf_counter() - start)
+        while True:
+            # 生成器的上一帧是推进遍历的函数
+            caller = sys._getframe(1).f_code.co_name
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                com_profiler.record(f"{type_name}.Next", caller, start, time.perf_counter() - start)
+            yield wrap_com(item, item_type)
+
+    def __repr__(self):
+        return f"<ComProxy {self._com_type} {self._com_target!r}>"
+
+def profile_com(cad):
+    """COM_PROFILE 开启时把 Application 包装为 ComProxy，否则原样返回"""
+    if not COM_PROFILE or isinstance(cad, ComProxy):
+        return cad
+    com_profiler.trace = bool(COM_TRACE)
+    return ComProxy(cad, "Application")
+
+def get_profile_dir():
+    return os.path.join(WORK_DIR, "profile")
+
+def report_com_profile(dwg_path, entities=None):
+    """输出一张图纸的COM调用报告：日志列出耗时最多的调用，完整报告 <图名>.com.json（及轨迹 <图名>.trace.json）写入 profile 目录"""
+    report = com_profiler.report(entities)
+    metrics.count(dwg_path, "com_calls", report["calls"])
+    per_entity = f"，平均每个实体{report['calls_per_entity']}次" if report["calls_per_entity"] else ""
+    log_msg(f"  COM调用{report['calls']}次，耗时{report['seconds']:.3f}秒{per_entity}")
+    for row in report["by_call"][:COM_PROFILE_TOP]:
+        log_msg(f"    {row['call']:<30}{row['caller']:<28}{row['count']:>8}次{row['seconds']:>10.3f}秒"
+                f"  平均{row['mean_us']:.0f}us")
+    try:
+        directory = get_profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, os.path.splitext(os.path.basename(dwg_path))[0])
+        _write_json_atomic(stem + ".com.json", dict(report, drawing=dwg_path))
+        if com_profiler.trace:
+            com_profiler.write_trace(stem + ".trace.json")
+    except OSError as e:
+        log_msg(f"  ⚠️  COM调用报告写入失败：{str(e)}")
+
 # ==========  核心业务逻辑（修复版本）  ==========
 def ensure_zwcad():
     """若 ZwCAD 未启动则启动，并返回 Application 对象（修复COM启动问题）"""
+    if SIMULATE_CAD:
+        return profile_com(start_simulated_cad())
+    load_com_modules()
     pythoncom.CoInitialize()
     cad = None
     try:
@@ -51,19 +443,13 @@ def ensure_zwcad():
             os.startfile(ZWCAD_EXE)
             log_msg("已通过os.startfile启动ZwCAD")
             
-            # 延长等待时间，确保CAD完全加载
-            time.sleep(15)
-            
-            # 尝试多次获取CAD对象
-            for i in range(8):
-                try:
-                    cad = win32.GetActiveObject("ZWCAD.Application")
-                    log_msg(f"第{i+1}次尝试连接ZwCAD成功")
-                    break
-                except:
-                    log_msg(f"第{i+1}次尝试连接ZwCAD失败，等待2秒...")
-                    time.sleep(2)
-            else:
+            # 轮询COM注册，CAD一注册即返回（不再固定等待）
+            try:
+                cad, waited = wait_until(lambda: win32.GetActiveObject("ZWCAD.Application"),
+                                         CAD_START_TIMEOUT)
+                log_msg(f"连接ZwCAD成功，启动等待{waited:.2f}秒")
+            except TimeoutError as e:
+                log_msg(f"轮询连接ZwCAD失败：{str(e)}")
                 # 方法2：如果GetActiveObject失败，尝试Dispatch
                 try:
                     log_msg("尝试使用Dispatch连接ZwCAD...")
@@ -76,6 +462,11 @@ def ensure_zwcad():
             raise Exception(f"启动ZwCAD失败：{str(e2)}")
     
     if cad:
+        try:
+            waited = wait_cad_ready(cad)
+            log_msg(f"ZwCAD已就绪（空闲等待{waited:.2f}秒）")
+        except TimeoutError as e:
+            log_msg(f"⚠️  ZwCAD空闲状态检测超时，继续执行：{str(e)}")
         cad.Visible = True
         # 刷新视图，确保后续操作正常
         try:
@@ -86,10 +477,10 @@ def ensure_zwcad():
     else:
         raise Exception("未能获取ZwCAD应用程序对象")
     
-    return cad
+    return profile_com(cad)
 
 def clear_and_create_excel():
-    """清空工作目录并新建 Excel"""
+    """清空工作目录并新建 Excel 写入器（整批共用，结束时调用 close() 保存）；未启用Excel时返回 None"""
     if os.path.exists(WORK_DIR):
         for file_name in os.listdir(WORK_DIR):
             file_path = os.path.join(WORK_DIR, file_name)
@@ -101,14 +492,13 @@ def clear_and_create_excel():
     else:
         os.makedirs(WORK_DIR)
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "说明"
-    ws["A1"] = "本文件由脚本自动生成，请勿手动修改"
+    if not EXCEL_ENABLED:
+        return None
     excel_full_path = os.path.join(WORK_DIR, EXCEL_NAME)
-    wb.save(excel_full_path)
-    wb.close()
-    log_msg(f"Excel文件已创建：{excel_full_path}")
+    writer = ExcelReportWriter(excel_full_path)
+    mode = "流式写入，结束时保存" if writer.write_only else "内存工作簿"
+    log_msg(f"Excel文件已创建（{mode}）：{excel_full_path}")
+    return writer
 
 def number_to_circle(n: int) -> str:
     """1→①  2→② … 20→⑳  大于20用(21)形式，返回兼容CAD的字符串"""
@@ -133,10 +523,11 @@ def number_to_circle(n: int) -> str:
 def create_special_text_style(doc, style_name="SpecialCharStyle"):
     """创建或获取特殊文本样式（修复版本）"""
     try:
-        # 检查样式是否存在
-        for style in doc.TextStyles:
-            if style.Name.lower() == style_name.lower():
-                return style
+        # 按名称直接查找（一次COM调用），不存在时抛出异常
+        try:
+            return doc.TextStyles.Item(style_name)
+        except Exception:
+            pass
         
         # 创建新样式
         new_style = doc.TextStyles.Add(style_name)
@@ -152,337 +543,2367 @@ def create_special_text_style(doc, style_name="SpecialCharStyle"):
         except:
             return None
 
+# ----- 标注文字规范化 -----
+# 规则在导入时编译一次；同一批图纸中重复出现的标注文字由 LRU 缓存直接返回
+NormalizedText = namedtuple("NormalizedText", "value kind number_format")
+NormalizedText.__doc__ = """规范化结果：value 写入Excel的值，kind 分类，number_format Excel数字格式（非数值为 None）
+
+kind: number 纯数值 / diameter 直径Φ / radius 半径R / tolerance 含公差± / text 其他文字
+"""
+NORMALIZE_CACHE_SIZE = 4096
+
+# MText 格式码：\\ \{ \} 转义字符、\S上^下; 堆叠、带参数的 \A1; \C1; \Fxxx; 等、开关码 \L \O \K、\P 换行、{} 分组
+_MTEXT_CODE_RE = re.compile(r"\\([\\{}])|\\S([^;]*);|\\[ACcFfHhQTWp][^;]*;|\\[LlOoKkX]|\\[PN~]|[{}]")
+# DXF 控制码 %%c %%p %%d 与各种直径符号统一写法
+_SYMBOL_RE = re.compile(r"%%[cCpPdD]|[∅⌀фФ]")
+_SYMBOL_MAP = {"%%c": "Φ", "%%p": "±", "%%d": "°", "∅": "Φ", "⌀": "Φ", "ф": "Φ", "Ф": "Φ"}
+# 纯数值：只含数字、小数点、千分位逗号（负号等视为文字，保留原格式）
+_NUMBER_RE = re.compile(r"[0-9.,]+")
+_NUMBER_BODY = r"\d+(?:\.\d+)?"
+_DIAMETER_RE = re.compile(rf"(?:\d+-)?Φ\s*{_NUMBER_BODY}.*")
+_RADIUS_RE = re.compile(rf"R\s*{_NUMBER_BODY}.*")
+# 堆叠的上下偏差，如 20+0.1/-0.2
+_DEVIATION_RE = re.compile(rf"\d\s*[+-]{_NUMBER_BODY}/[+-]?{_NUMBER_BODY}")
+
+def _mtext_code(m):
+    if m.group(1):
+        return m.group(1)
+    if m.group(2) is not None:
+        return re.sub(r"[\^#]", "/", m.group(2))
+    return " " if m.group(0) in ("\\P", "\\N", "\\~") else ""
+
+def _normalize_uncached(text):
+    if "\\" in text or "{" in text:
+        text = _MTEXT_CODE_RE.sub(_mtext_code, text)
+    if "%%" in text or not text.isascii():
+        text = _SYMBOL_RE.sub(lambda m: _SYMBOL_MAP[m.group(0).lower()], text)
+    text = text.strip()
+
+    if _NUMBER_RE.fullmatch(text):
+        try:
+            number = float(text.replace(",", ""))
+        except ValueError:
+            return NormalizedText(text, "text", None)
+        if number.is_integer():
+            return NormalizedText(str(int(number)), "number", "0")
+        return NormalizedText(f"{number:.2f}", "number", "0.00")
+    if "±" in text or _DEVIATION_RE.search(text):
+        return NormalizedText(text, "tolerance", None)
+    if _DIAMETER_RE.fullmatch(text):
+        return NormalizedText(text, "diameter", None)
+    if _RADIUS_RE.fullmatch(text):
+        return NormalizedText(text, "radius", None)
+    return NormalizedText(text, "text", None)
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_annotation_text(text):
+    """规范化单条标注文字：去除MText格式码、统一特殊符号、分类，数值转为统一格式"""
+    return _normalize_uncached(text)
+
+def normalize_texts(texts):
+    """批量规范化，返回与输入等长的 NormalizedText 列表（批内重复文字只计算一次）"""
+    seen = {}
+    results = []
+    for text in texts:
+        result = seen.get(text)
+        if result is None:
+            result = seen[text] = normalize_annotation_text(text)
+        results.append(result)
+    return results
+
 def convert_to_numeric(text):
+    """纯数值文字转为统一格式（整数/两位小数），其他文字原样返回"""
     if not text or not isinstance(text, str):
         return text
-    
-    # 定义「保留原格式」的特殊符号
-    special_symbols = {'R', 'Φ', 'ф', 'Ф', '∮', '+', '/', '-', '±', 'X', 'x'}
-    
-    # 检查是否包含特殊符号或字母
-    has_special_or_alpha = any(char.isalpha() or char in special_symbols for char in text)
-    if has_special_or_alpha:
-        return text  # 包含字母或特殊符号，直接返回原文本
-
-    # 定义纯数值允许的字符
-    numeric_chars = {'0','1','2','3','4','5','6','7','8','9','.', ',', '-'}
-    # 检查是否所有字符都在允许范围内
-    if not all(char in numeric_chars for char in text.replace(" ", "")):
-        return text  # 包含不允许的字符，返回原文本
-
-    # 步骤2：纯数值格式文本，进行数值转换和格式化
-    conversion_attempts = [
-        lambda x: float(x),
-        lambda x: float(x.replace(',', '')),
-    ]
-    
-    for attempt in conversion_attempts:
+    return normalize_annotation_text(text).value
+
+def benchmark_text_normalization(n=200000, distinct=300, seed=0):
+    """规范化微基准：n 条文字由 distinct 种常见标注重复组成，对比无缓存逐条与批量接口的耗时"""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(distinct):
+        value = rng.choice([rng.randint(1, 2000), round(rng.uniform(0.5, 500), 2)])
+        samples.append(rng.choice([f"{value}", f"%%c{value}", f"R{value}", f"{value}%%p0.05",
+                                   f"{{\\fSimSun|b0;Φ{value}}}", f"{value}\\S+0.1^-0.2;", f"2-Φ{value}"]))
+    texts = [rng.choice(samples) for _ in range(n)]
+
+    start = time.perf_counter()
+    for text in texts:
+        _normalize_uncached(text)
+    uncached = time.perf_counter() - start
+
+    normalize_annotation_text.cache_clear()
+    start = time.perf_counter()
+    normalize_texts(texts)
+    batch = time.perf_counter() - start
+    return {"texts": n, "distinct": distinct,
+            "uncached_seconds": round(uncached, 3), "batch_seconds": round(batch, 3),
+            "speedup": round(uncached / batch, 1) if batch else None}
+
+# ==========  标注表（按列存储）  ==========
+# 坐标保留的小数位数（加入标注表时统一取整，Excel与回写不再重复转换）
+COORD_DECIMALS = 2
+
+class AnnotationMeta:
+    """单个标注实体的附加信息（EXTRACT_METADATA 开启时记录）"""
+    __slots__ = ("entity_type", "layer", "handle")
+
+    def __init__(self, entity_type, layer=None, handle=None):
+        self.entity_type = entity_type
+        self.layer = layer
+        self.handle = handle
+
+    def __reduce__(self):
+        return (AnnotationMeta, (self.entity_type, self.layer, self.handle))
+
+    def __repr__(self):
+        return f"AnnotationMeta({self.entity_type!r}, {self.layer!r}, {self.handle!r})"
+
+# 标注位置在文字中的锚点（序号避让估算文字范围用）：尺寸的文字位置是文字中心；
+# 单行文字/属性的插入点是基线左端（任何对齐方式下 InsertionPoint 与DXF组码10都是这一点）；
+# 多行文字的插入点是附着点，按默认的左上角处理
+ANCHOR_CENTER, ANCHOR_LOWER_LEFT, ANCHOR_UPPER_LEFT = 0, 1, 2
+TEXT_ANCHORS = {"AcDbText": ANCHOR_LOWER_LEFT, "AcDbAttribute": ANCHOR_LOWER_LEFT, "AcDbMText": ANCHOR_UPPER_LEFT,
+                "TEXT": ANCHOR_LOWER_LEFT, "ATTRIB": ANCHOR_LOWER_LEFT, "MTEXT": ANCHOR_UPPER_LEFT}
+
+class AnnotationTable:
+    """按列存储的标注列表：X/Y 为 array('d')，文字存入去重后的文字表，每行只保存文字编号
+
+    对外仍表现为 [(标注内容, X, Y), ...]（可迭代、取下标、切片），按元组处理的代码不需要修改；
+    meta 列只在有附加信息时创建，anchors 列（锚点，见 TEXT_ANCHORS）只在有非中心锚点时创建。
+    take() 按下标重排/筛选，新表与原表共用文字表。
+    """
+    __slots__ = ("strings", "text_ids", "xs", "ys", "meta", "anchors", "_text_index")
+
+    def __init__(self, records=()):
+        self.strings = []
+        self._text_index = {}
+        self.text_ids = array("I")
+        self.xs = array("d")
+        self.ys = array("d")
+        self.meta = None
+        self.anchors = None
+        self.extend(records)
+
+    @classmethod
+    def coerce(cls, data):
+        """已经是标注表时原样返回，否则由 (标注内容, X, Y[, 附加信息]) 序列构造"""
+        return data if isinstance(data, cls) else cls(data)
+
+    @classmethod
+    def _from_columns(cls, strings, text_ids, xs, ys, meta, anchors=None):
+        table = cls.__new__(cls)
+        table.strings = strings
+        table._text_index = {txt: i for i, txt in enumerate(strings)}
+        table.text_ids, table.xs, table.ys, table.meta, table.anchors = text_ids, xs, ys, meta, anchors
+        return table
+
+    def __reduce__(self):
+        return (AnnotationTable._from_columns,
+                (self.strings, self.text_ids, self.xs, self.ys, self.meta, self.anchors))
+
+    def append(self, txt, x, y, meta=None, anchor=ANCHOR_CENTER):
+        text_id = self._text_index.get(txt)
+        if text_id is None:
+            text_id = self._text_index[txt] = len(self.strings)
+            self.strings.append(txt)
+        self.text_ids.append(text_id)
+        self.xs.append(round(float(x), COORD_DECIMALS))
+        self.ys.append(round(float(y), COORD_DECIMALS))
+        if self.meta is None and meta is not None:
+            self.meta = [None] * (len(self.xs) - 1)
+        if self.meta is not None:
+            self.meta.append(meta)
+        if self.anchors is None and anchor != ANCHOR_CENTER:
+            self.anchors = array("B", bytes(len(self.xs) - 1))
+        if self.anchors is not None:
+            self.anchors.append(anchor)
+
+    def extend(self, records):
+        append = self.append
+        for record in records:
+            append(*record)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __iter__(self):
+        strings = self.strings
+        for text_id, x, y in zip(self.text_ids, self.xs, self.ys):
+            yield (strings[text_id], x, y)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return AnnotationTable._from_columns(
+                self.strings, self.text_ids[key], self.xs[key], self.ys[key],
+                self.meta[key] if self.meta is not None else None,
+                self.anchors[key] if self.anchors is not None else None)
+        return (self.strings[self.text_ids[key]], self.xs[key], self.ys[key])
+
+    def __repr__(self):
+        return f"<AnnotationTable {len(self)}行，{len(self.strings)}种文字>"
+
+    def texts(self):
+        strings = self.strings
+        return [strings[i] for i in self.text_ids]
+
+    def take(self, indices):
+        """按下标顺序取出若干行组成新表"""
+        text_ids, xs, ys, meta, anchors = self.text_ids, self.xs, self.ys, self.meta, self.anchors
+        return AnnotationTable._from_columns(
+            self.strings, array("I", [text_ids[i] for i in indices]),
+            array("d", [xs[i] for i in indices]), array("d", [ys[i] for i in indices]),
+            [meta[i] for i in indices] if meta is not None else None,
+            array("B", [anchors[i] for i in indices]) if anchors is not None else None)
+
+def benchmark_annotation_table(n=1000000, distinct=500, seed=0):
+    """内存对比：n 条标注分别存为元组列表与标注表时占用的内存（tracemalloc 统计，单位MB）"""
+    rng = random.Random(seed)
+    samples = [str(rng.choice([rng.randint(1, 2000), round(rng.uniform(0.5, 500), 2)]))
+               for _ in range(distinct)]
+    picks = [rng.randrange(distinct) for _ in range(n)]
+    coords = [(rng.uniform(0, 1e5), rng.uniform(0, 1e5)) for _ in range(n)]
+
+    def measure(build):
+        tracemalloc.start()
         try:
-            result = attempt(text)
-            if isinstance(result, float):
-                if result.is_integer():
-                    return str(int(result))
-                else:
-                    return f"{result:.2f}"
+            # 逐条生成新字符串，与COM每次返回新的字符串对象一致
+            result = build((samples[i] + " ")[:-1] for i in picks)
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del result
+        return round(size / 1024 / 1024, 1)
+
+    as_tuples = measure(lambda texts: [(txt, round(x, 2), round(y, 2)) for txt, (x, y) in zip(texts, coords)])
+    as_table = measure(lambda texts: AnnotationTable((txt, x, y) for txt, (x, y) in zip(texts, coords)))
+    return {"annotations": n, "tuples_mb": as_tuples, "table_mb": as_table,
+            "ratio": round(as_tuples / as_table, 1) if as_table else None}
+
+def open_dwg(cad, dwg_path):
+    """打开DWG文件并返回文档对象"""
+    # 确保cad有活动文档
+    placeholder = None
+    if not cad.ActiveDocument:
+        log_msg("  CAD没有活动文档，尝试创建新文档")
+        placeholder = cad.Documents.Add()
+
+    doc = cad.Documents.Open(dwg_path)
+    # 占位文档打开图纸后即关闭，否则每张图纸都会在CAD中留下一个空文档
+    if placeholder is not None:
+        try:
+            placeholder.Close(False)
+        except Exception as e:
+            log_msg(f"  ⚠️  关闭占位文档失败：{str(e)}")
+    waited = wait_document_ready(cad, doc)
+    metrics.add(dwg_path, "ready_wait", waited)
+    log_msg(f"  文档已就绪，等待{waited:.2f}秒")
+    return doc
+
+DIMENSION_ENTITY_NAMES = ("AcDbDimension", "AcDbRotatedDimension", "AcDbAlignedDimension",
+                          "AcDbRadialDimension", "AcDbDiametricDimension")
+TEXT_ENTITY_NAMES = ("AcDbText", "AcDbMText")
+BLOCK_REFERENCE_ENTITY_NAME = "AcDbBlockReference"
+# 选择集过滤使用的DXF实体类型
+ANNOTATION_DXF_TYPES = ("DIMENSION", "TEXT", "MTEXT")
+SELECTION_SET_NAME = "SEQNO_EXTRACT"
+# SelectionSet.Select 的选择模式
+AC_SELECTION_SET_ALL = 5
+
+def com_array(vartype_name, values):
+    """构造COM数组参数（如 "VT_I2"）；无pywin32的替身后端直接使用列表"""
+    if win32 is None:
+        return list(values)
+    return win32.VARIANT(pythoncom.VT_ARRAY | getattr(pythoncom, vartype_name), values)
+
+def build_annotation_filter(layers=None, window=None):
+    """构造选择集的DXF组码过滤条件，返回 (组码列表, 值列表)
+
+    实体类型为 DIMENSION/TEXT/MTEXT 之一，且位于模型空间；
+    可选图层（组码8，逗号分隔支持通配符）和范围（组码10的关系比较，按文字基点粗筛）。
+    尺寸的组码10是定义点而不是文字位置，所以范围只用于 TEXT/MTEXT，尺寸取出后按文字位置判断。
+    块参照另用 build_block_filter 选择。
+    """
+    types = ANNOTATION_DXF_TYPES
+    if window:
+        xmin, ymin, xmax, ymax = window
+        text_types = [t for t in types if t != "DIMENSION"]
+        codes = [-4, 0, -4, -4] + [0] * len(text_types) + [-4, -4, 10, -4, 10, -4, -4]
+        values = ["<OR", "DIMENSION", "<AND", "<OR", *text_types, "OR>",
+                  ">=,>=,*", make_point(xmin, ymin), "<=,<=,*", make_point(xmax, ymax), "AND>", "OR>"]
+    else:
+        codes = [-4] + [0] * len(types) + [-4]
+        values = ["<OR", *types, "OR>"]
+    codes.append(410)
+    values.append("Model")
+    if layers:
+        codes.append(8)
+        values.append(",".join(layers))
+    return codes, values
+
+def select_entities(doc, codes, values):
+    """在CAD端按过滤条件（组码、值列表）建立选择集，只有符合条件的实体才会经过COM边界"""
+    selection_sets = doc.SelectionSets
+    try:
+        selection_sets.Item(SELECTION_SET_NAME).Delete()
+    except Exception:
+        pass
+    selection_set = selection_sets.Add(SELECTION_SET_NAME)
+    empty = pythoncom.Empty if pythoncom is not None else None
+    selection_set.Select(AC_SELECTION_SET_ALL, empty, empty,
+                         com_array("VT_I2", codes), com_array("VT_VARIANT", values))
+    return selection_set
+
+def build_block_filter():
+    """模型空间全部块参照：块内容可能远离插入点、块内实体的图层也与块参照无关，
+    所以不按范围和图层筛选，展开后在本地按文字位置和各实体的图层过滤"""
+    return [0, 410], ["INSERT", "Model"]
+
+def select_annotation_entities(doc, layers=None, window=None):
+    """建立只包含候选标注实体的选择集"""
+    return select_entities(doc, *build_annotation_filter(layers, window))
+
+def _drain_selection_set(selection_set):
+    """逐个产出选择集中的实体，结束（或中途停止）时删除选择集"""
+    try:
+        for entity in selection_set:
+            yield entity
+    finally:
+        try:
+            selection_set.Delete()
+        except Exception:
+            pass
+
+def iter_block_references(doc):
+    """用单独的选择集逐个产出模型空间的块参照，失败时遍历模型空间"""
+    try:
+        selection_set = select_entities(doc, *build_block_filter())
+        log_msg(f"  选择集筛选出{selection_set.Count}个块参照")
+    except Exception as e:
+        log_msg(f"  ⚠️  块参照选择集失败，改为遍历模型空间：{str(e)}")
+        for entity in doc.ModelSpace:
+            try:
+                if entity.EntityName == BLOCK_REFERENCE_ENTITY_NAME:
+                    yield entity
+            except Exception:
+                continue
+        return
+    yield from _drain_selection_set(selection_set)
+
+def _layer_matches(layer_name, layers):
+    layer_name = layer_name.upper()
+    return any(fnmatch.fnmatchcase(layer_name, pattern.upper()) for pattern in layers)
+
+def iter_candidate_entities(doc):
+    """按配置逐个产出候选实体：优先使用CAD端选择集（标注按图层/范围筛选，EXTRACT_BLOCKS 时块参照另建选择集），
+    失败时遍历 ModelSpace 并在本地按图层过滤（块参照不按自身图层过滤）"""
+    if EXTRACT_USE_SELECTION_SET:
+        selection_set = None
+        try:
+            selection_set = select_annotation_entities(doc, EXTRACT_LAYERS, EXTRACT_WINDOW)
+            log_msg(f"  选择集筛选出{selection_set.Count}个候选实体")
+        except Exception as e:
+            log_msg(f"  ⚠️  选择集过滤失败，改为遍历模型空间：{str(e)}")
+        if selection_set is not None:
+            yield from _drain_selection_set(selection_set)
+            if EXTRACT_BLOCKS:
+                yield from iter_block_references(doc)
+            return
+
+    for entity in doc.ModelSpace:
+        if EXTRACT_LAYERS:
+            try:
+                # 图层不符时才多读一次类型：块参照照常产出，展开后按块内实体的图层过滤
+                if (not _layer_matches(entity.Layer, EXTRACT_LAYERS)
+                        and not (EXTRACT_BLOCKS and entity.EntityName == BLOCK_REFERENCE_ENTITY_NAME)):
+                    continue
+            except Exception:
+                continue
+        yield entity
+
+def _in_window(x, y, window):
+    xmin, ymin, xmax, ymax = window
+    return xmin <= x <= xmax and ymin <= y <= ymax
+
+def annotation_record(txt, x, y, meta=None, anchor=ANCHOR_CENTER):
+    """统一整理一条标注：去除首尾空白、坐标取两位小数、按 EXTRACT_WINDOW 判断范围，无效时返回 None
+
+    返回 (标注内容, X, Y, 附加信息, 锚点)，锚点见 TEXT_ANCHORS。
+    """
+    if not txt or not txt.strip() or x is None or y is None:
+        return None
+    try:
+        x_2dec = round(float(x), 2)
+        y_2dec = round(float(y), 2)
+    except (ValueError, TypeError):
+        return None
+    # 选择集只按实体基点粗筛，这里按文字位置精确判断范围
+    if EXTRACT_WINDOW and not _in_window(x_2dec, y_2dec, EXTRACT_WINDOW):
+        return None
+    return (txt.strip(), x_2dec, y_2dec, meta, anchor)
+
+def dimension_text(override, measurement):
+    """尺寸的显示文字：无替代文字时为测量值，替代文字中的 <> 代表测量值（ZwCAD与DXF后端共用）"""
+    measured = str(measurement) if measurement is not None else ""
+    if not override:
+        return measured
+    return str(override).replace("<>", measured)
+
+def read_entity_annotation(entity, entity_name):
+    """读取尺寸/文字实体的 (标注内容, X, Y)，其他实体返回 None"""
+    if entity_name in DIMENSION_ENTITY_NAMES:
+        # 直接读取属性（hasattr 本身也是一次COM调用），用不到测量值时不读取
+        override = entity.TextOverride
+        measurement = entity.Measurement if not override or "<>" in str(override) else None
+        txt = dimension_text(override, measurement)
+        pt = entity.TextPosition
+        return txt, pt[0], pt[1]
+    if entity_name in TEXT_ENTITY_NAMES:
+        pt = entity.InsertionPoint
+        return str(entity.TextString), pt[0], pt[1]
+    return None
+
+# ----- 块参照 -----
+# 块定义嵌套的最大层数（超过时不再展开，防止循环引用）
+BLOCK_MAX_DEPTH = 8
+
+def block_transform(insertion, scale_x=1.0, scale_y=1.0, rotation=0.0):
+    """块定义坐标（相对基点）→ 插入后坐标：先缩放、再绕基点旋转（弧度）、再平移到插入点"""
+    cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+    ix, iy = insertion[0], insertion[1]
+
+    def apply(x, y):
+        x, y = x * scale_x, y * scale_y
+        return ix + x * cos_r - y * sin_r, iy + x * sin_r + y * cos_r
+    return apply
+
+def block_layer(layer, insert_layer):
+    """块内实体的实际图层：0 图层上的实体随所在块参照的图层"""
+    return insert_layer if layer == "0" and insert_layer is not None else layer
+
+class BlockDefinitionCache:
+    """块定义中的标注按块名只读取一次，缓存为相对基点的 [(标注内容, x, y, 实体类型, 图层), ...]
+
+    read_definition(块名) 返回 (基点, 定义内条目列表)，条目为
+    ("annotation", 标注内容, x, y, 实体类型, 图层) 或 ("insert", 块名, x, y, X比例, Y比例, 旋转弧度, 图层)；
+    嵌套块参照在缓存时展开（其中 0 图层上的实体换成嵌套块参照的图层），所以每个块参照只需换算坐标，不再读取定义内的实体。
+    """
+    def __init__(self, read_definition):
+        self.read_definition = read_definition
+        self.definitions = {}
+        self.instances = 0
+
+    def annotations(self, name, depth=0):
+        cached = self.definitions.get(name)
+        if cached is not None:
+            return cached
+        if depth > BLOCK_MAX_DEPTH:
+            return []
+        # 先占位，块定义直接或间接引用自身时不会无限递归
+        self.definitions[name] = []
+        origin, items = self.read_definition(name)
+        ox, oy = origin[0], origin[1]
+        result = []
+        for item in items:
+            if item[0] == "insert":
+                _, inner, x, y, scale_x, scale_y, rotation, insert_layer = item
+                transform = block_transform((x - ox, y - oy), scale_x, scale_y, rotation)
+                for txt, ix, iy, entity_type, layer in self.annotations(inner, depth + 1):
+                    tx, ty = transform(ix, iy)
+                    result.append((txt, tx, ty, entity_type, block_layer(layer, insert_layer)))
             else:
-                return str(result)
-        except (ValueError, TypeError):
+                _, txt, x, y, entity_type, layer = item
+                result.append((txt, x - ox, y - oy, entity_type, layer))
+        self.definitions[name] = result
+        return result
+
+    def instance_annotations(self, name, insertion, scale_x=1.0, scale_y=1.0, rotation=0.0):
+        """一个块参照中的标注（插入后坐标）：[(标注内容, X, Y, 实体类型, 图层), ...]"""
+        self.instances += 1
+        transform = block_transform(insertion, scale_x, scale_y, rotation)
+        return [(txt,) + transform(x, y) + (entity_type, layer)
+                for txt, x, y, entity_type, layer in self.annotations(name)]
+
+    def summary(self):
+        return f"块参照{self.instances}个，读取块定义{len(self.definitions)}个"
+
+def read_block_definition(doc, name):
+    """通过COM读取块定义：基点与其中的标注、嵌套块参照（供 BlockDefinitionCache 使用）"""
+    block = doc.Blocks.Item(name)
+    origin = block.Origin
+    items = []
+    for entity in block:
+        try:
+            entity_name = entity.EntityName
+            if entity_name == BLOCK_REFERENCE_ENTITY_NAME:
+                pt = entity.InsertionPoint
+                layer = sys.intern(str(entity.Layer)) if EXTRACT_METADATA or EXTRACT_LAYERS else None
+                items.append(("insert", str(entity.Name), pt[0], pt[1],
+                              entity.XScaleFactor, entity.YScaleFactor, entity.Rotation, layer))
+                continue
+            annotation = read_entity_annotation(entity, entity_name)
+            if annotation is not None:
+                layer = sys.intern(str(entity.Layer)) if EXTRACT_METADATA or EXTRACT_LAYERS else None
+                items.append(("annotation",) + annotation + (entity_name, layer))
+        except Exception:
             continue
-    
-    return text
+    return origin, items
 
-def collect_annotations(dwg_path, cad):
-    """提取标注信息（修复版本）"""
-    doc = None
+def iter_block_reference(entity, blocks):
+    """块参照中的标注：定义内容取自缓存并换算坐标，属性（每个块参照各不相同）逐个读取
+
+    EXTRACT_LAYERS 按块内实体与属性各自的图层筛选（0 图层上的随块参照的图层），与块参照本身的图层无关。
+    """
+    read_layers = EXTRACT_METADATA or EXTRACT_LAYERS
+    handle = str(entity.Handle) if EXTRACT_METADATA else None
+    insert_layer = sys.intern(str(entity.Layer)) if read_layers else None
+    pt = entity.InsertionPoint
     try:
-        # 确保cad有活动文档
-        if not cad.ActiveDocument:
-            log_msg("  CAD没有活动文档，尝试创建新文档")
-            doc = cad.Documents.Add()
-        else:
-            doc = cad.ActiveDocument
-        
-        # 打开DWG文件
-        doc = cad.Documents.Open(dwg_path)
-        time.sleep(2)  # 增加等待时间
-        
-        ents = []
-        model_space = doc.ModelSpace
-        
-        for entity in model_space:
-            txt = None
-            x = None
-            y = None
+        contents = blocks.instance_annotations(str(entity.Name), pt, entity.XScaleFactor,
+                                               entity.YScaleFactor, entity.Rotation)
+    except Exception as e:
+        log_msg(f"  ⚠️  读取块定义失败：{str(e)}")
+        contents = []
+    for txt, x, y, entity_type, layer in contents:
+        layer = block_layer(layer, insert_layer)
+        if EXTRACT_LAYERS and not _layer_matches(layer, EXTRACT_LAYERS):
+            continue
+        meta = AnnotationMeta(entity_type, layer, handle) if EXTRACT_METADATA else None
+        yield txt, x, y, meta, TEXT_ANCHORS.get(entity_type, ANCHOR_CENTER)
+    if entity.HasAttributes:
+        for attribute in entity.GetAttributes():
             try:
-                entity_name = entity.EntityName
-                if entity_name in ("AcDbDimension", "AcDbRotatedDimension", "AcDbAlignedDimension", "AcDbRadialDimension", "AcDbDiametricDimension"):
-                    txt = str(entity.TextOverride) if hasattr(entity, 'TextOverride') and entity.TextOverride else str(entity.Measurement)
-                    pt = entity.TextPosition
-                    x, y = pt[0], pt[1]
-                elif entity_name in ("AcDbText", "AcDbMText"):
-                    txt = str(entity.TextString) if hasattr(entity, 'TextString') else str(getattr(entity, 'Text', ''))
-                    pt = entity.InsertionPoint
-                    x, y = pt[0], pt[1]
-            except Exception as e:
+                if attribute.Invisible:
+                    continue
+                layer = block_layer(sys.intern(str(attribute.Layer)), insert_layer) if read_layers else None
+                if EXTRACT_LAYERS and not _layer_matches(layer, EXTRACT_LAYERS):
+                    continue
+                pt = attribute.InsertionPoint
+                meta = None
+                if EXTRACT_METADATA:
+                    meta = AnnotationMeta("AcDbAttribute", layer, str(attribute.Handle))
+                yield str(attribute.TextString), pt[0], pt[1], meta, ANCHOR_LOWER_LEFT
+            except Exception:
                 continue
 
-            if txt and txt.strip() and x is not None and y is not None:
-                try:
-                    x_2dec = round(float(x), 2)
-                    y_2dec = round(float(y), 2)
-                    ents.append((txt.strip(), x_2dec, y_2dec))
-                except (ValueError, TypeError):
+def iter_annotations(doc, stats=None):
+    """逐条产出已打开文档中的标注信息 (标注内容, X, Y, 附加信息)；传入 stats 时累计扫描的实体数 stats["entities"]
+
+    附加信息为 AnnotationMeta（EXTRACT_METADATA 开启时）或 None。
+    EXTRACT_BLOCKS 开启时同时产出块参照中的标注与可见属性。
+    """
+    blocks = BlockDefinitionCache(lambda name: read_block_definition(doc, name)) if EXTRACT_BLOCKS else None
+    labels = []
+    for entity in iter_candidate_entities(doc):
+        if stats is not None:
+            stats["entities"] = stats.get("entities", 0) + 1
+        try:
+            entity_name = entity.EntityName
+            if blocks is not None and entity_name == BLOCK_REFERENCE_ENTITY_NAME:
+                found = list(iter_block_reference(entity, blocks))
+            else:
+                annotation = read_entity_annotation(entity, entity_name)
+                if annotation is None:
                     continue
-        
+                layer = None
+                if entity_name == LABEL_ENTITY_NAME and label_number(annotation[0]) is not None:
+                    # 纯数字文字只多读一次图层：上次回写的序号不作为标注，登记下来供增量回写比对
+                    layer = str(entity.Layer)
+                    if is_label_layer(layer):
+                        labels.append((entity, label_number(annotation[0])) + tuple(annotation[1:]))
+                        continue
+                meta = None
+                if EXTRACT_METADATA:
+                    if layer is None:
+                        layer = str(entity.Layer)
+                    meta = AnnotationMeta(entity_name, sys.intern(layer), str(entity.Handle))
+                found = [annotation + (meta, TEXT_ANCHORS.get(entity_name, ANCHOR_CENTER))]
+        except Exception:
+            continue
+
+        for txt, x, y, meta, anchor in found:
+            record = annotation_record(txt, x, y, meta, anchor)
+            if record is not None:
+                yield record
+    if blocks is not None and blocks.instances:
+        log_msg(f"  {blocks.summary()}")
+    # 只有完整遍历了模型空间文字时，登记的序号才是图中的全部序号
+    if not EXTRACT_LAYERS and not EXTRACT_WINDOW:
+        _existing_label_cache[_doc_key(doc)] = (doc, labels)
+
+def extract_annotations(doc):
+    """从已打开的文档中提取标注信息，返回 AnnotationTable"""
+    ents = AnnotationTable(iter_annotations(doc))
+    log_msg(f"  提取到{len(ents)}条有效标注")
+    return ents
+
+def close_dwg(doc):
+    """关闭文档（不保存），忽略关闭错误"""
+    if doc:
+        _label_style_cache.pop(_doc_key(doc), None)
+        _existing_label_cache.pop(_doc_key(doc), None)
+        try:
+            doc.Close(False)
+        except:
+            pass
+
+def collect_annotations(dwg_path, cad):
+    """提取标注信息（cad 可以是ZwCAD Application对象或 CADBackend）"""
+    backend = as_backend(cad)
+    doc = None
+    try:
+        doc = backend.open(dwg_path)
+        ents = arrange_annotations(AnnotationTable(backend.iter_annotations(doc)))
         log_msg(f"  提取到{len(ents)}条有效标注")
         return ents
     except Exception as e:
         raise Exception(f"提取{dwg_path}标注失败：{str(e)}")
     finally:
-        if doc:
-            try:
-                doc.Close(False)
-            except:
-                pass
+        if doc is not None:
+            backend.close(doc)
+
+# Excel 单个工作表的最大行数（含表头）
+EXCEL_MAX_ROWS = 1048576
+EXCEL_HEADER = ("序号", "标注内容", "X", "Y")
+EXCEL_COLUMN_WIDTHS = {"B": 25, "C": 15, "D": 15}
+
+# 当前批次共用的Excel写入器（由 run_process_async 设置）
+excel_writer = None
+
+class ExcelReportWriter:
+    """整批共用一个工作簿：每张图纸追加一个工作表，超出行数上限自动续表，结束时一次性保存
+
+    write_only=True 使用 openpyxl 流式工作簿，单元格格式通过共享的命名样式设置；
+    existing=True 时加载已有文件（非流式），同名工作表会被替换。
+    """
+    STYLES = {"num_int": "0", "num_dec": "0.00", "coord": "0.00"}
+
+    def __init__(self, path, write_only=None, checkpoint_every=None, existing=False):
+        import openpyxl
+        from openpyxl.styles import NamedStyle
+        self.path = path
+        self.write_only = (EXCEL_WRITE_ONLY if write_only is None else write_only) and not existing
+        self.checkpoint_every = EXCEL_CHECKPOINT_EVERY if checkpoint_every is None else checkpoint_every
+        self.max_data_rows = EXCEL_MAX_ROWS - 1
+        self.sheet_count = 0
+        self.closed = False
+
+        if existing:
+            self.wb = openpyxl.load_workbook(path)
+        else:
+            self.wb = openpyxl.Workbook(write_only=self.write_only)
+            if self.write_only:
+                ws = self.wb.create_sheet("说明")
+                ws.append(["本文件由脚本自动生成，请勿手动修改"])
+            else:
+                ws = self.wb.active
+                ws.title = "说明"
+                ws["A1"] = "本文件由脚本自动生成，请勿手动修改"
+
+        for name, number_format in self.STYLES.items():
+            if name not in self.wb.style_names:
+                self.wb.add_named_style(NamedStyle(name=name, number_format=number_format))
+
+    def _sheet_title(self, sheet_name, part):
+        """续表命名为「名称(续2)」，并满足Excel 31字符的限制"""
+        suffix = "" if part == 1 else f"(续{part})"
+        return sheet_name[:31 - len(suffix)] + suffix
+
+    def _new_sheet(self, title):
+        if not self.write_only and title in self.wb.sheetnames:
+            self.wb.remove(self.wb[title])
+        ws = self.wb.create_sheet(title)
+        # 流式模式下列宽必须在写入数据前设置
+        for column, width in EXCEL_COLUMN_WIDTHS.items():
+            ws.column_dimensions[column].width = width
+        return ws
+
+    # 数字格式 → 命名样式
+    FORMAT_STYLES = {"0": "num_int", "0.00": "num_dec"}
+
+    def _row_cells(self, seq, normalized, x, y):
+        """返回一行的 [(值, 命名样式), ...]；normalized 为 normalize_texts 的结果，坐标已由标注表取整"""
+        return [(number_to_circle(seq), None),
+                (normalized.value, self.FORMAT_STYLES.get(normalized.number_format)),
+                (x, "coord"),
+                (y, "coord")]
+
+    def add_sheet(self, sheet_name, data):
+        """写入一张图纸的标注，返回实际使用的工作表名列表"""
+        data = AnnotationTable.coerce(data)
+        # 文字表中每种文字只规范化一次
+        normalized_strings = normalize_texts(data.strings)
+        titles = []
+        seq = 1
+        for part, start in enumerate(range(0, max(len(data), 1), self.max_data_rows), 1):
+            title = self._sheet_title(sheet_name, part)
+            ws = self._new_sheet(title)
+            titles.append(title)
+            end = start + self.max_data_rows
+            texts = [normalized_strings[i] for i in data.text_ids[start:end]]
+            rows = zip(texts, data.xs[start:end], data.ys[start:end])
+            if self.write_only:
+                from openpyxl.cell import WriteOnlyCell
+                ws.append(list(EXCEL_HEADER))
+                for normalized, x, y in rows:
+                    row = []
+                    for value, style in self._row_cells(seq, normalized, x, y):
+                        cell = WriteOnlyCell(ws, value=value)
+                        if style:
+                            cell.style = style
+                        row.append(cell)
+                    ws.append(row)
+                    seq += 1
+            else:
+                for col, header in enumerate(EXCEL_HEADER, 1):
+                    ws.cell(row=1, column=col, value=header)
+                for row_idx, (normalized, x, y) in enumerate(rows, 2):
+                    for col, (value, style) in enumerate(self._row_cells(seq, normalized, x, y), 1):
+                        cell = ws.cell(row=row_idx, column=col, value=value)
+                        if style:
+                            cell.style = style
+                    seq += 1
+
+        if len(titles) > 1:
+            log_msg(f"  工作表「{sheet_name}」超出Excel行数上限，已拆分为{len(titles)}个续表")
+        self.sheet_count += 1
+        if not self.write_only and self.checkpoint_every and self.sheet_count % self.checkpoint_every == 0:
+            self.save()
+            log_msg(f"  Excel检查点已保存（{self.sheet_count}张图纸）")
+        return titles
+
+    def save(self):
+        self.wb.save(self.path)
+
+    def close(self):
+        """保存并关闭工作簿（流式工作簿只能保存一次）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.save()
+        self.wb.close()
 
 def write_to_excel(sheet_name, data):
-    """写入Excel（保持原有逻辑）"""
+    """写入Excel：批处理中写入共用工作簿，否则直接更新磁盘上的Excel文件"""
+    if not EXCEL_ENABLED:
+        return
     try:
-        excel_full_path = os.path.join(WORK_DIR, EXCEL_NAME)
-        wb = openpyxl.load_workbook(excel_full_path)
-        
-        if sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            for row_idx in range(ws.max_row, 1, -1):
-                ws.delete_rows(row_idx)
+        if excel_writer is not None:
+            excel_writer.add_sheet(sheet_name, data)
         else:
-            ws = wb.create_sheet(sheet_name)
-        
-        ws["A1"] = "序号"
-        ws["B1"] = "标注内容"
-        ws["C1"] = "X"
-        ws["D1"] = "Y"
-
-        for idx, (txt, x, y) in enumerate(data, 2):
-            converted_txt = convert_to_numeric(txt)
-            ws.cell(row=idx, column=2, value=converted_txt)
-            
-            if isinstance(converted_txt, str):
-                cleaned_txt = converted_txt.replace('.', '').replace('-', '').replace(',', '').replace(' ', '')
-                if cleaned_txt.isdigit():
-                    ws.cell(row=idx, column=2).number_format = "0" if '.' not in converted_txt else "0.00"
-            
-            ws.cell(row=idx, column=3, value=round(float(x), 2)).number_format = "0.00"
-            ws.cell(row=idx, column=4, value=round(float(y), 2)).number_format = "0.00"
-            ws.cell(row=idx, column=1, value=number_to_circle(idx-1))
-        
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        
-        wb.save(excel_full_path)
-        wb.close()
+            writer = ExcelReportWriter(os.path.join(WORK_DIR, EXCEL_NAME), existing=True)
+            writer.add_sheet(sheet_name, data)
+            writer.close()
         log_msg(f"  Excel工作表「{sheet_name}」已更新")
     except Exception as e:
         raise Exception(f"写入Excel失败：{str(e)}")
 
-def add_labels_back(dwg_path, cad):
-    """回写序号到DWG（完全重写修复版本）"""
-    doc = None
+def make_point(x, y, z=0.0):
+    """构造COM所需的三维点（VT_ARRAY|VT_R8）；无pywin32的替身后端直接使用元组"""
+    if win32 is None:
+        return (x, y, z)
+    return win32.VARIANT(pythoncom.VT_ARRAY | pythoncom.VT_R8, (x, y, z))
+
+# 已打开文档的序号文字样式缓存（键为文档对象，关闭文档时清除）
+# 不用文档路径作键：另存为后 FullName 会变成输出路径，关闭时将无法清除旧条目
+_label_style_cache = {}
+
+def _doc_key(doc):
+    return id(doc)
+
+def get_label_text_style(doc):
+    """获取序号文字样式，同一文档只查找/创建一次"""
+    key = _doc_key(doc)
+    if key not in _label_style_cache:
+        # 同时保存文档对象，保证缓存期间 id 不会被其他对象复用
+        _label_style_cache[key] = (doc, create_special_text_style(doc))
+    return _label_style_cache[key][1]
+
+def prepare_label_context(doc, style):
+    """把序号图层、文字样式和颜色（CECOLOR=LABEL_COLOR）设为当前，之后 AddText 生成的文字自动继承
+
+    已有的序号图层可能是其他颜色，所以颜色不随层。
+    返回恢复用的 (原当前图层, 原当前文字样式, 原当前颜色)；设置失败返回 None。
+    """
+    previous = None
     try:
-        excel_full_path = os.path.join(WORK_DIR, EXCEL_NAME)
-        sheet_name = os.path.basename(dwg_path)[:-4]
-        
-        wb = openpyxl.load_workbook(excel_full_path)
-        if sheet_name not in wb.sheetnames:
-            wb.close()
-            raise Exception(f"Excel中不存在工作表「{sheet_name}」")
-        
-        ws = wb[sheet_name]
-        
-        # 确保CAD有活动文档
-        if not cad.ActiveDocument:
-            doc = cad.Documents.Add()
-        else:
-            doc = cad.ActiveDocument
-        
-        # 打开DWG文件
-        doc = cad.Documents.Open(dwg_path)
-        time.sleep(2)
-        
-        # 创建或使用文本样式
-        special_text_style = create_special_text_style(doc)
-        style_name = special_text_style.Name if special_text_style else "Standard"
-        
-        row = 2
-        write_count = 0
-        
-        # 预先创建插入点变量
-        insertion_point = None
-        
-        while True:
-            seq_txt = ws.cell(row=row, column=1).value
-            x_val = ws.cell(row=row, column=3).value
-            y_val = ws.cell(row=row, column=4).value
-            
-            if seq_txt is None or x_val is None or y_val is None:
-                break
-            
-            seq_txt = str(seq_txt).strip()
-            if not seq_txt:
-                row += 1
-                continue
-            
+        layers = doc.Layers
+        try:
+            layer = layers.Item(LABEL_LAYER)
+        except Exception:
+            layer = layers.Add(LABEL_LAYER)
+            layer.Color = LABEL_COLOR
+            log_msg(f"  创建了序号图层: {LABEL_LAYER}")
+        previous = (doc.ActiveLayer, doc.ActiveTextStyle, doc.GetVariable("CECOLOR"))
+        doc.ActiveLayer = layer
+        if style is not None:
+            doc.ActiveTextStyle = style
+        doc.SetVariable("CECOLOR", str(LABEL_COLOR))
+        return previous
+    except Exception as e:
+        log_msg(f"  设置序号图层/文字样式/颜色失败：{str(e)}，改为逐个设置文字属性")
+        restore_label_context(doc, previous)
+        return None
+
+def restore_label_context(doc, previous):
+    """恢复写入序号前的当前图层、文字样式和颜色"""
+    if previous is None:
+        return
+    try:
+        layer, style, color = previous
+        doc.ActiveLayer, doc.ActiveTextStyle = layer, style
+        doc.SetVariable("CECOLOR", color)
+    except Exception as e:
+        log_msg(f"  恢复当前图层/文字样式/颜色失败：{str(e)}")
+
+# ----- 增量回写 -----
+# 回写的序号是 LABEL_LAYER 图层上内容为 (n) 或 n 的单行文字，按此识别上次回写的序号
+LABEL_ENTITY_NAME = "AcDbText"
+_LABEL_TEXT_RE = re.compile(r"\((\d+)\)|(\d+)")
+
+# 提取时顺带找到的已有序号：{文档id: (文档, [(实体, 序号, X, Y), ...])}，回写时取出，关闭文档时清除
+_existing_label_cache = {}
+
+def label_number(txt):
+    """序号文字 "(12)" / "12" → 12，其他文字返回 None"""
+    match = _LABEL_TEXT_RE.fullmatch(txt.strip())
+    if match is None:
+        return None
+    return int(match.group(1) or match.group(2))
+
+def is_label_layer(layer_name):
+    return layer_name.strip().upper() == LABEL_LAYER.upper()
+
+def scan_existing_labels(doc):
+    """查找图中已有的序号 [(实体, 序号, X, Y), ...]：用选择集只取 LABEL_LAYER 图层上的文字，失败时遍历模型空间"""
+    selection_set = None
+    try:
+        selection_set = select_entities(doc, [0, 8, 410], ["TEXT", LABEL_LAYER, "Model"])
+    except Exception as e:
+        log_msg(f"  ⚠️  选择集查找已有序号失败，改为遍历模型空间：{str(e)}")
+    labels = []
+    try:
+        for entity in (selection_set if selection_set is not None else doc.ModelSpace):
             try:
-                x = round(float(x_val), 3)
-                y = round(float(y_val), 1)
-            except (ValueError, TypeError):
-                row += 1
+                if selection_set is None and (entity.EntityName != LABEL_ENTITY_NAME
+                                              or not is_label_layer(str(entity.Layer))):
+                    continue
+                seq = label_number(str(entity.TextString))
+                if seq is None:
+                    continue
+                pt = entity.InsertionPoint
+                labels.append((entity, seq, pt[0], pt[1]))
+            except Exception:
                 continue
-            
-            annotate_y = y + TEXT_OFFSET_Y
-            
-            # 创建插入点数组
-            insertion_point = win32.VARIANT(pythoncom.VT_ARRAY | pythoncom.VT_R8, (x, annotate_y, 0.0))
-            
+    finally:
+        if selection_set is not None:
             try:
-                # 首先尝试使用带括号的数字（确保显示正确）
-                bracket_text = f"({row-1})"
-                
-                # 添加文字
-                text_obj = doc.ModelSpace.AddText(bracket_text, insertion_point, TEXT_HEIGHT)
-                if text_obj:
-                    text_obj.StyleName = style_name
-                    text_obj.Color = 1  # 红色
-                    text_obj.Update()
-                    write_count += 1
-                    log_msg(f"  第{row}行序号写入成功: {bracket_text}")
-                else:
-                    raise Exception("AddText返回None")
-                    
-            except Exception as e:
-                log_msg(f"  第{row}行序号写入失败：{str(e)}")
-                # 备选方法：使用简单数字
-                try:
-                    backup_seq_txt = f"{row-1}"
-                    insertion_point = win32.VARIANT(pythoncom.VT_ARRAY | pythoncom.VT_R8, (x, annotate_y, 0.0))
-                    text_obj = doc.ModelSpace.AddText(backup_seq_txt, insertion_point, TEXT_HEIGHT)
-                    if text_obj:
-                        text_obj.StyleName = style_name
-                        text_obj.Color = 1
-                        text_obj.Update()
-                        write_count += 1
-                        log_msg(f"  第{row}行使用备选序号成功: {backup_seq_txt}")
-                except Exception as e2:
-                    log_msg(f"  备选方法也失败：{str(e2)}")
-            
-            row += 1
-        
-        # 刷新视图
+                selection_set.Delete()
+            except Exception:
+                pass
+    return labels
+
+def existing_labels(doc):
+    """图中已有的序号：提取时已完整遍历则直接使用登记结果，否则用选择集查找"""
+    cached = _existing_label_cache.pop(_doc_key(doc), None)
+    if cached is not None:
+        return cached[1]
+    return scan_existing_labels(doc)
+
+def diff_labels(existing, wanted):
+    """比对已有序号 [(实体, 序号, X, Y), ...] 与本次序号 [(序号, X, Y), ...]
+
+    返回 (保留数量, 修改 [(实体, 本次下标, 改号, 移动), ...], 新增下标列表, 删除实体列表)。
+    先保留序号与位置都相同的；其余依次复用位置相同的（只改号）、序号相同的（只移动）、
+    任意剩余的（改号并移动），仍不足的新增，多余的删除。位置按三位小数比较。
+    """
+    def position(x, y):
+        return round(float(x), 3), round(float(y), 3)
+
+    exact, by_position, by_number = {}, {}, {}
+    for j, (_, seq, x, y) in enumerate(existing):
+        exact.setdefault((seq, position(x, y)), []).append(j)
+        by_position.setdefault(position(x, y), []).append(j)
+        by_number.setdefault(seq, []).append(j)
+    used = [False] * len(existing)
+
+    def take(candidates):
+        while candidates:
+            j = candidates.pop()
+            if not used[j]:
+                used[j] = True
+                return j
+        return None
+
+    kept = 0
+    pending = []
+    for i, (seq, x, y) in enumerate(wanted):
+        if take(exact.get((seq, position(x, y)))) is not None:
+            kept += 1
+        else:
+            pending.append(i)
+
+    updates, unmatched = [], []
+    for i in pending:
+        seq, x, y = wanted[i]
+        j = take(by_position.get(position(x, y)))
+        if j is None:
+            j = take(by_number.get(seq))
+        if j is None:
+            unmatched.append(i)
+            continue
+        entity, old_seq, old_x, old_y = existing[j]
+        updates.append((entity, i, old_seq != seq, position(old_x, old_y) != position(x, y)))
+
+    spare = [j for j in range(len(existing)) if not used[j]]
+    spare.reverse()
+    adds = []
+    for i in unmatched:
+        j = take(spare)
+        if j is None:
+            adds.append(i)
+        else:
+            updates.append((existing[j][0], i, True, True))
+    deletes = [existing[j][0] for j in range(len(existing)) if not used[j]]
+    return kept, updates, adds, deletes
+
+def log_label_diff(existing, kept, updates, adds, deletes):
+    if existing:
+        log_msg(f"  已有序号{len(existing)}个：保留{kept}，修改{len(updates)}，新增{len(adds)}，删除{len(deletes)}")
+
+def label_anchor(x_val, y_val):
+    """序号文字的插入点：标注位置向上偏移 TEXT_OFFSET_Y"""
+    x = round(float(x_val), 3)
+    y = round(float(y_val), 1)
+    return x, y + TEXT_OFFSET_Y
+
+# ----- 序号避让 -----
+# 不读取CAD中的实体范围（每个实体一次COM调用），标注文字与序号的范围按字高估算
+# 半角字符宽度与字高之比（gbcbig.shx 等SHX字体约 0.7~0.8）
+LABEL_CHAR_WIDTH = 0.8
+
+def estimate_text_box(txt, x, y, height, anchor=ANCHOR_CENTER):
+    """估算标注文字范围：按标注位置在文字中的锚点放置（单行文字为左下角，多行文字为左上角，尺寸文字为中心）"""
+    width = max(len(txt), 1) * height * LABEL_CHAR_WIDTH
+    if anchor == ANCHOR_LOWER_LEFT:
+        return (x, y, x + width, y + height)
+    if anchor == ANCHOR_UPPER_LEFT:
+        return (x, y - height, x + width, y)
+    return (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+
+def label_candidate_offsets(width, height):
+    """序号插入点（左下角）相对标注位置的候选偏移，按优先顺序排列"""
+    if LABEL_CANDIDATE_OFFSETS:
+        return LABEL_CANDIDATE_OFFSETS
+    offsets = []
+    for ring in (1, 2, 3):
+        d = TEXT_OFFSET_Y * ring
+        up, down = d, -d - height
+        right, left, center = d, -d - width, -width / 2
+        offsets += [(0, up), (0, down), (right, -height / 2), (left, -height / 2),
+                    (right, up), (left, up), (right, down), (left, down), (center, up), (center, down)]
+    return offsets
+
+class LabelGrid:
+    """均匀网格空间索引：矩形登记到覆盖的网格中，查询只检查这些网格里的矩形"""
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def insert(self, box):
+        size = self.cell_size
+        x0, y0, x1, y1 = box
+        cells = self.cells
+        for i in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for j in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                cell = cells.get((i, j))
+                if cell is None:
+                    cells[(i, j)] = [box]
+                else:
+                    cell.append(box)
+
+    def intersects(self, box):
+        size = self.cell_size
+        x0, y0, x1, y1 = box
+        cells = self.cells
+        for i in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for j in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                for ox0, oy0, ox1, oy1 in cells.get((i, j), ()):
+                    if x0 < ox1 and ox0 < x1 and y0 < oy1 and oy0 < y1:
+                        return True
+        return False
+
+def place_labels(data):
+    """计算每个序号的插入点，返回与 data 等长的 [(x, y), ...]
+
+    先把全部标注文字的估算范围登记到网格索引，再按序号顺序为每个序号选择第一个
+    不与标注文字和已放置序号重叠的候选位置；没有空位时退回默认位置（标注上方）。
+    """
+    data = AnnotationTable.coerce(data)
+    points = [label_anchor(x, y) for x, y in zip(data.xs, data.ys)]
+    if not LABEL_AVOID_OVERLAP or not points:
+        return points
+
+    height = TEXT_HEIGHT
+    char_w = height * LABEL_CHAR_WIDTH
+    grid = LabelGrid(max(len(f"({len(data)})") * char_w, height) * 2)
+    strings = [str(txt) for txt in data.strings]
+    anchors = data.anchors if data.anchors is not None else bytes(len(points))
+    for text_id, point, anchor in zip(data.text_ids, points, anchors):
+        grid.insert(estimate_text_box(strings[text_id], point[0], point[1] - TEXT_OFFSET_Y, height, anchor))
+
+    placed = []
+    crowded = 0
+    offsets_by_width = {}
+    for seq, point in enumerate(points, 1):
+        x, y = point[0], point[1] - TEXT_OFFSET_Y
+        width = len(f"({seq})") * char_w
+        offsets = offsets_by_width.get(width)
+        if offsets is None:
+            offsets = offsets_by_width[width] = label_candidate_offsets(width, height)
+        for dx, dy in offsets:
+            box = (x + dx, y + dy, x + dx + width, y + dy + height)
+            if not grid.intersects(box):
+                break
+        else:
+            crowded += 1
+            box = (point[0], point[1], point[0] + width, point[1] + height)
+        grid.insert(box)
+        placed.append((round(box[0], 3), round(box[1], 3)))
+    if crowded:
+        log_msg(f"  ⚠️  {crowded}个序号周围没有空位，放在默认位置")
+    return placed
+
+def benchmark_label_placement(n=100000, spacing=10.0, seed=0):
+    """序号避让基准：n 个随机分布的标注（平均间距约 spacing 倍字高），返回耗时与被移开的序号数"""
+    global log_queue
+    rng = random.Random(seed)
+    side = math.sqrt(n) * spacing * TEXT_HEIGHT
+    data = AnnotationTable((str(rng.choice([20, 35.5, 120, "Φ12", "R5"])), rng.uniform(0, side),
+                            rng.uniform(0, side)) for _ in range(n))
+    saved_queue, log_queue = log_queue, None
+    try:
+        start = time.perf_counter()
+        placed = place_labels(data)
+        elapsed = time.perf_counter() - start
+    finally:
+        log_queue = saved_queue
+    moved = sum(1 for p, (_, x, y) in zip(placed, data) if p != label_anchor(x, y))
+    return {"labels": n, "seconds": round(elapsed, 3),
+            "labels_per_second": round(n / elapsed) if elapsed else None, "moved": moved}
+
+def write_labels(doc, data):
+    """把序号回写到已打开的文档中，data 与 extract_annotations 的返回值一致，返回写入后图中有效的序号数量
+
+    INCREMENTAL_LABELS 开启时先与图中已有序号比对，未变化的不产生COM调用，变化的原位修改文字/位置，
+    多余的删除，只有不足的才 AddText；全部未变化时不刷新视图。
+    """
+    wanted = [(seq, x, y) for seq, (x, y) in enumerate(place_labels(data), 1)]
+    existing = existing_labels(doc) if INCREMENTAL_LABELS else []
+    kept, updates, adds, deletes = diff_labels(existing, wanted)
+    log_label_diff(existing, kept, updates, adds, deletes)
+    write_count = kept
+
+    for entity, i, renumber, move in updates:
+        seq, x, y = wanted[i]
+        try:
+            if renumber:
+                entity.TextString = f"({seq})"
+            if move:
+                entity.InsertionPoint = make_point(x, y)
+            write_count += 1
+        except Exception as e:
+            log_msg(f"  ⚠️  第{seq}个序号修改失败：{str(e)}，改为新增")
+            deletes.append(entity)
+            adds.append(i)
+
+    for entity in deletes:
+        try:
+            entity.Delete()
+        except Exception as e:
+            log_msg(f"  ⚠️  删除多余序号失败：{str(e)}")
+
+    if adds:
+        write_count += add_label_texts(doc, [wanted[i] for i in sorted(adds)])
+
+    # 刷新视图（整批写入后只刷新一次）
+    if updates or adds or deletes:
         try:
             doc.Regen(True)
         except:
             pass
-        
-        # 保存文件
-        dwg_filename = os.path.basename(dwg_path)
-        new_dwg_path = os.path.join(WORK_DIR, dwg_filename)
-        try:
-            doc.SaveAs(new_dwg_path)
-            log_msg(f"  DWG文件已保存到: {new_dwg_path}")
-        except Exception as e:
-            raise Exception(f"  文档另存为失败：{str(e)}")
-        
+
+    return write_count
+
+def add_label_texts(doc, labels):
+    """新增序号文字 [(序号, X, Y), ...]，返回成功写入数量
+
+    图层、样式、颜色每个文档只设置一次，每个序号只需一次 AddText。
+    """
+    special_text_style = get_label_text_style(doc)
+    style_name = special_text_style.Name if special_text_style else "Standard"
+    previous = prepare_label_context(doc, special_text_style)
+    per_entity = previous is None
+
+    model_space = doc.ModelSpace
+    write_count = 0
+
+    try:
+        for seq, x, y in labels:
+            # 创建插入点数组
+            insertion_point = make_point(x, y)
+
+            # 首先尝试使用带括号的数字，失败时使用简单数字
+            for label_txt in (f"({seq})", f"{seq}"):
+                try:
+                    text_obj = model_space.AddText(label_txt, insertion_point, TEXT_HEIGHT)
+                    if not text_obj:
+                        raise Exception("AddText返回None")
+                    if per_entity:
+                        text_obj.Layer = LABEL_LAYER
+                        text_obj.StyleName = style_name
+                        text_obj.Color = LABEL_COLOR
+                    write_count += 1
+                    break
+                except Exception as e:
+                    log_msg(f"  ⚠️  第{seq}个序号「{label_txt}」写入失败：{str(e)}")
+    finally:
+        restore_label_context(doc, previous)
+
+    return write_count
+
+def save_dwg_to_work_dir(backend, doc, dwg_path):
+    """将文档另存到输出目录，返回新路径"""
+    dwg_filename = os.path.basename(dwg_path)
+    new_dwg_path = os.path.join(WORK_DIR, dwg_filename)
+    try:
+        backend.save_as(doc, new_dwg_path)
+        log_msg(f"  DWG文件已保存到: {new_dwg_path}")
+    except Exception as e:
+        raise Exception(f"  文档另存为失败：{str(e)}")
+    return new_dwg_path
+
+def read_annotations_from_excel(sheet_name):
+    """从Excel工作表读回 AnnotationTable（仅供单独回写使用），坐标无效的行跳过"""
+    import openpyxl
+    excel_full_path = os.path.join(WORK_DIR, EXCEL_NAME)
+    wb = openpyxl.load_workbook(excel_full_path, read_only=True)
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise Exception(f"Excel中不存在工作表「{sheet_name}」")
+        data = AnnotationTable()
+        for row_idx, (seq_txt, txt, x_val, y_val) in enumerate(
+                wb[sheet_name].iter_rows(min_row=2, max_col=4, values_only=True), 2):
+            if seq_txt is None or x_val is None or y_val is None:
+                break
+            try:
+                data.append(txt, x_val, y_val)
+            except (ValueError, TypeError):
+                log_msg(f"  ⚠️  工作表「{sheet_name}」第{row_idx}行坐标无效，跳过")
+        return data
+    finally:
         wb.close()
+
+def add_labels_back(dwg_path, cad, data=None):
+    """回写序号到DWG；未传入 data 时从Excel中读取（cad 可以是Application对象或 CADBackend）"""
+    backend = as_backend(cad)
+    doc = None
+    try:
+        if data is None:
+            sheet_name = os.path.basename(dwg_path)[:-4]
+            data = read_annotations_from_excel(sheet_name)
+
+        doc = backend.open(dwg_path)
+        write_count = backend.add_labels(doc, data)
+        save_dwg_to_work_dir(backend, doc, dwg_path)
+
         log_msg(f"  成功回写{write_count}个序号到DWG文件")
         return write_count
-        
+
     except Exception as e:
         raise Exception(f"回写{dwg_path}序号失败：{str(e)}")
     finally:
-        if doc:
-            try:
-                doc.Close(False)
-            except:
-                pass
+        if doc is not None:
+            backend.close(doc)
+
+def process_dwg(dwg_path, backend, sink=None, progress=None):
+    """单次打开完成整张图纸：提取 → 输出（sink，如写Excel）→ 回写 → 另存为
+
+    文档与标注列表在整个过程中保持在内存中，不再二次打开DWG或从Excel读回。
+    backend 为 CADBackend（传入ZwCAD Application对象时自动包装）。返回 (标注列表, 回写数量)。
+    各阶段耗时与数量记入 metrics；progress(完成比例, 阶段名) 在每个阶段开始时调用。
+    """
+    backend = as_backend(backend)
+    progress = progress or (lambda fraction, stage: None)
+    # 只统计这张图纸的COM调用（启动CAD等批次级调用不计入）
+    profiling = isinstance(backend, ZwCADComBackend) and isinstance(backend.cad, ComProxy)
+    if profiling:
+        com_profiler.reset()
+    doc = None
+    stats = {}
+    try:
+        try:
+            progress(0.0, "打开图纸")
+            with metrics.stage(dwg_path, "open"):
+                doc = backend.open(dwg_path)
+            progress(0.15, "提取标注")
+            with metrics.stage(dwg_path, "extract"):
+                raw = AnnotationTable(backend.iter_annotations(doc, stats))
+            with metrics.stage(dwg_path, "arrange"):
+                data = arrange_annotations(raw)
+            metrics.count(dwg_path, "entities", stats.get("entities", len(raw)))
+            metrics.count(dwg_path, "annotations", len(data))
+            log_msg(f"  提取到{len(data)}条有效标注")
+        except Exception as e:
+            raise Exception(f"提取{dwg_path}标注失败：{str(e)}")
+
+        if not data:
+            log_msg("  ⚠️  无有效标注，跳过回写")
+            return data, 0
+
+        if sink:
+            sink(data)
+
+        try:
+            progress(0.5, "回写序号")
+            with metrics.stage(dwg_path, "write_back"):
+                write_count = backend.add_labels(doc, data)
+            progress(0.9, "保存图纸")
+            with metrics.stage(dwg_path, "save"):
+                save_dwg_to_work_dir(backend, doc, dwg_path)
+        except Exception as e:
+            raise Exception(f"回写{dwg_path}序号失败：{str(e)}")
+
+        metrics.count(dwg_path, "labels", write_count)
+        log_msg(f"  成功回写{write_count}个序号到DWG文件")
+        return data, write_count
+    finally:
+        if doc is not None:
+            with metrics.stage(dwg_path, "close"):
+                backend.close(doc)
+        if profiling:
+            report_com_profile(dwg_path, stats.get("entities"))
 
 def open_output_folder():
-    """打开输出文件夹"""
+    """打开输出文件夹（无界面模式下只记录日志）"""
     try:
         if os.path.exists(WORK_DIR):
             os.startfile(WORK_DIR)
             log_msg(f"已打开输出文件夹: {WORK_DIR}")
-        else:
+        elif messagebox:
             messagebox.showwarning("警告", f"文件夹不存在: {WORK_DIR}")
+        else:
+            log_msg(f"⚠️  文件夹不存在: {WORK_DIR}")
     except Exception as e:
-        messagebox.showerror("错误", f"无法打开文件夹: {str(e)}")
+        if messagebox:
+            messagebox.showerror("错误", f"无法打开文件夹: {str(e)}")
+        else:
+            log_msg(f"⚠️  无法打开文件夹: {str(e)}")
+
+# ==========  标注整理（去重、序号阅读顺序）  ==========
+def arrange_annotations(data):
+    """提取后、编号前的整理：合并重复标注，再按阅读顺序排列，返回 AnnotationTable"""
+    data = AnnotationTable.coerce(data)
+    if DEDUP_ENABLED:
+        data, merged = dedupe_annotations(data)
+        if merged:
+            log_msg(f"  合并{len(merged)}条重复标注")
+            for dropped, kept in merged[:5]:
+                log_msg(f"    「{dropped[0]}」({dropped[1]}, {dropped[2]}) → ({kept[1]}, {kept[2]})")
+            if len(merged) > 5:
+                log_msg(f"    ……另有{len(merged) - 5}条")
+    return order_annotations(data)
+
+def dedupe_annotations(data, tolerance=None):
+    """合并规范化文字相同、位置相距不超过 tolerance 的标注，保留先出现的一条
+
+    按 (文字, 网格坐标) 做空间哈希，网格边长等于容差，每条标注只检查相邻 3×3 个网格，线性时间。
+    文字表中每种文字只规范化一次。返回 (保留的标注表, [(被合并的标注, 保留的标注), ...])。
+    """
+    data = AnnotationTable.coerce(data)
+    tolerance = DEDUP_TOLERANCE if tolerance is None else tolerance
+    cell = max(tolerance, 1e-9)
+    # 规范化后相同的文字共用一个编号
+    canonical = {}
+    text_keys = [canonical.setdefault(normalize_annotation_text(txt).value if isinstance(txt, str) else txt,
+                                      len(canonical)) for txt in data.strings]
+    xs, ys = data.xs, data.ys
+    buckets = {}
+    kept = []
+    merged = []
+    for index, text_id in enumerate(data.text_ids):
+        text, x, y = text_keys[text_id], xs[index], ys[index]
+        cx, cy = math.floor(x / cell), math.floor(y / cell)
+        duplicate = None
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for other in buckets.get((text, i, j), ()):
+                    if abs(xs[other] - x) <= tolerance and abs(ys[other] - y) <= tolerance:
+                        duplicate = other
+                        break
+                if duplicate is not None:
+                    break
+            if duplicate is not None:
+                break
+        if duplicate is not None:
+            merged.append((data[index], data[duplicate]))
+            continue
+        buckets.setdefault((text, cx, cy), []).append(index)
+        kept.append(index)
+    return (data if len(kept) == len(data) else data.take(kept)), merged
+
+def order_annotations(data):
+    """按 SEQUENCE_ZONES / SEQUENCE_ORDER 排列标注，Excel 与回写的序号都使用这一顺序
+
+    排序只在坐标列上对行号进行，最后用 take() 一次重排整张表。
+    """
+    data = AnnotationTable.coerce(data)
+    if SEQUENCE_ORDER == "extraction" or len(data) < 2:
+        return data
+    if SEQUENCE_ORDER not in ("rows", "path"):
+        raise ValueError(f"未知的序号顺序：{SEQUENCE_ORDER}")
+    arrange = _order_rows if SEQUENCE_ORDER == "rows" else _order_path
+    xs, ys = data.xs, data.ys
+    if not SEQUENCE_ZONES:
+        return data.take(arrange(xs, ys, range(len(data))))
+
+    groups = [[] for _ in range(len(SEQUENCE_ZONES) + 1)]
+    for index, point in enumerate(zip(xs, ys)):
+        for zone_index, window in enumerate(SEQUENCE_ZONES):
+            if _in_window(point[0], point[1], window):
+                break
+        else:
+            zone_index = len(SEQUENCE_ZONES)
+        groups[zone_index].append(index)
+    order = []
+    for group in groups:
+        order.extend(arrange(xs, ys, group) if len(group) > 1 else group)
+    return data.take(order)
+
+def _order_rows(xs, ys, indices):
+    """从上到下分行、行内从左到右：按Y降序扫描，与本行首个标注的Y差超过行高时另起一行"""
+    band = SEQUENCE_ROW_BAND if SEQUENCE_ROW_BAND is not None else 4 * TEXT_HEIGHT
+    by_y = sorted(indices, key=lambda i: (-ys[i], xs[i]))
+    ordered = []
+    row = []
+    row_top = None
+    for i in by_y:
+        if row and row_top - ys[i] > band:
+            row.sort(key=xs.__getitem__)
+            ordered.extend(row)
+            row = []
+        if not row:
+            row_top = ys[i]
+        row.append(i)
+    row.sort(key=xs.__getitem__)
+    ordered.extend(row)
+    return ordered
+
+class _PointGrid:
+    """最近邻查询用的均匀网格（支持删除）；剩余点数减少到建表时的 1/4 时按新密度重建"""
+    def __init__(self, points, indices):
+        self.points = points
+        xs = [points[i][0] for i in indices]
+        ys = [points[i][1] for i in indices]
+        # 按较大的坐标跨度估算边长（均匀分布时平均每个网格约 2 个点）；不用两轴跨度之积，
+        # 共线或只剩一个点时也不会得到极小的网格；不小于坐标精度
+        span = max(max(xs) - min(xs), max(ys) - min(ys))
+        self.cell = max(span / math.sqrt(len(indices) / 2), 10 ** -COORD_DECIMALS)
+        self.cells = {}
+        for i in indices:
+            x, y = points[i]
+            self.cells.setdefault((math.floor(x / self.cell), math.floor(y / self.cell)), set()).add(i)
+        self.size = self.built_size = len(indices)
+        self.span = (math.floor(min(xs) / self.cell), math.floor(max(xs) / self.cell),
+                     math.floor(min(ys) / self.cell), math.floor(max(ys) / self.cell))
+
+    def remove(self, i):
+        x, y = self.points[i]
+        key = (math.floor(x / self.cell), math.floor(y / self.cell))
+        cell = self.cells[key]
+        cell.discard(i)
+        if not cell:
+            del self.cells[key]
+        self.size -= 1
+
+    def remaining(self):
+        return [i for cell in self.cells.values() for i in cell]
+
+    def nearest(self, x, y):
+        """返回离 (x, y) 最近的剩余点；逐圈向外搜索，已找到的距离不超过圈半径时停止
+
+        只检查落在点集范围内的网格，查询点远在范围之外时从范围边缘所在的圈开始。
+        """
+        cell = self.cell
+        cx, cy = math.floor(x / cell), math.floor(y / cell)
+        x_lo, x_hi, y_lo, y_hi = self.span
+        first_ring = max(0, x_lo - cx, cx - x_hi, y_lo - cy, cy - y_hi)
+        max_ring = max(cx - x_lo, x_hi - cx, cy - y_lo, y_hi - cy)
+        best, best_d = None, float("inf")
+        points, cells = self.points, self.cells
+        for ring in range(first_ring, max_ring + 1):
+            if best is not None and best_d <= (ring - 1) * cell:
+                break
+            j_lo, j_hi = max(cy - ring, y_lo), min(cy + ring, y_hi)
+            for i in range(max(cx - ring, x_lo), min(cx + ring, x_hi) + 1):
+                if i == cx - ring or i == cx + ring:
+                    column = range(j_lo, j_hi + 1)
+                else:
+                    column = [j for j in (cy - ring, cy + ring) if y_lo <= j <= y_hi]
+                for j in column:
+                    for k in cells.get((i, j), ()):
+                        d = math.hypot(points[k][0] - x, points[k][1] - y)
+                        if d < best_d or (d == best_d and k < best):
+                            best, best_d = k, d
+        return best
+
+def _order_path(xs, ys, indices):
+    """从左上角的标注出发，每次走到最近的未编号标注（网格最近邻，近似 O(n log n)）"""
+    indices = list(indices)
+    if len(indices) < 2:
+        return indices
+    points = [(xs[i], ys[i]) for i in indices]
+    current = min(range(len(points)), key=lambda i: (points[i][0] - points[i][1], -points[i][1]))
+    grid = _PointGrid(points, [i for i in range(len(points)) if i != current])
+    order = [current]
+    while grid.size:
+        if grid.size == 1:
+            order.extend(grid.remaining())
+            break
+        if grid.size * 4 < grid.built_size and grid.size > 16:
+            grid = _PointGrid(points, grid.remaining())
+        current = grid.nearest(*points[current])
+        grid.remove(current)
+        order.append(current)
+    return [indices[i] for i in order]
+
+# ==========  CAD后端（ZwCAD COM / 离线DXF，DXF实现见 cad_backends.py）  ==========
+class CADBackend:
+    """CAD后端接口：打开文档、遍历标注、写入序号、另存为、关闭"""
+    name = ""
+
+    def open(self, path):
+        raise NotImplementedError
+
+    def iter_annotations(self, doc, stats=None):
+        """逐条产出 (标注内容, X, Y)，坐标保留两位小数；传入 stats 时累计扫描的实体数 stats["entities"]"""
+        raise NotImplementedError
+
+    def add_labels(self, doc, data):
+        """按 data 顺序写入序号，返回成功写入数量"""
+        raise NotImplementedError
+
+    def save_as(self, doc, path):
+        raise NotImplementedError
+
+    def close(self, doc):
+        pass
+
+    def quit(self):
+        pass
+
+class ZwCADComBackend(CADBackend):
+    """通过 win32com 驱动 ZwCAD（原有实现）"""
+    name = "zwcad"
+
+    def __init__(self, cad):
+        self.cad = cad
+
+    def open(self, path):
+        return open_dwg(self.cad, path)
+
+    def iter_annotations(self, doc, stats=None):
+        return iter_annotations(doc, stats)
+
+    def add_labels(self, doc, data):
+        return write_labels(doc, data)
+
+    def save_as(self, doc, path):
+        doc.SaveAs(path)
 
-# ==========  全局变量（用于日志队列传递）  ==========
+    def close(self, doc):
+        close_dwg(doc)
+
+    def quit(self):
+        self.cad.Quit()
+
+def as_backend(obj):
+    """CADBackend 原样返回；ZwCAD Application 对象包装为 ZwCADComBackend"""
+    return obj if isinstance(obj, CADBackend) else ZwCADComBackend(obj)
+
+def uses_dxf_backend(path):
+    """按 CAD_BACKEND 配置判断该文件是否走离线DXF后端"""
+    if CAD_BACKEND == "dxf":
+        return True
+    return CAD_BACKEND == "auto" and path.lower().endswith(".dxf")
+
+def backend_for_file(path, default_backend):
+    """DXF文件返回离线后端，其余使用 default_backend（CAD对象或后端）"""
+    if not uses_dxf_backend(path):
+        return default_backend
+    from cad_backends import DxfBackend
+    return DxfBackend()
+
+# ==========  模拟CAD（无CAD环境下测试/压测，实现见 cad_simulator.py）  ==========
+def start_simulated_cad(profile=None):
+    """创建模拟CAD并等待其“启动完成”（用于 SIMULATE_CAD 模式）"""
+    from cad_simulator import SimulatedCADApplication, SimulationProfile
+    cad = SimulatedCADApplication(profile or SimulationProfile(**SIMULATION_PROFILE))
+    waited = wait_cad_ready(cad)
+    log_msg(f"模拟CAD已就绪（等待{waited:.2f}秒）")
+    return cad
+
+def benchmark_simulated_batch(n_files=20, profile=None, n_dimensions=200, n_texts=100, n_other=2000,
+                              n_block_refs=0):
+    """用模拟CAD跑一遍完整的单次打开流程（含Excel），返回吞吐统计"""
+    global WORK_DIR, excel_writer
+    from cad_simulator import (SimulatedCADApplication, SimulationProfile, generate_synthetic_drawing,
+                               save_synthetic_drawing, synthetic_block_definitions)
+    profile = profile or SimulationProfile(latency=0.0002)
+    saved_work_dir = WORK_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        os.makedirs(input_dir)
+        dwg_files = []
+        for i in range(n_files):
+            path = os.path.join(input_dir, f"sim_{i:04d}.dwg")
+            save_synthetic_drawing(path, generate_synthetic_drawing(n_dimensions, n_texts, n_other, seed=i,
+                                                                    n_block_refs=n_block_refs),
+                                   synthetic_block_definitions() if n_block_refs else None)
+            dwg_files.append(path)
+
+        WORK_DIR = os.path.join(tmp, "output")
+        os.makedirs(WORK_DIR)
+        cad = SimulatedCADApplication(profile)
+        writer = ExcelReportWriter(os.path.join(WORK_DIR, EXCEL_NAME))
+        annotations = labels = failures = 0
+        start = time.perf_counter()
+        try:
+            for dwg in dwg_files:
+                sheet_name = os.path.basename(dwg)[:-4]
+                try:
+                    data, write_count = process_dwg(dwg, cad, sink=lambda d, name=sheet_name: writer.add_sheet(name, d))
+                    annotations += len(data)
+                    labels += write_count
+                except Exception:
+                    failures += 1
+            writer.close()
+        finally:
+            WORK_DIR = saved_work_dir
+        elapsed = time.perf_counter() - start
+
+    return {"files": n_files, "failures": failures, "seconds": round(elapsed, 3),
+            "files_per_second": round(n_files / elapsed, 2) if elapsed else None,
+            "annotations": annotations, "labels": labels,
+            "com_calls": cad.call_count, "busy_rejections": cad._core.rejected}
+
+# ==========  结果缓存与断点续跑  ==========
+# 缓存格式版本，提取/回写逻辑变化导致旧缓存失效时递增
+CACHE_FORMAT_VERSION = 3
+# 影响提取与回写结果的配置项，任何一项变化都会使缓存失效
+CACHE_SETTING_NAMES = (
+    "TEXT_HEIGHT", "TEXT_OFFSET_Y", "SUPPORT_FONT", "USE_BRACKET_NUMBERS", "LABEL_LAYER", "LABEL_COLOR",
+    "LABEL_AVOID_OVERLAP", "LABEL_CANDIDATE_OFFSETS", "INCREMENTAL_LABELS",
+    "EXTRACT_LAYERS", "EXTRACT_WINDOW", "EXTRACT_BLOCKS", "CAD_BACKEND", "SIMULATE_CAD",
+    "SEQUENCE_ORDER", "SEQUENCE_ROW_BAND", "SEQUENCE_ZONES", "DEDUP_ENABLED", "DEDUP_TOLERANCE",
+)
+
+def get_cache_dir():
+    return CACHE_DIR or os.path.join(WORK_DIR, ".cache")
+
+def settings_fingerprint():
+    """参与缓存键计算的配置摘要"""
+    settings = {name: globals()[name] for name in CACHE_SETTING_NAMES}
+    settings["version"] = CACHE_FORMAT_VERSION
+    payload = json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_json_atomic(path, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class AnnotationCache:
+    """以图纸内容哈希 + 配置摘要为键，保存提取到的标注、回写数量和回写后的图纸副本"""
+    def __init__(self, root):
+        self.root = root
+        self.fingerprint = settings_fingerprint()
+        os.makedirs(os.path.join(root, "entries"), exist_ok=True)
+
+    def key_for(self, dwg_path):
+        return hashlib.sha256((file_sha256(dwg_path) + self.fingerprint).encode("ascii")).hexdigest()
+
+    def _entry_path(self, key, suffix=".json"):
+        return os.path.join(self.root, "entries", key[:2], key + suffix)
+
+    def load(self, key):
+        """返回缓存条目；不存在或回写后的图纸副本丢失时返回 None"""
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("output") and not os.path.exists(self._entry_path(key, entry["output"])):
+            return None
+        entry["annotations"] = AnnotationTable(entry["annotations"])
+        return entry
+
+    def store(self, key, dwg_path, data, write_count):
+        """记录处理结果，并把输出目录中回写后的图纸复制进缓存"""
+        os.makedirs(os.path.dirname(self._entry_path(key)), exist_ok=True)
+        output_suffix = None
+        output_path = os.path.join(WORK_DIR, os.path.basename(dwg_path))
+        if write_count > 0 and os.path.exists(output_path):
+            output_suffix = os.path.splitext(dwg_path)[1].lower() or ".dwg"
+            shutil.copyfile(output_path, self._entry_path(key, output_suffix))
+        _write_json_atomic(self._entry_path(key), {
+            "source": os.path.basename(dwg_path), "annotations": [list(item) for item in data],
+            "write_count": write_count, "output": output_suffix, "created": time.time()})
+
+    def restore_output(self, key, entry, dwg_path):
+        """把缓存的回写结果复制回输出目录"""
+        if entry.get("output"):
+            shutil.copyfile(self._entry_path(key, entry["output"]),
+                            os.path.join(WORK_DIR, os.path.basename(dwg_path)))
+
+class BatchJournal:
+    """批次日志：逐个记录已完成的图纸，中断后以同一批文件重新运行时从未完成处继续"""
+    def __init__(self, path, dwg_files):
+        self.path = path
+        self.files = [os.path.abspath(p) for p in dwg_files]
+        self.entries = {}
+        self.resumed = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if sorted(saved.get("files", [])) == sorted(self.files):
+                self.entries = saved.get("entries", {})
+                self.resumed = True
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def done_count(self):
+        return sum(1 for e in self.entries.values() if e.get("status") == "done")
+
+    def done_key(self, dwg_path):
+        """已完成且文件未被修改时返回其缓存键"""
+        entry = self.entries.get(os.path.abspath(dwg_path))
+        if not entry or entry.get("status") != "done":
+            return None
+        try:
+            if self._stat(dwg_path) != entry.get("stat"):
+                return None
+        except OSError:
+            return None
+        return entry.get("key")
+
+    def record(self, dwg_path, key, status):
+        try:
+            stat = self._stat(dwg_path)
+        except OSError:
+            stat = None
+        self.entries[os.path.abspath(dwg_path)] = {"key": key, "status": status, "stat": stat}
+        _write_json_atomic(self.path, {"files": self.files, "entries": self.entries, "updated": time.time()})
+
+    def finish(self):
+        """整批完成后删除日志"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def open_cache_and_journal(dwg_files):
+    """按配置创建缓存和批次日志，未启用缓存时返回 (None, None)"""
+    if not CACHE_ENABLED:
+        return None, None
+    cache = AnnotationCache(get_cache_dir())
+    journal = BatchJournal(os.path.join(cache.root, "journal.json"), dwg_files)
+    if journal.resumed:
+        log_msg(f"检测到上次未完成的批次（已完成 {journal.done_count()}/{len(dwg_files)}），从未完成的图纸继续")
+    return cache, journal
+
+def plan_cached_batch(dwg_files, cache, journal):
+    """计算每个文件的缓存键并查找命中，返回 (缓存键列表, {序号: 缓存条目})"""
+    keys, hits = [], {}
+    for i, dwg in enumerate(dwg_files):
+        key = journal.done_key(dwg) if journal else None
+        if key is None:
+            try:
+                key = cache.key_for(dwg)
+            except OSError:
+                key = None  # 文件不可读，留给正常流程报错
+        keys.append(key)
+        entry = cache.load(key) if key else None
+        if entry is not None:
+            hits[i] = entry
+    if hits:
+        log_msg(f"缓存命中 {len(hits)}/{len(dwg_files)} 个未变化的图纸，将直接复用结果")
+    return keys, hits
+
+def restore_cached_result(cache, journal, key, entry, dwg_path, write_excel=True):
+    """复用缓存：恢复回写后的图纸并（可选）写入Excel，返回回写数量"""
+    data = entry["annotations"]
+    cache.restore_output(key, entry, dwg_path)
+    if write_excel and data:
+        write_to_excel(os.path.basename(dwg_path)[:-4], data)
+    journal.record(dwg_path, key, "done")
+    log_msg(f"  ♻️  {os.path.basename(dwg_path)} 未变化，复用缓存结果（{len(data)}条标注）")
+    return entry["write_count"]
+
+def remember_result(cache, journal, key, dwg_path, data, write_count, error=None):
+    """把新处理的结果写入缓存和批次日志（失败的图纸下次重新处理）"""
+    if cache is None or key is None:
+        return
+    try:
+        if error is None:
+            cache.store(key, dwg_path, data, write_count)
+        journal.record(dwg_path, key, "failed" if error else "done")
+    except Exception as e:
+        log_msg(f"  ⚠️  缓存写入失败：{str(e)}")
+
+# ==========  标注数据库（SQLite）  ==========
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drawings (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    sheet TEXT NOT NULL,
+    annotations INTEGER NOT NULL,
+    labels INTEGER NOT NULL,
+    processed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    drawing_id INTEGER NOT NULL REFERENCES drawings(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    raw_text TEXT NOT NULL,
+    value TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    PRIMARY KEY (drawing_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_annotations_value ON annotations(value, drawing_id);
+CREATE INDEX IF NOT EXISTS idx_annotations_kind ON annotations(kind);
+CREATE INDEX IF NOT EXISTS idx_annotations_xy ON annotations(x, y);
+"""
+
+def get_store_path():
+    return STORE_PATH or os.path.join(WORK_DIR, "store", "annotations.sqlite")
+
+class AnnotationStore:
+    """标注数据库：每张图纸一行（按路径唯一），标注按序号保存原文、规范化值、分类与坐标
+
+    同一图纸重新处理时整体替换；每张图纸的写入在一个事务中批量完成。
+    批处理中由输出阶段线程与主线程共用，内部加锁。
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(STORE_SCHEMA)
+
+    def record(self, dwg_path, data, write_count):
+        """写入一张图纸的全部标注（data 的顺序即序号顺序）"""
+        dwg_path = os.path.abspath(dwg_path)
+        data = AnnotationTable.coerce(data)
+        normalized_strings = normalize_texts(data.strings)
+        rows = [(seq, data.strings[text_id], normalized_strings[text_id].value, normalized_strings[text_id].kind, x, y)
+                for seq, (text_id, x, y) in enumerate(zip(data.text_ids, data.xs, data.ys), 1)]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO drawings (path, sheet, annotations, labels, processed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET sheet = excluded.sheet, annotations = excluded.annotations, "
+                "labels = excluded.labels, processed_at = excluded.processed_at",
+                (dwg_path, os.path.basename(dwg_path)[:-4], len(data), write_count,
+                 time.strftime("%Y-%m-%d %H:%M:%S")))
+            drawing_id = self.conn.execute("SELECT id FROM drawings WHERE path = ?", (dwg_path,)).fetchone()[0]
+            self.conn.execute("DELETE FROM annotations WHERE drawing_id = ?", (drawing_id,))
+            self.conn.executemany(
+                "INSERT INTO annotations (drawing_id, seq, raw_text, value, kind, x, y) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(drawing_id,) + row for row in rows])
+
+    def find_drawings(self, text):
+        """包含某个标注值的图纸：[(图纸路径, 出现次数), ...]；查询值先按同样规则规范化（%%c20 与 Φ20 等价）"""
+        value = normalize_annotation_text(text).value
+        with self.lock:
+            return self.conn.execute(
+                "SELECT d.path, COUNT(*) FROM annotations a JOIN drawings d ON d.id = a.drawing_id "
+                "WHERE a.value = ? GROUP BY d.id ORDER BY d.path", (value,)).fetchall()
+
+    def drawings(self):
+        with self.lock:
+            return self.conn.execute("SELECT path, sheet FROM drawings ORDER BY path").fetchall()
+
+    def annotations(self, dwg_path):
+        """按序号返回一张图纸的标注（AnnotationTable）"""
+        with self.lock:
+            return AnnotationTable(self.conn.execute(
+                "SELECT a.raw_text, a.x, a.y FROM annotations a JOIN drawings d ON d.id = a.drawing_id "
+                "WHERE d.path = ? ORDER BY a.seq", (os.path.abspath(dwg_path),)))
+
+    def export_excel(self, excel_path, paths=None):
+        """由数据库生成Excel报表（每张图纸一个工作表），返回工作表数量"""
+        writer = ExcelReportWriter(excel_path)
+        count = 0
+        for path, sheet in self.drawings():
+            if paths is not None and os.path.abspath(path) not in paths:
+                continue
+            writer.add_sheet(sheet, self.annotations(path))
+            count += 1
+        writer.close()
+        return count
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_annotation_store():
+    """按配置打开标注数据库，未启用或打开失败时返回 None"""
+    if not STORE_ENABLED:
+        return None
+    try:
+        return AnnotationStore(get_store_path())
+    except (sqlite3.Error, OSError) as e:
+        log_msg(f"⚠️  标注数据库不可用，本次不记录：{str(e)}")
+        return None
+
+def remember_in_store(store, dwg_path, data, write_count):
+    if store is None or not data:
+        return
+    try:
+        store.record(dwg_path, data, write_count)
+    except sqlite3.Error as e:
+        log_msg(f"  ⚠️  标注数据库写入失败：{str(e)}")
+
+# ==========  日志  ==========
+# 日志目标：log_queue 接收 ("LOG", (级别, 文字))（界面的 LogBuffer、控制台或工作进程转发），
+# 另有可选的日志文件，由 QueueListener 在后台线程中写入，不阻塞处理线程
 log_queue = None
+logger = logging.getLogger("seqno")
+logger.propagate = False
+_file_log_listener = None
+
+def _infer_level(msg):
+    """未指定级别时按日志前缀的符号判断"""
+    if "❌" in msg:
+        return logging.ERROR
+    if "⚠️" in msg:
+        return logging.WARNING
+    return logging.INFO
+
+def _min_log_level():
+    level = logging.getLevelName(str(LOG_LEVEL).upper())
+    return level if isinstance(level, int) else logging.INFO
 
-def log_msg(msg):
-    """写入日志到队列（线程安全）"""
+def log_msg(msg, level=None):
+    """记录一条日志（线程安全）；level 为 logging 的级别，省略时按 ❌/⚠️ 前缀判断"""
+    if level is None:
+        level = _infer_level(msg)
+    if level < _min_log_level():
+        return
+    if _file_log_listener is not None:
+        logger.log(level, msg)
     if log_queue and not log_queue.full():
-        log_queue.put(("LOG", msg))
+        log_queue.put(("LOG", (level, msg)))
+
+def start_file_logging():
+    """开始把日志写入滚动日志文件（LOG_FILE 为 False 时不写），返回文件路径"""
+    global _file_log_listener
+    stop_file_logging()
+    if LOG_FILE is False:
+        return None
+    path = LOG_FILE or os.path.join(WORK_DIR, "logs", "seqno.log")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES,
+                                                   backupCount=LOG_FILE_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(message)s"))
+    records = queue.Queue()
+    logger.handlers = [logging.handlers.QueueHandler(records)]
+    logger.setLevel(logging.DEBUG)
+    _file_log_listener = logging.handlers.QueueListener(records, handler)
+    _file_log_listener.start()
+    return path
+
+def stop_file_logging():
+    """写完队列中剩余的日志并关闭日志文件"""
+    global _file_log_listener
+    if _file_log_listener is None:
+        return
+    listener, _file_log_listener = _file_log_listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    logger.handlers = []
+
+class LogBuffer:
+    """界面日志的环形缓冲：超出容量时丢弃最旧的普通日志，错误日志永不丢弃
+
+    全部日志按时间顺序存放在一个队列中，条目为 [级别, 文字, 已丢弃]；普通日志另登记在
+    droppable 中，超出容量时把其中最旧的一条标记为已丢弃（错误日志不登记，所以不会被丢弃），
+    已丢弃的条目在 drain 或队列压缩时移除。
+    处理线程 put，界面每次定时器回调 drain 一批，丢弃的条数以一条提示代替。
+    """
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.items = deque()
+        self.droppable = deque()
+        self.live = 0
+        self.dropped = 0
+
+    def full(self):
+        return False
+
+    def put(self, item):
+        msg_type, content = item
+        record = [content[0], content[1], False]
+        with self.lock:
+            self.items.append(record)
+            self.live += 1
+            if record[0] < logging.ERROR:
+                self.droppable.append(record)
+            if self.live > self.capacity and self.droppable:
+                self.droppable.popleft()[2] = True
+                self.live -= 1
+                self.dropped += 1
+                # 已丢弃的条目超过一半时压缩队列，界面长时间不取日志时内存也有上限
+                if len(self.items) > 2 * max(self.live, self.capacity):
+                    self.items = deque(r for r in self.items if not r[2])
+
+    def drain(self, limit):
+        """取出最多 limit 条 (级别, 文字)，按时间顺序"""
+        with self.lock:
+            batch = []
+            if self.dropped:
+                batch.append((logging.WARNING, f"⚠️  日志过多，界面省略了{self.dropped}条（完整内容见日志文件）"))
+                self.dropped = 0
+            while self.items and len(batch) < limit:
+                level, text, dropped = self.items.popleft()
+                if dropped:
+                    continue
+                self.live -= 1
+                if level < logging.ERROR:
+                    # 未丢弃的普通日志按时间顺序取出，正是 droppable 中最旧的一条
+                    self.droppable.popleft()
+                batch.append((level, text))
+            return batch
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.droppable.clear()
+            self.live = 0
+            self.dropped = 0
+
+# ==========  计时与吞吐统计  ==========
+# 每张图纸的阶段耗时（秒；ready_wait 为 open 中等待文档就绪的部分），计数项为扫描实体、有效标注、回写序号的数量
+METRIC_STAGES = ("open", "ready_wait", "extract", "arrange", "excel", "write_back", "save", "close")
+METRIC_COUNTS = ("entities", "annotations", "labels")
+
+def _empty_metrics():
+    return {"timings": {}, "counts": {}}
+
+def _round_metrics(values, digits):
+    return {"timings": {name: round(value, digits) for name, value in values["timings"].items()},
+            "counts": dict(values["counts"])}
+
+class BatchMetrics:
+    """批次统计：耗时（秒，timings）与数量（counts）分开记录，按图纸或批次级（如CAD启动、重试次数）累计；线程安全"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.drawings = {}
+            self.batch = _empty_metrics()
+            self.started = time.perf_counter()
+
+    def _accumulate(self, dwg_path, kind, name, value):
+        with self.lock:
+            target = self.batch if dwg_path is None else self.drawings.setdefault(dwg_path, _empty_metrics())
+            target = target[kind]
+            target[name] = target.get(name, 0) + value
+
+    def add(self, dwg_path, name, seconds):
+        """累加一项耗时（秒）；dwg_path 为 None 时记为批次级"""
+        self._accumulate(dwg_path, "timings", name, seconds)
+
+    def count(self, dwg_path, name, n=1):
+        """累加一项数量；dwg_path 为 None 时记为批次级"""
+        self._accumulate(dwg_path, "counts", name, n)
+
+    @contextmanager
+    def stage(self, dwg_path, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(dwg_path, name, time.perf_counter() - start)
+
+    def merge(self, dwg_path, values):
+        """并入工作进程上报的统计 {"timings": {...}, "counts": {...}}"""
+        for name, value in values.get("timings", {}).items():
+            self.add(dwg_path, name, value)
+        for name, value in values.get("counts", {}).items():
+            self.count(dwg_path, name, value)
+
+    def pop(self, dwg_path):
+        with self.lock:
+            return self.drawings.pop(dwg_path, None) or _empty_metrics()
+
+    def get(self, dwg_path):
+        with self.lock:
+            values = self.drawings.get(dwg_path) or _empty_metrics()
+            return {"timings": dict(values["timings"]), "counts": dict(values["counts"])}
+
+    def report(self):
+        """汇总：批次耗时、各阶段耗时与数量合计、每秒扫描实体/提取标注/回写序号数量，以及每张图纸的明细"""
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            drawings = {path: {"timings": dict(values["timings"]), "counts": dict(values["counts"])}
+                        for path, values in self.drawings.items()}
+            batch = {"timings": dict(self.batch["timings"]), "counts": dict(self.batch["counts"])}
+        totals = {"timings": {name: sum(values["timings"].get(name, 0) for values in drawings.values())
+                              for name in METRIC_STAGES},
+                  "counts": {name: sum(values["counts"].get(name, 0) for values in drawings.values())
+                             for name in METRIC_COUNTS}}
+        throughput = {f"{name}_per_second": round(totals["counts"][name] / elapsed, 1) if elapsed else None
+                      for name in METRIC_COUNTS}
+        return {"elapsed": round(elapsed, 3),
+                "batch": _round_metrics(batch, 3),
+                "totals": _round_metrics(totals, 3),
+                "throughput": throughput,
+                "drawings": {path: _round_metrics(values, 4) for path, values in drawings.items()}}
+
+    def export(self, directory):
+        """导出 metrics.json（完整汇总）与 metrics.csv（每张图纸一行），返回两个文件路径"""
+        report = self.report()
+        json_path = os.path.join(directory, "metrics.json")
+        csv_path = os.path.join(directory, "metrics.csv")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("file",) + METRIC_STAGES + METRIC_COUNTS)
+            for path, values in report["drawings"].items():
+                writer.writerow([path] + [values["timings"].get(name, 0) for name in METRIC_STAGES]
+                                + [values["counts"].get(name, 0) for name in METRIC_COUNTS])
+        return json_path, csv_path
+
+metrics = BatchMetrics()
+
+def format_eta(done, total, elapsed):
+    """按已完成比例外推剩余时间，返回「预计剩余 分:秒」（尚无数据时返回空字符串）"""
+    if done <= 0 or done >= total:
+        return ""
+    remaining = int(elapsed * (total - done) / done)
+    return f"（预计剩余 {remaining // 60}:{remaining % 60:02d}）"
 
 # ==========  后台处理线程  ==========
-def run_process_async(dwg_files, log_q, status_q):
-    """后台执行批量处理任务（不阻塞GUI主线程）"""
-    global log_queue
+class OutputStage:
+    """流水线的非CAD阶段：在独立线程中按提交顺序执行写Excel、写缓存等任务
+
+    CAD阶段（COM调用必须留在创建ZwCAD连接的线程）提交任务后立即处理下一张图纸；
+    队列有界，输出阶段积压 depth 个任务时 submit 阻塞，内存占用不随图纸数量增长。
+    depth 为 0 时不启动线程，submit 直接执行任务。
+    """
+    def __init__(self, depth):
+        self.tasks = queue.Queue(maxsize=depth) if depth > 0 else None
+        self.thread = None
+        if self.tasks is not None:
+            self.thread = threading.Thread(target=self._run, name="output-stage", daemon=True)
+            self.thread.start()
+
+    def submit(self, func, *args, on_error=None):
+        """提交任务；任务抛出异常时记录日志并调用 on_error(异常)"""
+        if self.tasks is None:
+            self._execute(func, args, on_error)
+        else:
+            self.tasks.put((func, args, on_error))
+
+    def _execute(self, func, args, on_error):
+        try:
+            func(*args)
+        except Exception as e:
+            log_msg(f"  ❌ {str(e)}")
+            if on_error:
+                on_error(e)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            self._execute(*task)
+
+    def close(self):
+        """等待已提交的任务全部完成"""
+        if self.thread is not None:
+            self.tasks.put(None)
+            self.thread.join()
+            self.thread = None
+
+def drawing_result(dwg, status, data=None, write_count=0, error=None):
+    """单张图纸的处理结果（JSON汇总用）
+
+    status: done 已回写 / cached 复用缓存 / empty 无有效标注 / failed 失败；
+    timings 为各阶段耗时（秒），counts 为扫描实体/提取标注/回写序号等数量
+    """
+    drawing_metrics = metrics.get(dwg)
+    has_output = status in ("done", "cached") and write_count > 0
+    return {"file": os.path.abspath(dwg), "sheet": os.path.basename(dwg)[:-4], "status": status,
+            "annotations": len(data) if data else 0, "labels": write_count,
+            "output": os.path.join(WORK_DIR, os.path.basename(dwg)) if has_output else None,
+            "ready_wait": round(drawing_metrics["timings"]["ready_wait"], 3)
+                          if "ready_wait" in drawing_metrics["timings"] else None,
+            "timings": {name: round(value, 4) for name, value in drawing_metrics["timings"].items()},
+            "counts": drawing_metrics["counts"],
+            "error": error}
+
+class ServiceResources:
+    """常驻服务（热文件夹）跨批次共用的CAD实例、Excel写入器与标注数据库
+
+    传给 run_process_async 后批次不清空输出目录、结束时不退出CAD，Excel只保存不关闭；
+    批次整体失败时CAD实例被丢弃，下一批重新启动。进程池模式（WORKER_COUNT>1 或设置了 FILE_TIMEOUT）
+    的工作进程仍按批次启动各自的CAD。
+    """
+    def __init__(self):
+        os.makedirs(WORK_DIR, exist_ok=True)
+        self.cad = None
+        self.store = open_annotation_store()
+        self.excel = None
+        if EXCEL_ENABLED:
+            path = os.path.join(WORK_DIR, EXCEL_NAME)
+            self.excel = ExcelReportWriter(path, write_only=False, existing=os.path.exists(path))
+
+    def close(self):
+        if self.excel is not None:
+            try:
+                self.excel.close()
+            except Exception as e:
+                log_msg(f"❌ Excel保存失败：{str(e)}")
+        if self.store is not None:
+            self.store.close()
+        if self.cad is not None:
+            try:
+                as_backend(self.cad).quit()
+            except Exception:
+                log_msg("⚠️  ZwCAD 关闭失败，需手动关闭")
+            self.cad = None
+
+def run_process_async(dwg_files, log_q, status_q, open_folder=True, service=None):
+    """后台执行批量处理任务（不阻塞GUI主线程），返回结果汇总（见 drawing_result）
+
+    service 为 ServiceResources 时沿用其中的CAD、Excel与标注数据库，不清空输出目录。
+    """
+    global log_queue, excel_writer
     log_queue = log_q
     cad = None
-    success_count = 0
+    stage = None
+    store = None
     total_files = len(dwg_files)
+    all_files = list(dwg_files)
+    results = [None] * total_files
+    summary = {"work_dir": WORK_DIR, "excel": None, "files": results, "error": None}
+    started = time.perf_counter()
+    metrics.reset()
     
     try:
         # 初始化通知
-        status_q.put(("STATUS", "✅ 开始初始化，清空并创建Excel文件…"))
+        status_q.put(("STATUS", "✅ 开始初始化，清空并创建Excel文件…" if service is None else "✅ 开始处理新批次…"))
         status_q.put(("PROGRESS", 5))
         
-        # 清空并创建Excel
-        clear_and_create_excel()
-        time.sleep(0.5)
-        
-        status_q.put(("STATUS", "🔧 正在连接/启动ZwCAD…"))
-        status_q.put(("PROGRESS", 10))
-        
-        # 启动/连接ZwCAD
-        cad = ensure_zwcad()
-        time.sleep(1)
-        
-        # 批量处理DWG文件
-        for i, dwg in enumerate(dwg_files):
+        # 清空并创建Excel（常驻服务沿用已打开的Excel与标注数据库）
+        excel_writer = clear_and_create_excel() if service is None else service.excel
+        log_file = start_file_logging()
+        if log_file:
+            log_msg(f"日志文件：{log_file}")
+
+        store = open_annotation_store() if service is None else service.store
+        cad = service.cad if service is not None else None
+
+        # 查找内容未变化的图纸（缓存命中的图纸不需要CAD）
+        cache, journal = open_cache_and_journal(dwg_files)
+        if cache:
+            cache_keys, cache_hits = plan_cached_batch(dwg_files, cache, journal)
+        else:
+            cache_keys, cache_hits = [None] * total_files, {}
+        pending_files = [dwg for i, dwg in enumerate(dwg_files) if i not in cache_hits]
+
+        needs_cad = not all(uses_dxf_backend(dwg) for dwg in pending_files)
+        # 设置了处理时限时ZwCAD放在受看门狗监控的工作进程中（卡死的COM调用无法在本进程内中断）
+        supervised = bool(FILE_TIMEOUT) and needs_cad and not CAD_SESSION_ADDRESS
+        if (WORKER_COUNT > 1 and len(pending_files) > 1) or (supervised and pending_files):
+            # 多实例并行：每个工作进程拥有独立的ZwCAD（全部为离线DXF时不启动CAD）
+            status_q.put(("STATUS", f"🔧 正在启动 {min(WORKER_COUNT, len(pending_files))} 个工作进程…"))
+            status_q.put(("PROGRESS", 10))
+            app_factory = None
+            if not needs_cad:
+                from cad_backends import DxfBackend as app_factory
+            precomputed = {}
+            for i, entry in cache_hits.items():
+                write_count = restore_cached_result(cache, journal, cache_keys[i], entry, dwg_files[i],
+                                                    write_excel=False)
+                precomputed[i] = (dwg_files[i], entry["annotations"], write_count, None)
+                results[i] = drawing_result(dwg_files[i], "cached", entry["annotations"], write_count)
+                remember_in_store(store, dwg_files[i], entry["annotations"], write_count)
+
+            def on_result(index, dwg, data, write_count, error):
+                remember_result(cache, journal, cache_keys[index], dwg, data, write_count, error)
+                remember_in_store(store, dwg, data, write_count)
+                if error:
+                    results[index] = drawing_result(dwg, "failed", error=error)
+                else:
+                    results[index] = drawing_result(dwg, "done" if data else "empty", data, write_count)
+
+            run_worker_pool(dwg_files, max(WORKER_COUNT, 1), status_q, app_factory,
+                            precomputed=precomputed, on_result=on_result)
+            dwg_files = []
+
+        elif needs_cad and cad is None:
+            status_q.put(("STATUS", "🔧 正在连接/启动ZwCAD…"))
+            status_q.put(("PROGRESS", 10))
+
+            # 启动/连接ZwCAD（配置了会话服务时优先租用服务中已预热的实例）
+            with metrics.stage(None, "cad_start"):
+                cad = connect_cad_session() if CAD_SESSION_ADDRESS else None
+                if cad is None:
+                    cad = ensure_zwcad()
+
+        # 输出阶段（写Excel、写缓存）与CAD阶段流水线执行，结果按图纸顺序写入
+        stage = OutputStage(PIPELINE_DEPTH)
+
+        def write_sheet(sheet_name, data, dwg):
+            with metrics.stage(dwg, "excel"):
+                write_to_excel(sheet_name, data)
+
+        sheets_submitted = set()
+
+        def submit_sheet(index, dwg, data):
+            # CAD在回写阶段断开时工作表已提交，重试同一张图纸不再重复写入
+            if index not in sheets_submitted:
+                sheets_submitted.add(index)
+                stage.submit(write_sheet, os.path.basename(dwg)[:-4], data, dwg, on_error=mark_failed(index, dwg))
+
+        def mark_failed(index, dwg):
+            def on_error(e):
+                results[index] = drawing_result(dwg, "failed", error=str(e))
+            return on_error
+
+        def restore_cached(index, dwg):
+            write_count = restore_cached_result(cache, journal, cache_keys[index], cache_hits[index], dwg)
+            results[index] = drawing_result(dwg, "cached", cache_hits[index]["annotations"], write_count)
+            remember_in_store(store, dwg, cache_hits[index]["annotations"], write_count)
+
+        def finish(index, dwg, data, write_count, error=None):
+            # 写Excel失败的图纸已被 mark_failed 记为失败，不写入缓存
+            if results[index] is not None:
+                error = results[index]["error"]
+            remember_result(cache, journal, cache_keys[index], dwg, data, write_count, error)
+            if error:
+                results[index] = drawing_result(dwg, "failed", error=error)
+            else:
+                results[index] = drawing_result(dwg, "done" if data else "empty", data, write_count)
+                remember_in_store(store, dwg, data, write_count)
+
+        # 批量处理DWG文件；CAD断开时重启CAD并立即重试同一张图纸（保持Excel中的图纸顺序）
+        loop_started = time.perf_counter()
+        cad_files = 0
+        tasks = deque(enumerate(dwg_files))
+        attempts = {}         # 原始序号 -> CAD断开后重试的次数
+        lost = None           # 使CAD断开的异常，重启CAD后清除
+        while tasks:
+            i, dwg = tasks.popleft()
             current_file_num = i + 1
-            progress = 10 + (i / total_files) * 80  # 10%~90% 分配给文件处理
             dwg_name = os.path.basename(dwg)
-            
+
+            # 按CAD是否断开、图纸数/内存回收本地CAD实例（会话服务的实例由服务端管理）
+            if i not in cache_hits and not uses_dxf_backend(dwg) and not isinstance(cad, RemoteCADBackend):
+                reason = recycle_reason(cad, cad_files, lost)
+                lost = None
+                if reason:
+                    try:
+                        with metrics.stage(None, "cad_start"):
+                            cad = restart_cad(cad, ensure_zwcad, reason)
+                        metrics.count(None, "cad_recycles")
+                        cad_files = 0
+                    except Exception as e:
+                        cad = None
+                        raise Exception(f"重启CAD失败：{str(e)}")
+                cad_files += 1
+
+            def report_progress(fraction, stage_name, i=i, dwg_name=dwg_name):
+                # 10%~90% 分配给文件处理，按图纸内的阶段细分；剩余时间按已处理的速度估算
+                eta = format_eta(i + fraction, total_files, time.perf_counter() - loop_started)
+                status_q.put(("STATUS", f"📄 正在处理第 {i + 1}/{total_files} 个文件：{dwg_name}（{stage_name}）{eta}"))
+                status_q.put(("PROGRESS", 10 + ((i + fraction) / total_files) * 80))
+
             # 更新进度和状态
-            status_q.put(("STATUS", f"📄 正在处理第 {current_file_num}/{total_files} 个文件：{dwg_name}"))
-            status_q.put(("PROGRESS", progress))
+            report_progress(0.0, "准备")
             log_msg(f"\n===== 开始处理：{dwg_name} =====")
             
             try:
-                # 提取标注
-                data = collect_annotations(dwg, cad)
-                if not data:
-                    log_msg("  ⚠️  无有效标注，跳过回写")
+                if i in cache_hits:
+                    stage.submit(restore_cached, i, dwg, on_error=mark_failed(i, dwg))
                     continue
-                
-                # 写入Excel
-                sheet_name = os.path.basename(dwg)[:-4]
-                write_to_excel(sheet_name, data)
-                
-                # 回写序号
-                add_result = add_labels_back(dwg, cad)
-                if add_result > 0:
-                    success_count += 1
+
+                # 单次打开：提取标注 → 回写序号 → 另存为；写入Excel交给输出阶段，与回写重叠
+                data, add_result = process_dwg(
+                    dwg, backend_for_file(dwg, cad),
+                    sink=lambda d, index=i, path=dwg: submit_sheet(index, path, d),
+                    progress=report_progress)
+                stage.submit(finish, i, dwg, data, add_result)
                 
             except Exception as e:
+                if is_cad_lost(e) and not uses_dxf_backend(dwg) and not isinstance(cad, RemoteCADBackend):
+                    lost = e
+                    attempts[i] = attempts.get(i, 0) + 1
+                    if attempts[i] <= FILE_RETRIES:
+                        log_msg(f"  ↻ {dwg_name} CAD进程已断开，重启CAD后重试（第{attempts[i]}次重试）")
+                        metrics.count(None, "file_retries")
+                        tasks.appendleft((i, dwg))
+                        continue
                 error_msg = f"  ❌ 处理失败：{str(e)}"
                 log_msg(error_msg)
                 status_q.put(("STATUS", f"❌ 第 {current_file_num} 个文件处理失败：{dwg_name}"))
+                stage.submit(finish, i, dwg, None, 0, str(e))
                 continue
-        
+
+        # 等待输出阶段写完全部图纸
+        stage.close()
+        success_count = sum(1 for r in results if r and r["status"] != "failed" and r["labels"] > 0)
+
+        # 一次性保存Excel（常驻服务的工作簿保存后继续使用）
+        if excel_writer is not None:
+            if service is None:
+                excel_writer.close()
+            else:
+                excel_writer.save()
+            summary["excel"] = excel_writer.path
+            log_msg(f"Excel报表已保存：{excel_writer.path}")
+        if journal:
+            journal.finish()
+        if METRICS_EXPORT:
+            json_path, _ = metrics.export(WORK_DIR)
+            log_msg(f"耗时统计已导出：{json_path}")
+
         # 处理完成
         final_progress = 100
         final_status = f"✅ 批量处理完成！成功 {success_count}/{total_files} 个文件"
@@ -492,26 +2913,1219 @@ def run_process_async(dwg_files, log_q, status_q):
                                   f"批量处理完成！\n\n成功处理：{success_count}/{total_files} 个文件\n结果保存至：{WORK_DIR}")))
         
         # 自动打开输出文件夹
-        open_output_folder()
+        if open_folder:
+            open_output_folder()
         
     except Exception as e:
         error_msg = f"❌ 全局任务失败：{str(e)}"
+        summary["error"] = str(e)
         log_msg(error_msg)
         status_q.put(("STATUS", error_msg))
         status_q.put(("PROGRESS", 0))
         status_q.put(("MESSAGE", ("error", "严重错误", f"程序运行出错：{str(e)}")))
     finally:
-        # 关闭ZwCAD
-        if cad:
-            try:
-                cad.Quit()
-                log_msg("ZwCAD 已正常关闭")
-            except:
-                log_msg("⚠️  ZwCAD 关闭失败，需手动关闭")
+        if stage is not None:
+            stage.close()
+        if store is not None:
+            summary["store"] = store.path
+            if service is None:
+                store.close()
+        # 出错时也保存已完成图纸的Excel
+        if excel_writer is not None:
+            if not excel_writer.closed and (service is None or summary["error"]):
+                try:
+                    excel_writer.close() if service is None else excel_writer.save()
+                    log_msg(f"Excel报表已保存：{excel_writer.path}")
+                except Exception as e:
+                    log_msg(f"❌ Excel保存失败：{str(e)}")
+            excel_writer = None
+        # 关闭ZwCAD（会话服务的实例只归还，保持运行；常驻服务留给下一批，批次失败时丢弃）
+        if service is not None and not summary["error"]:
+            service.cad = cad
+        else:
+            if service is not None:
+                service.cad = None
+            if isinstance(cad, RemoteCADBackend):
+                cad.quit()
+                log_msg("CAD会话已归还，ZwCAD保持运行")
+            elif cad:
+                try:
+                    cad.Quit()
+                    log_msg("ZwCAD 已正常关闭")
+                except:
+                    log_msg("⚠️  ZwCAD 关闭失败，需手动关闭")
+        # 未处理到的图纸（全局失败时）记为失败
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = drawing_result(all_files[i], "failed", error=summary["error"] or "未处理")
+        summary["succeeded"] = sum(1 for r in results if r["status"] != "failed" and r["labels"] > 0)
+        summary["failed"] = sum(1 for r in results if r["status"] == "failed")
+        summary["elapsed"] = round(time.perf_counter() - started, 3)
+        summary["metrics"] = {key: value for key, value in metrics.report().items() if key != "drawings"}
+        stop_file_logging()
         # 标记任务完成
         status_q.put(("DONE", None))
+    return summary
+
+# ==========  多实例并行处理（进程池）  ==========
+class _ForwardingLogQueue:
+    """工作进程内的日志队列：把 log_msg 的内容转发给主进程汇总"""
+    def __init__(self, result_q, worker_id):
+        self.result_q = result_q
+        self.worker_id = worker_id
+
+    def full(self):
+        return False
+
+    def put(self, item):
+        msg_type, (level, msg) = item
+        self.result_q.put((msg_type, self.worker_id, (level, f"[W{self.worker_id}] {msg}")))
+
+def start_zwcad_instance():
+    """在当前进程中启动一个独立的ZwCAD实例（工作进程使用，不复用已运行的实例）"""
+    if SIMULATE_CAD:
+        return profile_com(start_simulated_cad())
+    load_com_modules()
+    pythoncom.CoInitialize()
+    cad = win32.DispatchEx("ZWCAD.Application")
+    try:
+        waited = wait_cad_ready(cad)
+        log_msg(f"独立ZwCAD实例已就绪（等待{waited:.2f}秒）")
+    except TimeoutError as e:
+        log_msg(f"⚠️  ZwCAD空闲状态检测超时，继续执行：{str(e)}")
+    cad.Visible = False
+    return profile_com(cad)
+
+# ----- 看门狗与CAD回收 -----
+def cad_process_id(cad):
+    """CAD Application 所在进程的PID（由主窗口句柄查询），无法获取或为模拟CAD时返回 None"""
+    cad = unwrap_com(cad)
+    if isinstance(cad, CADBackend) or is_simulated(cad):
+        return None
+    try:
+        import win32process
+        return win32process.GetWindowThreadProcessId(int(cad.HWND))[1]
+    except Exception:
+        return None
+
+def process_memory_mb(pid):
+    """进程工作集内存（MB），仅Windows；读取失败时返回 None"""
+    if os.name != "nt" or not pid:
+        return None
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize / 1024 / 1024
+    finally:
+        kernel32.CloseHandle(handle)
+
+def cad_memory_mb(cad):
+    cad = unwrap_com(cad)
+    if is_simulated(cad):
+        return cad.memory_mb
+    return process_memory_mb(cad_process_id(cad))
+
+def kill_process(pid):
+    """结束进程（Windows上为 TerminateProcess），进程已退出时忽略"""
+    if not pid:
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+# COM错误码：应用程序忙（拒绝调用）/ RPC服务器不可用（CAD已崩溃），模拟CAD抛出同样的错误码
+RPC_E_CALL_REJECTED = -2147418111
+RPC_S_SERVER_UNAVAILABLE = -2147023174
+# CAD进程崩溃或断开时COM调用返回的错误码：RPC服务器不可用 / 远程过程调用失败 / 对象已与客户端断开连接
+CAD_LOST_HRESULTS = (RPC_S_SERVER_UNAVAILABLE, -2147023170, -2147417848)
+
+def is_cad_lost(error):
+    """异常（含被包装前的原始异常）是否表明CAD进程已崩溃或断开，这类失败与图纸本身无关"""
+    while error is not None:
+        if error.args and error.args[0] in CAD_LOST_HRESULTS:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def recycle_reason(cad, files_done, error=None):
+    """按CAD是否已断开（error 为上一张图纸的异常）、已处理图纸数与CAD进程内存判断是否需要重启CAD，
+    返回原因或 None（离线后端不回收）"""
+    if cad is None or isinstance(cad, CADBackend):
+        return None
+    if error is not None and is_cad_lost(error):
+        return "CAD进程已崩溃或断开连接"
+    if CAD_RECYCLE_FILES and files_done >= CAD_RECYCLE_FILES:
+        return f"CAD实例已处理{files_done}张图纸"
+    if CAD_RECYCLE_MEMORY_MB:
+        memory = cad_memory_mb(cad)
+        if memory is not None and memory >= CAD_RECYCLE_MEMORY_MB:
+            return f"CAD进程内存{memory:.0f}MB，超过{CAD_RECYCLE_MEMORY_MB}MB"
+    return None
+
+def restart_cad(cad, factory, reason):
+    """退出当前CAD实例（退出失败时结束其进程），再由 factory 启动新实例"""
+    log_msg(f"♻️  {reason}，正在重启CAD")
+    pid = cad_process_id(cad)
+    try:
+        cad.Quit()
+    except Exception:
+        kill_process(pid)
+    return factory()
+
+def schedule_largest_first(dwg_files):
+    """按文件大小从大到小排序，返回 [(原始序号, 路径), ...]，大文件先处理以缩短整体耗时"""
+    def file_size(item):
+        try:
+            return os.path.getsize(item[1])
+        except OSError:
+            return 0
+    return sorted(enumerate(dwg_files), key=file_size, reverse=True)
+
+def _pool_worker(worker_id, task_q, result_q, app_factory, settings):
+    """工作进程：拥有自己的COM套间和CAD实例，从共享队列取图纸处理，结果交回主进程"""
+    global log_queue
+    globals().update(settings)
+    log_queue = _ForwardingLogQueue(result_q, worker_id)
+    cad = None
+    try:
+        start = time.perf_counter()
+        cad = app_factory()
+        result_q.put(("CAD_PID", worker_id, cad_process_id(cad)))
+        result_q.put(("METRICS", worker_id, (None, {"timings": {"cad_start": time.perf_counter() - start}})))
+    except Exception as e:
+        result_q.put(("WORKER_FAILED", worker_id, f"启动CAD失败：{str(e)}"))
+        return
+
+    files_done = 0
+    try:
+        while True:
+            task = task_q.get()
+            if task is None:
+                break
+            index, dwg = task
+            result_q.put(("START", worker_id, index))
+            log_msg(f"\n===== 开始处理：{os.path.basename(dwg)} =====")
+            error = None
+            try:
+                # Excel由主进程统一写入，这里只做 提取 → 回写 → 另存为
+                data, write_count = process_dwg(dwg, backend_for_file(dwg, cad))
+                result_q.put(("METRICS", worker_id, (dwg, metrics.pop(dwg))))
+                result_q.put(("RESULT", worker_id, (index, dwg, data, write_count, None)))
+            except Exception as e:
+                error = e
+                result_q.put(("METRICS", worker_id, (dwg, metrics.pop(dwg))))
+                if is_cad_lost(e) and not uses_dxf_backend(dwg):
+                    # CAD已崩溃：由主进程按重试次数重新排队，本进程重启CAD后继续取图纸
+                    result_q.put(("CAD_LOST", worker_id, (index, str(e))))
+                else:
+                    result_q.put(("RESULT", worker_id, (index, dwg, None, 0, str(e))))
+
+            files_done += 1
+            reason = recycle_reason(cad, files_done, error)
+            if reason:
+                try:
+                    start = time.perf_counter()
+                    cad = restart_cad(cad, app_factory, reason)
+                except Exception as e:
+                    cad = None
+                    result_q.put(("WORKER_FAILED", worker_id, f"重启CAD失败：{str(e)}"))
+                    return
+                files_done = 0
+                result_q.put(("CAD_PID", worker_id, cad_process_id(cad)))
+                result_q.put(("METRICS", worker_id, (None, {"timings": {"cad_start": time.perf_counter() - start},
+                                                            "counts": {"cad_recycles": 1}})))
+    finally:
+        try:
+            as_backend(cad).quit()
+        except:
+            pass
+        result_q.put(("WORKER_DONE", worker_id, None))
+
+def run_worker_pool(dwg_files, worker_count, status_q, app_factory=None, precomputed=None, on_result=None):
+    """多进程批量处理：主进程负责调度、汇总结果、按原始顺序写Excel并驱动进度条
+
+    app_factory 为可pickle的模块级函数，返回CAD Application对象；
+    默认为 start_zwcad_instance，测试时可换成替身后端。
+    precomputed 为已有结果 {序号: (路径, 标注, 回写数量, None)}（如缓存命中），不再调度；
+    on_result(序号, 路径, 标注, 回写数量, 错误) 在每个新结果到达时调用。返回成功文件数。
+
+    看门狗：处理超过 FILE_TIMEOUT 秒的图纸，或工作进程异常退出时正在处理的图纸，
+    终止该工作进程并结束其CAD进程，由新工作进程接替，图纸在 FILE_RETRIES 次内重新排队。
+    CAD进程崩溃或断开时（CAD_LOST），工作进程自行重启CAD，图纸同样在 FILE_RETRIES 次内重新排队。
+    """
+    app_factory = app_factory or start_zwcad_instance
+    precomputed = precomputed or {}
+    total_files = len(dwg_files)
+    tasks = [task for task in schedule_largest_first(dwg_files) if task[0] not in precomputed]
+    worker_count = min(worker_count, len(tasks))
+    ctx = multiprocessing.get_context("spawn")
+    task_q = ctx.Queue()
+    result_q = ctx.Queue()
+
+    # 结束标记在全部图纸都有结果后才放入，重新排队的图纸排在已有任务之后仍能被取到
+    for task in tasks:
+        task_q.put(task)
+
+    settings = {name: globals()[name] for name in USER_SETTING_NAMES}
+    workers = {}
+
+    def start_worker(worker_id):
+        proc = ctx.Process(target=_pool_worker,
+                           args=(worker_id, task_q, result_q, app_factory, settings),
+                           daemon=True)
+        proc.start()
+        workers[worker_id] = proc
+
+    for worker_id in range(1, worker_count + 1):
+        start_worker(worker_id)
+    if workers:
+        log_msg(f"已启动 {worker_count} 个工作进程（大文件优先调度）")
+
+    results = {}          # 原始序号 -> (dwg, data, write_count, error)
+    in_flight = {}        # 工作进程 -> (正在处理的原始序号, 开始时间)
+    cad_pids = {}         # 工作进程 -> 其CAD进程PID
+    attempts = {}         # 原始序号 -> 超时/进程退出的次数
+    finished_workers = set()
+    terminated = set()    # 被看门狗终止的工作进程，其后续消息（除日志外）忽略
+    next_to_write = 0
+    success_count = 0
+    started = time.perf_counter()
+
+    def retry_or_fail(index, error):
+        """超时、工作进程退出或CAD断开：在 FILE_RETRIES 次内重新排队，否则记为失败；返回是否重新排队"""
+        dwg = dwg_files[index]
+        attempts[index] = attempts.get(index, 0) + 1
+        if attempts[index] <= FILE_RETRIES:
+            log_msg(f"  ↻ {os.path.basename(dwg)} {error}，重新排队（第{attempts[index]}次重试）")
+            metrics.count(None, "file_retries")
+            task_q.put((index, dwg))
+            return True
+        record(index, dwg, None, 0, error)
+        return False
+
+    def replace_worker(worker_id, reason):
+        """终止工作进程并结束其CAD进程；还有图纸未完成时启动新工作进程接替"""
+        terminated.add(worker_id)
+        finished_workers.add(worker_id)
+        proc = workers[worker_id]
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(timeout=5)
+        kill_process(cad_pids.pop(worker_id, None))
+        metrics.count(None, "cad_recycles")
+        if len(results) < total_files:
+            new_id = max(workers) + 1
+            start_worker(new_id)
+            log_msg(f"♻️  {reason}：已结束工作进程W{worker_id}及其CAD，由W{new_id}接替")
+        else:
+            log_msg(f"♻️  {reason}：已结束工作进程W{worker_id}及其CAD")
+
+    def check_deadlines():
+        if not FILE_TIMEOUT:
+            return
+        now = time.perf_counter()
+        for worker_id, (index, since) in list(in_flight.items()):
+            if now - since > FILE_TIMEOUT:
+                in_flight.pop(worker_id)
+                metrics.count(None, "file_timeouts")
+                log_msg(f"⚠️  {os.path.basename(dwg_files[index])} 超过{FILE_TIMEOUT}秒未完成（工作进程W{worker_id}）")
+                retry_or_fail(index, f"处理超时（{FILE_TIMEOUT}秒）")
+                replace_worker(worker_id, "处理超时")
+
+    def record(index, dwg, data, write_count, error, fresh=True):
+        nonlocal success_count
+        results[index] = (dwg, data, write_count, error)
+        if fresh and on_result:
+            on_result(index, dwg, data, write_count, error)
+        dwg_name = os.path.basename(dwg)
+        if error:
+            log_msg(f"  ❌ {dwg_name} 处理失败：{error}")
+            status_q.put(("STATUS", f"❌ 第 {index + 1} 个文件处理失败：{dwg_name}"))
+        else:
+            if write_count > 0:
+                success_count += 1
+            eta = format_eta(len(results), total_files, time.perf_counter() - started)
+            status_q.put(("STATUS", f"📄 已完成 {len(results)}/{total_files} 个文件：{dwg_name}{eta}"))
+        status_q.put(("PROGRESS", 10 + (len(results) / total_files) * 80))
+
+    def flush_excel():
+        """按原始顺序把已完成的图纸写入Excel"""
+        nonlocal next_to_write
+        while next_to_write in results:
+            dwg, data, write_count, error = results[next_to_write]
+            if data:
+                try:
+                    with metrics.stage(dwg, "excel"):
+                        write_to_excel(os.path.basename(dwg)[:-4], data)
+                except Exception as e:
+                    log_msg(f"  ❌ {os.path.basename(dwg)} 写入Excel失败：{str(e)}")
+            next_to_write += 1
+
+    for index, result in precomputed.items():
+        record(index, *result, fresh=False)
+
+    while len(results) < total_files:
+        try:
+            msg_type, worker_id, payload = result_q.get(timeout=1)
+        except queue.Empty:
+            msg_type = None
+            # 检查异常退出的工作进程，其正在处理的文件重新排队或记为失败
+            for worker_id, proc in list(workers.items()):
+                if worker_id not in finished_workers and not proc.is_alive():
+                    finished_workers.add(worker_id)
+                    flight = in_flight.pop(worker_id, None)
+                    if flight is not None:
+                        retry_or_fail(flight[0], f"工作进程W{worker_id}异常退出")
+                        replace_worker(worker_id, "工作进程异常退出")
+            if len(finished_workers) == len(workers):
+                for index, dwg in enumerate(dwg_files):
+                    if index not in results:
+                        record(index, dwg, None, 0, "没有可用的工作进程")
+
+        if msg_type == "LOG":
+            log_msg(payload[1], payload[0])
+        elif msg_type is not None and worker_id in terminated:
+            pass
+        elif msg_type == "START":
+            in_flight[worker_id] = (payload, time.perf_counter())
+        elif msg_type == "CAD_PID":
+            cad_pids[worker_id] = payload
+        elif msg_type == "METRICS":
+            metrics.merge(*payload)
+        elif msg_type == "RESULT":
+            in_flight.pop(worker_id, None)
+            if payload[0] not in results:
+                record(*payload)
+        elif msg_type == "CAD_LOST":
+            in_flight.pop(worker_id, None)
+            if payload[0] not in results:
+                retry_or_fail(payload[0], f"CAD进程已断开：{payload[1]}")
+        elif msg_type == "WORKER_FAILED":
+            finished_workers.add(worker_id)
+            log_msg(f"⚠️  工作进程W{worker_id}不可用：{payload}")
+        elif msg_type == "WORKER_DONE":
+            finished_workers.add(worker_id)
+
+        check_deadlines()
+        flush_excel()
+
+    flush_excel()
+    for worker_id, proc in workers.items():
+        if worker_id not in finished_workers:
+            task_q.put(None)
+    for proc in workers.values():
+        proc.join(timeout=5)
+    return success_count
+
+# ==========  常驻CAD会话服务  ==========
+# 服务进程（--serve）为每个ZwCAD实例启动一个子进程，实例在自己的进程/线程中创建并调用，
+# COM对象不跨线程或进程传递。批处理连接服务后租用一个空闲实例，通过 RemoteCADBackend
+# 逐步下发 打开/提取/回写/另存为/关闭；实例在每次租用前做健康检查，异常时重建。
+# 由服务端自己决定的配置（不随租用方的配置变化）
+SESSION_SERVER_SETTINGS = ("ZWCAD_EXE", "SIMULATE_CAD", "SIMULATION_PROFILE", "CAD_START_TIMEOUT",
+                           "WORKER_COUNT", "CAD_SESSION_ADDRESS", "CAD_SESSION_AUTHKEY",
+                           "CAD_SESSION_INSTANCES", "LOG_FILE")
+
+SESSION_AUTHKEY_ENV = "CAD_SEQNO_SESSION_AUTHKEY"
+
+def get_session_key_path():
+    """当前用户的会话服务口令文件（Windows 为 %APPDATA% 下，其他系统为用户主目录下）"""
+    base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "CADSeqNo", "session.key")
+
+def _read_session_key(path):
+    try:
+        if os.name == "posix" and os.stat(path).st_mode & 0o077:
+            raise RuntimeError(f"会话服务口令文件 {path} 可被其他用户读取，请改为仅本用户可读（chmod 600）")
+        with open(path, "r", encoding="ascii") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def session_authkey(create=False):
+    """会话服务口令（bytes）：CAD_SESSION_AUTHKEY > 环境变量 > 口令文件
+
+    都没有时，create 为真（服务端）则生成随机口令写入口令文件（仅本用户可读），否则抛出 RuntimeError。
+    """
+    key = CAD_SESSION_AUTHKEY or os.environ.get(SESSION_AUTHKEY_ENV)
+    if key:
+        return key.encode("utf-8")
+    path = get_session_key_path()
+    key = _read_session_key(path)
+    if key is None and create:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            key = _read_session_key(path)  # 同时启动的另一个服务已生成
+        else:
+            key = secrets.token_hex(32)
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(key)
+            log_msg(f"已生成会话服务口令：{path}（仅当前用户可读，其他机器的批处理需配置相同的 CAD_SESSION_AUTHKEY）")
+    if key is None:
+        raise RuntimeError(f"未设置会话服务口令：请配置 CAD_SESSION_AUTHKEY 或环境变量 {SESSION_AUTHKEY_ENV}，"
+                           f"或先在本机以 --serve 启动服务生成 {path}")
+    return key.encode("utf-8")
+
+def parse_session_address(address):
+    """"主机:端口" → (主机, 端口)"""
+    host, _, port = str(address).rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def check_cad_health(cad):
+    """CAD实例是否仍可用（能访问文档集合且处于空闲状态）"""
+    try:
+        cad.Documents.Count
+        return is_cad_quiescent(cad)
+    except Exception:
+        return False
+
+class _PipeLogQueue:
+    """会话实例进程内的日志队列：日志经管道发往服务进程，再转给当前租用方"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def full(self):
+        return False
+
+    def put(self, item):
+        try:
+            self.conn.send(item)
+        except (EOFError, OSError):
+            pass
+
+def _session_instance_main(instance_id, conn, settings):
+    """会话实例进程：持有一个预热的ZwCAD，按请求执行单步操作并回复 ("OK", 结果) 或 ("ERROR", 信息)"""
+    global log_queue
+    globals().update(settings)
+    log_queue = _PipeLogQueue(conn)
+    # 由服务进程统一处理 Ctrl+C，停止时发送 QUIT
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    own_settings = {name: settings[name] for name in SESSION_SERVER_SETTINGS}
+    backend = None
+    docs = {}
+    jobs = 0
+
+    def shutdown():
+        nonlocal backend
+        for doc in docs.values():
+            try:
+                backend.close(doc)
+            except Exception:
+                pass
+        docs.clear()
+        try:
+            backend.quit()
+        except Exception:
+            pass
+        backend = None
+
+    def recycle(reason):
+        log_msg(f"⚠️  CAD实例S{instance_id}{reason}，正在重建")
+        shutdown()
+
+    def ensure_backend():
+        nonlocal backend
+        if backend is None:
+            backend = ZwCADComBackend(start_zwcad_instance())
+            # 本进程异常退出时，服务进程据此结束遗留的ZwCAD
+            conn.send(("CAD_PID", cad_process_id(backend.cad)))
+        return backend
+
+    try:
+        ensure_backend()
+    except Exception as e:
+        log_msg(f"❌ CAD实例S{instance_id}启动失败：{str(e)}")
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        op, args = request[0], request[1:]
+        if op == "QUIT":
+            break
+        try:
+            if op in ("LEASE", "PING"):
+                if op == "LEASE":
+                    globals().update(args[0])
+                    globals().update(own_settings)
+                    jobs += 1
+                if backend is not None and not check_cad_health(backend.cad):
+                    recycle("健康检查未通过")
+                warm = backend is not None
+                ensure_backend()
+                result = {"instance": instance_id, "jobs": jobs, "warm": warm}
+            elif op == "OPEN":
+                doc = ensure_backend().open(args[0])
+                token = f"{instance_id}-{id(doc)}"
+                docs[token] = doc
+                result = token
+            elif op == "EXTRACT":
+                stats = {}
+                result = (list(backend.iter_annotations(docs[args[0]], stats)), stats)
+            elif op == "LABELS":
+                result = backend.add_labels(docs[args[0]], args[1])
+            elif op == "SAVE":
+                backend.save_as(docs[args[0]], args[1])
+                result = None
+            elif op in ("CLOSE", "RELEASE"):
+                tokens = [args[0]] if op == "CLOSE" else list(docs)
+                for token in tokens:
+                    doc = docs.pop(token, None)
+                    if doc is not None:
+                        backend.close(doc)
+                result = None
+            else:
+                raise ValueError(f"未知的会话请求：{op}")
+            conn.send(("OK", result))
+        except Exception as e:
+            conn.send(("ERROR", str(e)))
+            if backend is not None and not check_cad_health(backend.cad):
+                recycle("调用失败且无响应")
+
+    if backend is not None:
+        shutdown()
+
+class _SessionInstance:
+    """服务进程中对一个会话实例进程的管理：转发请求、进程退出时重启"""
+    def __init__(self, ctx, instance_id, settings):
+        self.ctx = ctx
+        self.instance_id = instance_id
+        self.settings = settings
+        self.proc = None
+        self.conn = None
+        self.cad_pid = None
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.ctx.Pipe()
+        self.proc = self.ctx.Process(target=_session_instance_main,
+                                     args=(self.instance_id, child_conn, self.settings), daemon=True)
+        self.proc.start()
+
+    def restart(self):
+        """结束异常的实例进程及其ZwCAD，再启动新的实例进程"""
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(timeout=5)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join(timeout=5)
+        kill_process(self.cad_pid)
+        self.cad_pid = None
+        self.start()
+
+    def call(self, request, forward=None):
+        """发送请求，把过程中的日志交给 forward（默认本地记录），返回最终回复
+
+        forward 发送失败（客户端已断开）与实例无关：仍收完本次回复保持管道同步，再抛出该异常由调用方断开这个客户端。
+        """
+        client_error = None
+
+        def send_to_client(reply):
+            nonlocal client_error
+            if forward is None or client_error is not None:
+                return
+            try:
+                forward(reply)
+            except (EOFError, OSError) as e:
+                client_error = e
+
+        try:
+            self.conn.send(request)
+            while True:
+                reply = self.conn.recv()
+                if reply[0] == "CAD_PID":
+                    self.cad_pid = reply[1]
+                    continue
+                if reply[0] == "LOG" and forward is None:
+                    log_msg(reply[1][1], reply[1][0])
+                else:
+                    send_to_client(reply)
+                if reply[0] in ("OK", "ERROR"):
+                    break
+        except (EOFError, OSError):
+            reply = ("ERROR", f"CAD实例S{self.instance_id}进程异常退出，已重新启动")
+            log_msg(f"⚠️  {reply[1]}")
+            self.restart()
+            send_to_client(reply)
+        if client_error is not None:
+            raise client_error
+        return reply
+
+    def stop(self):
+        try:
+            self.conn.send(("QUIT",))
+        except (EOFError, OSError):
+            pass
+        self.proc.join(timeout=30)
+
+def _serve_session_client(conn, free_instances):
+    """为一个批处理连接服务：等待空闲实例，转发请求直到对方归还或断开"""
+    instance = free_instances.get()
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                break
+            if request[0] == "RELEASE":
+                break
+            try:
+                instance.call(request, forward=conn.send)
+            except (EOFError, OSError):
+                break  # 客户端已断开，实例照常归还
+    finally:
+        # 对方异常断开时也关闭其遗留的文档
+        instance.call(("RELEASE",))
+        try:
+            conn.close()
+        except OSError:
+            pass
+        free_instances.put(instance)
+
+def serve_cad_sessions(address=None, instances=None):
+    """运行常驻CAD会话服务（阻塞，Ctrl+C 停止并关闭所有ZwCAD实例）"""
+    address = parse_session_address(address or CAD_SESSION_ADDRESS or "127.0.0.1:47651")
+    authkey = session_authkey(create=True)
+    instances = instances or CAD_SESSION_INSTANCES
+    ctx = multiprocessing.get_context("spawn")
+    settings = {name: globals()[name] for name in USER_SETTING_NAMES}
+    pool = [_SessionInstance(ctx, i, settings) for i in range(1, instances + 1)]
+    free_instances = queue.Queue()
+    for instance in pool:
+        instance.call(("PING",))
+        free_instances.put(instance)
+
+    listener = Listener(address, authkey=authkey)
+    log_msg(f"CAD会话服务已启动：{address[0]}:{address[1]}，{instances}个预热实例")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError) as e:
+                log_msg(f"⚠️  拒绝连接：{str(e)}")
+                continue
+            threading.Thread(target=_serve_session_client, args=(conn, free_instances), daemon=True).start()
+    except KeyboardInterrupt:
+        log_msg("CAD会话服务正在停止…")
+    finally:
+        listener.close()
+        for instance in pool:
+            instance.stop()
+
+class RemoteCADBackend(CADBackend):
+    """租用的会话服务实例：每个操作一次往返，文档以服务端的令牌表示；quit() 只归还实例"""
+    name = "session"
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.info = None
+
+    def _call(self, *request):
+        self.conn.send(request)
+        while True:
+            kind, payload = self.conn.recv()
+            if kind == "LOG":
+                log_msg(payload[1], payload[0])
+            elif kind == "ERROR":
+                raise Exception(payload)
+            else:
+                return payload
+
+    def lease(self):
+        settings = {name: globals()[name] for name in USER_SETTING_NAMES}
+        self.info = self._call("LEASE", settings)
+        return self.info
+
+    def open(self, path):
+        return self._call("OPEN", path)
+
+    def iter_annotations(self, doc, stats=None):
+        data, remote_stats = self._call("EXTRACT", doc)
+        if stats is not None:
+            stats.update(remote_stats)
+        return iter(data)
+
+    def add_labels(self, doc, data):
+        # 整张标注表（含锚点列）原样发送，服务端的序号避让与本地一致
+        return self._call("LABELS", doc, AnnotationTable.coerce(data))
+
+    def save_as(self, doc, path):
+        self._call("SAVE", doc, path)
+
+    def close(self, doc):
+        try:
+            self._call("CLOSE", doc)
+        except Exception:
+            pass
+
+    def quit(self):
+        try:
+            self.conn.send(("RELEASE",))
+            self.conn.close()
+        except (EOFError, OSError):
+            pass
+
+def connect_cad_session():
+    """连接 CAD_SESSION_ADDRESS 的会话服务并租用一个实例，服务不可用时返回 None"""
+    try:
+        authkey = session_authkey()
+    except RuntimeError as e:
+        log_msg(f"⚠️  {str(e)}，改为本地启动ZwCAD")
+        return None
+    try:
+        conn = Client(parse_session_address(CAD_SESSION_ADDRESS), authkey=authkey)
+    except (OSError, EOFError) as e:
+        log_msg(f"⚠️  CAD会话服务不可用（{str(e)}），改为本地启动ZwCAD")
+        return None
+    backend = RemoteCADBackend(conn)
+    try:
+        info = backend.lease()
+    except Exception as e:
+        backend.quit()
+        log_msg(f"⚠️  租用CAD会话失败（{str(e)}），改为本地启动ZwCAD")
+        return None
+    state = "已预热" if info["warm"] else "新启动"
+    log_msg(f"已租用CAD会话实例S{info['instance']}（{state}，第{info['jobs']}次使用）")
+    return backend
+
+# ==========  无界面批处理（命令行 / 调度器）  ==========
+class _ConsoleQueue:
+    """无界面模式下替代日志/状态队列：直接输出到标准错误，标准输出留给JSON结果"""
+    def __init__(self, stream=None, types=("LOG", "STATUS")):
+        self.stream = stream or sys.stderr
+        self.types = types
+
+    def full(self):
+        return False
+
+    def put(self, item):
+        msg_type, content = item
+        if msg_type == "LOG":
+            content = content[1]
+        if msg_type in self.types:
+            print(content, file=self.stream, flush=True)
+
+def _parse_setting_value(text):
+    """配置值按Python字面量解析（数字、布尔、列表等），解析失败时当作字符串"""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+def apply_config(config):
+    """把配置字典应用到模块级配置项（键不区分大小写），未知配置项抛出 ValueError"""
+    for key, value in (config or {}).items():
+        name = key.upper()
+        if name not in USER_SETTING_NAMES:
+            raise ValueError(f"未知配置项：{key}")
+        if name == "EXTRACT_WINDOW" and value is not None:
+            value = tuple(value)
+        globals()[name] = value
+
+def load_config_file(path):
+    """读取配置文件：.json 为对象；.ini/.cfg 读取 [settings] 段，值按Python字面量解析"""
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    with open(path, "r", encoding="utf-8") as f:
+        parser.read_file(f)
+    if not parser.has_section("settings"):
+        raise ValueError(f"配置文件缺少 [settings] 段：{path}")
+    return {key: _parse_setting_value(value) for key, value in parser.items("settings")}
+
+def expand_input_paths(paths):
+    """展开命令行给出的文件、通配符和目录（目录取其中的 DWG/DXF 文件）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ("*.dwg", "*.DWG", "*.dxf", "*.DXF"):
+                files.extend(glob.glob(os.path.join(path, pattern)))
+        elif glob.has_magic(path):
+            files.extend(glob.glob(path))
+        else:
+            files.append(path)
+    seen = set()
+    unique = []
+    for path in files:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+def process_batch(paths, config=None, log_q=None, status_q=None):
+    """无界面批处理入口：应用配置后处理图纸，返回结果汇总字典（每张图纸一条，见 drawing_result）
+
+    config 可以是配置字典或配置文件路径，只对本次调用生效（结束后恢复原配置）；日志默认输出到标准错误。
+    """
+    if isinstance(config, str):
+        config = load_config_file(config)
+    saved = {name: globals()[name] for name in USER_SETTING_NAMES}
+    try:
+        apply_config(config)
+        console = _ConsoleQueue()
+        return run_process_async(expand_input_paths(paths), log_q or console,
+                                 status_q or _ConsoleQueue(types=("STATUS",)), open_folder=False)
+    finally:
+        globals().update(saved)
+
+# ==========  热文件夹服务  ==========
+WATCH_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_status ON queue(status, queued_at);
+"""
+
+def get_outbox_dir():
+    return WATCH_OUTBOX or os.path.join(WORK_DIR, "outbox")
+
+def get_watch_queue_path():
+    return os.path.join(WORK_DIR, "watch", "queue.sqlite")
+
+class HotFolderWatcher:
+    """轮询输入目录，文件大小与修改时间持续 settle 秒不变、且能以只读方式打开时才报告（避开复制到一半的文件）"""
+    def __init__(self, directory, settle):
+        self.directory = directory
+        self.settle = settle
+        self.pending = {}   # 路径 → ((大小, 修改时间), 首次看到该状态的时间)
+        self.reported = {}  # 路径 → 已报告的 (大小, 修改时间)
+
+    def poll(self, now=None):
+        """返回本次新就绪的 [(路径, 大小, 修改时间ns), ...]"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        for path in expand_input_paths([self.directory]):
+            path = os.path.abspath(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            signature = (st.st_size, st.st_mtime_ns)
+            if self.reported.get(path) == signature:
+                continue
+            pending = self.pending.get(path)
+            if pending is None or pending[0] != signature:
+                self.pending[path] = (signature, now)
+                continue
+            if now - pending[1] < self.settle:
+                continue
+            try:
+                # 复制中的文件在Windows上通常仍被独占，打开失败时下次再试
+                open(path, "rb").close()
+            except OSError:
+                continue
+            del self.pending[path]
+            self.reported[path] = signature
+            ready.append((path,) + signature)
+        for path in set(self.pending).union(self.reported).difference(seen):
+            self.pending.pop(path, None)
+            self.reported.pop(path, None)
+        return ready
+
+class HotFolderQueue:
+    """持久化的处理队列（SQLite）：queued → processing → done/failed
+
+    以图纸路径为键，大小或修改时间变化时重新排队；服务重启后 processing 状态的图纸重新排队。
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(WATCH_QUEUE_SCHEMA)
+
+    def recover(self):
+        """把上次中断时正在处理的图纸重新排队，返回数量"""
+        with self.conn:
+            return self.conn.execute("UPDATE queue SET status = 'queued' WHERE status = 'processing'").rowcount
+
+    def offer(self, path, size, mtime_ns):
+        """新图纸或内容有变化的图纸加入队列，返回是否加入"""
+        row = self.conn.execute("SELECT size, mtime_ns FROM queue WHERE path = ?", (path,)).fetchone()
+        if row is not None and tuple(row) == (size, mtime_ns):
+            return False
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO queue (path, size, mtime_ns, status, attempts, queued_at) "
+                "VALUES (?, ?, ?, 'queued', 0, ?)", (path, size, mtime_ns, time.time()))
+        return True
+
+    def take(self, limit):
+        """按排队先后取出最多 limit 张图纸并标记为 processing；已被删除的图纸直接移出队列"""
+        rows = self.conn.execute("SELECT path FROM queue WHERE status = 'queued' ORDER BY queued_at LIMIT ?",
+                                 (limit,)).fetchall()
+        paths = []
+        with self.conn:
+            for (path,) in rows:
+                if not os.path.exists(path):
+                    self.conn.execute("DELETE FROM queue WHERE path = ?", (path,))
+                    continue
+                self.conn.execute("UPDATE queue SET status = 'processing', attempts = attempts + 1 WHERE path = ?",
+                                  (path,))
+                paths.append(path)
+        return paths
+
+    def finish(self, path, status, error=None):
+        with self.conn:
+            self.conn.execute("UPDATE queue SET status = ?, finished_at = ?, error = ? WHERE path = ?",
+                              (status, time.time(), error, path))
+
+    def attempts(self, path):
+        row = self.conn.execute("SELECT attempts FROM queue WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+def publish_result(result, outbox):
+    """把一张图纸的结果发布到 outbox：回写后的图纸、<图名>.xlsx（来自标注数据库）、最后写 <图名>.json
+
+    <图名>.json 最后写入，下游以它的出现作为该图纸结果完整的标志。
+    """
+    os.makedirs(outbox, exist_ok=True)
+    name = os.path.basename(result["file"])
+    stem = os.path.splitext(name)[0]
+    published = dict(result)
+    if result["output"] and os.path.exists(result["output"]):
+        target = os.path.join(outbox, name)
+        shutil.move(result["output"], target + ".part")
+        os.replace(target + ".part", target)
+        published["output"] = target
+    if STORE_ENABLED and result["status"] in ("done", "cached", "empty"):
+        excel_path = os.path.join(outbox, stem + ".xlsx")
+        store = AnnotationStore(get_store_path())
+        try:
+            if store.export_excel(excel_path + ".part", paths={result["file"]}):
+                os.replace(excel_path + ".part", excel_path)
+                published["excel"] = excel_path
+            elif os.path.exists(excel_path + ".part"):
+                os.remove(excel_path + ".part")
+        finally:
+            store.close()
+    published["published_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    _write_json_atomic(os.path.join(outbox, stem + ".json"), published)
+    return published
+
+def check_watch_dirs(inbox, outbox):
+    """输入目录、发布目录与输出目录必须互不相同：否则回写后的图纸会被当作新图纸再次排队"""
+    dirs = {"WATCH_DIR": inbox, "WATCH_OUTBOX": outbox, "WORK_DIR": WORK_DIR}
+    seen = {}
+    for name, path in dirs.items():
+        key = os.path.normcase(os.path.realpath(path))
+        if key in seen:
+            raise ValueError(f"{seen[key]} 与 {name} 不能是同一目录：{path}")
+        seen[key] = name
+
+def finish_hot_folder_batch(jobs, summary, outbox):
+    """发布一批的结果并更新队列：批次整体失败时未完成的图纸重新排队，超过 FILE_RETRIES 次后记为失败，
+    返回重新排队的数量"""
+    requeued = 0
+    for result in summary["files"]:
+        path = result["file"]
+        if summary["error"] and result["status"] == "failed" and jobs.attempts(path) <= FILE_RETRIES:
+            jobs.finish(path, "queued", result["error"])
+            requeued += 1
+            continue
+        try:
+            publish_result(result, outbox)
+        except Exception as e:
+            log_msg(f"❌ 发布{os.path.basename(path)}的结果失败：{str(e)}")
+        jobs.finish(path, "failed" if result["status"] == "failed" else "done", result["error"])
+    return requeued
+
+def serve_hot_folder(inbox=None, outbox=None):
+    """热文件夹服务（阻塞，Ctrl+C 停止）：监视输入目录，复制完成的新图纸/修改过的图纸排队，
+    按 WATCH_BATCH_SIZE 分批走完整的提取、Excel、回写流程，逐张发布结果到 outbox
+
+    CAD实例、Excel工作簿与标注数据库在服务运行期间保持打开（见 ServiceResources），批次之间不清空输出目录。
+    队列保存在输出目录下 watch\\queue.sqlite，服务重启后继续处理未完成的图纸。
+    批次整体失败（如CAD无法启动）时图纸重新排队，超过 FILE_RETRIES 次后记为失败。
+    """
+    inbox = inbox or WATCH_DIR
+    if not inbox or not os.path.isdir(inbox):
+        raise ValueError(f"热文件夹输入目录不存在：{inbox}")
+    outbox = outbox or get_outbox_dir()
+    check_watch_dirs(inbox, outbox)
+    os.makedirs(WORK_DIR, exist_ok=True)
+    jobs = HotFolderQueue(get_watch_queue_path())
+    service = ServiceResources()
+    watcher = HotFolderWatcher(inbox, WATCH_SETTLE_SECONDS)
+    status_q = _ConsoleQueue(types=("STATUS",))
+    recovered = jobs.recover()
+    log_msg(f"热文件夹服务已启动：监视 {inbox}，结果发布到 {outbox}"
+            + (f"，{recovered}张中断的图纸重新排队" if recovered else ""))
+    try:
+        while True:
+            for path, size, mtime_ns in watcher.poll():
+                if jobs.offer(path, size, mtime_ns):
+                    log_msg(f"📥 已加入队列：{os.path.basename(path)}")
+            batch = jobs.take(WATCH_BATCH_SIZE)
+            if not batch:
+                time.sleep(WATCH_POLL_INTERVAL)
+                continue
+            summary = run_process_async(batch, log_queue, status_q, open_folder=False, service=service)
+            requeued = finish_hot_folder_batch(jobs, summary, outbox)
+            counts = jobs.counts()
+            log_msg(f"📤 本批发布{len(batch) - requeued}张" + (f"，{requeued}张重新排队" if requeued else "")
+                    + f"；队列：待处理{counts.get('queued', 0)}，完成{counts.get('done', 0)}，失败{counts.get('failed', 0)}")
+            if summary["error"]:
+                time.sleep(WATCH_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        log_msg("热文件夹服务正在停止…")
+    finally:
+        service.close()
+        jobs.close()
+
+# --benchmark 可选的基准测试（均不需要CAD），all 依次运行全部
+BENCHMARKS = {
+    "normalize": benchmark_text_normalization,
+    "table": benchmark_annotation_table,
+    "labels": benchmark_label_placement,
+    "batch": benchmark_simulated_batch,
+}
+
+def run_benchmarks(name="all"):
+    """按名称运行基准测试（参数取各函数默认值），返回 {名称: 结果字典}"""
+    names = list(BENCHMARKS) if name == "all" else [name]
+    return {n: BENCHMARKS[n]() for n in names}
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="ZwCAD 批量标注提取与序号回写（无参数运行时打开图形界面）")
+    parser.add_argument("paths", nargs="*", help="DWG/DXF 文件、通配符或目录")
+    parser.add_argument("--config", help="配置文件（.json 或带 [settings] 段的 .ini）")
+    parser.add_argument("--set", action="append", default=[], metavar="名称=值",
+                        help="覆盖单个配置项，如 --set TEXT_HEIGHT=3.5（可重复）")
+    parser.add_argument("--work-dir", help="输出目录（WORK_DIR）")
+    parser.add_argument("--workers", type=int, help="并行进程数（WORKER_COUNT）")
+    parser.add_argument("--backend", choices=("auto", "zwcad", "dxf"), help="CAD后端（CAD_BACKEND）")
+    parser.add_argument("--no-excel", action="store_true", help="不生成Excel报表")
+    parser.add_argument("--simulate", action="store_true", help="使用模拟CAD（SIMULATE_CAD）")
+    parser.add_argument("--profile-com", action="store_true",
+                        help="统计每张图纸的COM调用并输出报告（COM_PROFILE）")
+    parser.add_argument("--json", default="-", metavar="路径", help="结果JSON输出位置，默认标准输出")
+    parser.add_argument("--gui", action="store_true", help="打开图形界面")
+    parser.add_argument("--query", metavar="标注值", help="在标注数据库中查找包含该标注的图纸（如 Φ20）")
+    parser.add_argument("--export-excel", metavar="路径", help="由标注数据库生成Excel报表")
+    parser.add_argument("--serve", action="store_true",
+                        help="运行常驻CAD会话服务（地址 CAD_SESSION_ADDRESS，默认 127.0.0.1:47651）")
+    parser.add_argument("--watch", nargs="?", const="", metavar="输入目录",
+                        help="热文件夹服务：持续处理投入输入目录的图纸（省略目录时使用 WATCH_DIR）")
+    parser.add_argument("--benchmark", nargs="?", const="all", choices=("all", *BENCHMARKS),
+                        help="运行基准测试并以JSON输出结果（不需要CAD，省略名称时运行全部）")
+    return parser
+
+def main(argv=None):
+    """命令行入口：无参数或 --gui 时打开界面；否则无界面批处理，返回进程退出码"""
+    args = build_arg_parser().parse_args(argv)
+    config = load_config_file(args.config) if args.config else {}
+    for item in args.set:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set 参数格式应为 名称=值：{item}")
+        config[name.strip()] = _parse_setting_value(value.strip())
+    for name, value in (("WORK_DIR", args.work_dir), ("WORKER_COUNT", args.workers), ("CAD_BACKEND", args.backend)):
+        if value is not None:
+            config[name] = value
+    if args.no_excel:
+        config["EXCEL_ENABLED"] = False
+    if args.simulate:
+        config["SIMULATE_CAD"] = True
+    if args.profile_com:
+        config["COM_PROFILE"] = True
+
+    if args.query or args.export_excel:
+        apply_config(config)
+        path = get_store_path()
+        if not os.path.exists(path):
+            raise SystemExit(f"标注数据库不存在：{path}")
+        store = AnnotationStore(path)
+        try:
+            if args.query:
+                result = [{"file": file, "count": count} for file, count in store.find_drawings(args.query)]
+            else:
+                result = {"excel": args.export_excel, "sheets": store.export_excel(args.export_excel)}
+        finally:
+            store.close()
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.benchmark:
+        apply_config(config)
+        print(json.dumps(run_benchmarks(args.benchmark), ensure_ascii=False, indent=2))
+        return 0
+
+    if args.serve:
+        apply_config(config)
+        global log_queue
+        log_queue = _ConsoleQueue()
+        serve_cad_sessions()
+        return 0
+
+    if args.watch is not None:
+        if args.watch:
+            config["WATCH_DIR"] = args.watch
+        apply_config(config)
+        log_queue = _ConsoleQueue()
+        serve_hot_folder()
+        return 0
+
+    if args.gui or not args.paths:
+        apply_config(config)
+        run_gui()
+        return 0
+
+    summary = process_batch(args.paths, config)
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.json == "-":
+        print(text)
+    else:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+    if summary["error"]:
+        return 2
+    return 1 if summary["failed"] else 0
 
 # ==========  GUI界面类  ==========
+# 界面日志缓冲容量、文本框保留的行数、每次刷新最多显示的日志条数
+LOG_BUFFER_SIZE = 10000
+LOG_VIEW_MAX_LINES = 5000
+LOG_DRAIN_BATCH = 1000
+
 class ZwCADBatchProcessor:
     def __init__(self, root):
         self.root = root
@@ -526,8 +4140,8 @@ class ZwCADBatchProcessor:
             except:
                 pass
         
-        # 初始化队列
-        self.log_queue = queue.Queue(maxsize=1000)
+        # 初始化队列（日志使用环形缓冲，错误日志不会丢失）
+        self.log_queue = LogBuffer(LOG_BUFFER_SIZE)
         self.status_queue = queue.Queue(maxsize=100)
         global log_queue
         log_queue = self.log_queue
@@ -643,6 +4257,8 @@ class ZwCADBatchProcessor:
                                 bg='#f0f8ff', fg='#2c3e50',
                                 wrap=tk.WORD, state=tk.DISABLED)
         self.log_text.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        self.log_text.tag_configure("error", foreground="#dc3545")
+        self.log_text.tag_configure("warning", foreground="#b8860b")
         
         # 滚动条
         log_scroll = tk.Scrollbar(log_frame, command=self.log_text.yview)
@@ -656,7 +4272,7 @@ class ZwCADBatchProcessor:
         """选择DWG文件"""
         try:
             files = filedialog.askopenfilenames(title="请选择需要处理的DWG文件",
-                                                filetypes=[("DWG文件", "*.dwg")])
+                                                filetypes=[("DWG文件", "*.dwg"), ("DXF文件", "*.dxf")])
             if files:
                 self.dwg_files = list(files)
                 file_count = len(self.dwg_files)
@@ -685,6 +4301,7 @@ class ZwCADBatchProcessor:
         self.folder_btn.config(state=tk.DISABLED)
         
         # 清空日志
+        self.log_queue.clear()
         self.log_text.config(state=tk.NORMAL)
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state=tk.DISABLED)
@@ -698,22 +4315,37 @@ class ZwCADBatchProcessor:
                          daemon=True).start()
 
     def append_log(self, msg):
-        """追加日志到文本框（线程安全）"""
+        """追加日志到文本框（仅在主线程调用）"""
+        self.append_logs([(_infer_level(msg), msg)])
+
+    def append_logs(self, records):
+        """一次性追加一批日志：连续的同级别日志合并为一次插入，整批只滚动一次
+
+        文本框只保留最近 LOG_VIEW_MAX_LINES 行，完整日志见日志文件。
+        """
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, msg + "\n")
+        run_tag, run_lines = None, []
+        for level, msg in records:
+            tag = "error" if level >= logging.ERROR else "warning" if level >= logging.WARNING else ""
+            if tag != run_tag and run_lines:
+                self.log_text.insert(tk.END, "\n".join(run_lines) + "\n", run_tag)
+                run_lines = []
+            run_tag = tag
+            run_lines.append(msg)
+        if run_lines:
+            self.log_text.insert(tk.END, "\n".join(run_lines) + "\n", run_tag)
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_VIEW_MAX_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
         self.log_text.see(tk.END)  # 自动滚动到底部
         self.log_text.config(state=tk.DISABLED)
 
     def check_queues(self):
         """轮询队列，更新GUI（非阻塞，避免卡顿）"""
-        # 处理日志队列
-        while not self.log_queue.empty():
-            try:
-                msg_type, content = self.log_queue.get_nowait()
-                if msg_type == "LOG":
-                    self.append_log(content)
-            except queue.Empty:
-                break
+        # 每次最多取 LOG_DRAIN_BATCH 条日志批量显示，其余留到下一次
+        records = self.log_queue.drain(LOG_DRAIN_BATCH)
+        if records:
+            self.append_logs(records)
         
         # 处理状态/进度队列
         while not self.status_queue.empty():
@@ -751,7 +4383,11 @@ class ZwCADBatchProcessor:
             return "#495057"  # 普通-深灰色
 
 # ==========  程序入口  ==========
-if __name__ == '__main__':
+def run_gui():
+    load_gui_modules()
     root = tk.Tk()
     app = ZwCADBatchProcessor(root)
     root.mainloop()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+"""
+离线DXF后端：纯Python读写ASCII DXF，无需CAD和Windows
+由 GetCADAnnotInfoAndWriteBackSeqNo 在处理 .dxf 文件（或 CAD_BACKEND="dxf"）时按需导入
+"""
+
+import math
+import re
+import sys
+
+# 配置项会被 apply_config 重新赋值，须经 seqno.名称 读取；函数与常量直接导入
+import GetCADAnnotInfoAndWriteBackSeqNo as seqno
+from GetCADAnnotInfoAndWriteBackSeqNo import (
+    ANCHOR_CENTER, ANNOTATION_DXF_TYPES, TEXT_ANCHORS, AnnotationMeta, BlockDefinitionCache, CADBackend,
+    _layer_matches, annotation_record, block_layer, diff_labels, dimension_text, is_label_layer, label_number,
+    log_label_diff, log_msg, place_labels)
+
+class DxfDocument:
+    """ASCII DXF 文件的内存表示：按 (组码, 值) 成对保存，写回时保持原有内容不变"""
+    def __init__(self, path):
+        self.path = path
+        raw = open(path, "rb").read()
+        try:
+            text = raw.decode("utf-8-sig")
+            self.encoding = "utf-8"
+        except UnicodeDecodeError:
+            # R2004及更早版本按代码页保存，中文图纸通常为 ANSI_936
+            text = raw.decode("gbk", errors="replace")
+            self.encoding = "gbk"
+        self.newline = "\r\n" if "\r\n" in text[:4096] else "\n"
+        lines = text.splitlines()
+        if len(lines) % 2:
+            lines = lines[:-1]
+        self.tags = [(lines[i].strip(), lines[i + 1]) for i in range(0, len(lines), 2)]
+        self.new_entities = []
+        # 对已有序号的修改：{实体起始下标: (结束下标, (文字, X, Y) 或 None=删除)}
+        self.label_edits = {}
+        # 提取时找到的已有序号 [((起, 止), 序号, X, Y), ...]；None=尚未完整遍历
+        self.existing_labels = None
+        self.version = self.header_value("$ACADVER") or "AC1009"
+
+    def header_value(self, name):
+        for i, (code, value) in enumerate(self.tags):
+            if code == "9" and value.strip() == name:
+                return self.tags[i + 1][1].strip() if i + 1 < len(self.tags) else None
+            if code == "0" and value.strip() == "ENDSEC":
+                return None
+        return None
+
+    def section_range(self, name, tags=None):
+        """返回段内容的 [起, 止) 下标（不含 SECTION/ENDSEC 本身）"""
+        tags = self.tags if tags is None else tags
+        for i in range(len(tags) - 1):
+            if tags[i] == ("0", "SECTION") and tags[i + 1][1].strip() == name:
+                for j in range(i + 2, len(tags)):
+                    if tags[j][0] == "0" and tags[j][1].strip() == "ENDSEC":
+                        return i + 2, j
+        return None
+
+    def iter_entity_spans(self, section="ENTITIES"):
+        """逐个产出 (起, 止, 实体类型, {组码: [值, ...]})，[起, 止) 为实体在 tags 中的下标范围"""
+        bounds = self.section_range(section)
+        if not bounds:
+            return
+        first, end = bounds
+        start, entity_type = None, None
+        group = {}
+        for i in range(first, end):
+            code, value = self.tags[i]
+            if code == "0":
+                if entity_type is not None:
+                    yield start, i, entity_type, group
+                start, entity_type = i, value.strip()
+                group = {}
+            else:
+                group.setdefault(code, []).append(value)
+        if entity_type is not None:
+            yield start, end, entity_type, group
+
+    def iter_entities(self, section="ENTITIES"):
+        """逐个产出 (实体类型, {组码: [值, ...]})"""
+        for _, _, entity_type, group in self.iter_entity_spans(section):
+            yield entity_type, group
+
+    def edited_tags(self):
+        """应用 label_edits 后的组码列表：修改序号文字的内容与位置，或删除整个实体"""
+        tags = []
+        last = 0
+        for start in sorted(self.label_edits):
+            end, edit = self.label_edits[start]
+            tags += self.tags[last:start]
+            if edit is not None:
+                text, x, y = edit
+                values = {"1": text, "10": repr(float(x)), "20": repr(float(y)),
+                          "11": repr(float(x)), "21": repr(float(y))}
+                tags += [(code, values.get(code, value)) for code, value in self.tags[start:end]]
+            last = end
+        tags += self.tags[last:]
+        return tags
+
+    def model_space_handle(self):
+        for entity_type, group in self.iter_entities("TABLES"):
+            if entity_type == "BLOCK_RECORD" and group.get("2", [""])[0].strip().upper() == "*MODEL_SPACE":
+                return group.get("5", [None])[0]
+        return None
+
+    def allocate_handles(self, count):
+        """按 $HANDSEED 分配新句柄（无 HANDSEED 时取现有最大句柄之后）"""
+        seed = self.header_value("$HANDSEED")
+        if seed:
+            start = int(seed, 16)
+        else:
+            start = 1 + max((int(v.strip(), 16) for c, v in self.tags
+                             if c in ("5", "105") and re.fullmatch(r"\s*[0-9A-Fa-f]+\s*", v)), default=0)
+        return [f"{h:X}" for h in range(start, start + count)], f"{start + count:X}"
+
+    def save_as(self, path):
+        tags = self.edited_tags() if self.label_edits else list(self.tags)
+        if self.new_entities:
+            use_handles = self.version > "AC1009"
+            entities = self.new_entities
+            if use_handles:
+                handles, next_seed = self.allocate_handles(len(entities))
+                owner = self.model_space_handle()
+                for i, (code, value) in enumerate(tags):
+                    if code == "9" and value.strip() == "$HANDSEED":
+                        tags[i + 1] = (tags[i + 1][0], next_seed)
+                        break
+            out = []
+            for n, (text, x, y, height, layer, color) in enumerate(entities):
+                out.append(("0", "TEXT"))
+                if use_handles:
+                    out.append(("5", handles[n]))
+                    if owner:
+                        out.append(("330", owner))
+                    out.append(("100", "AcDbEntity"))
+                out += [("8", layer), ("62", str(color))]
+                if use_handles:
+                    out.append(("100", "AcDbText"))
+                out += [("10", repr(float(x))), ("20", repr(float(y))), ("30", "0.0"),
+                        ("40", repr(float(height))), ("1", text)]
+                if use_handles:
+                    out.append(("100", "AcDbText"))
+            _, end = self.section_range("ENTITIES", tags)
+            tags[end:end] = out
+        lines = []
+        for code, value in tags:
+            lines.append(code.rjust(3))
+            lines.append(value)
+        with open(path, "w", encoding=self.encoding, errors="replace", newline="") as f:
+            f.write(self.newline.join(lines) + self.newline)
+
+# 与 ZwCAD 中 extract_annotations 一致的尺寸类型（组码70低3位：0转角 1对齐 3直径 4半径）
+DXF_DIMENSION_KINDS = (0, 1, 3, 4)
+
+def _dxf_text(value):
+    """还原旧版DXF中的 \\U+XXXX 转义"""
+    return re.sub(r"\\U\+([0-9A-Fa-f]{4})", lambda m: chr(int(m.group(1), 16)), value)
+
+def _dxf_float(group, code, default=None):
+    try:
+        return float(group[code][0])
+    except (KeyError, ValueError, IndexError):
+        return default
+
+def _dxf_dimension_measurement(kind, group):
+    """组码42缺失时按定义点计算测量值（转角/对齐/直径/半径）"""
+    measurement = _dxf_float(group, "42")
+    if measurement is not None:
+        return measurement
+    try:
+        if kind in (0, 1):
+            x1, y1 = _dxf_float(group, "13"), _dxf_float(group, "23")
+            x2, y2 = _dxf_float(group, "14"), _dxf_float(group, "24")
+            if kind == 1:
+                return math.hypot(x2 - x1, y2 - y1)
+            angle = math.radians(_dxf_float(group, "50", 0.0))
+            return abs((x2 - x1) * math.cos(angle) + (y2 - y1) * math.sin(angle))
+        x1, y1 = _dxf_float(group, "10"), _dxf_float(group, "20")
+        x2, y2 = _dxf_float(group, "15"), _dxf_float(group, "25")
+        return math.hypot(x2 - x1, y2 - y1)
+    except TypeError:
+        return None
+
+class DxfBackend(CADBackend):
+    """纯Python离线后端：直接读写ASCII DXF，无需CAD和Windows
+
+    读取模型空间的 DIMENSION/TEXT/MTEXT 及块参照（块定义内容与 ATTRIB 属性），序号以 TEXT 实体写入 LABEL_LAYER 图层（颜色 LABEL_COLOR），
+    图层表中不存在该图层时由CAD在打开文件时自动创建。
+    """
+    name = "dxf"
+
+    def open(self, path):
+        return DxfDocument(path)
+
+    @staticmethod
+    def _annotation(entity_type, group):
+        """DIMENSION/TEXT/MTEXT/ATTRIB 的 (标注内容, X, Y)，不是有效标注时返回 None"""
+        if entity_type == "DIMENSION":
+            kind = int(_dxf_float(group, "70", 0)) & 7
+            if kind not in DXF_DIMENSION_KINDS:
+                return None
+            measurement = _dxf_dimension_measurement(kind, group)
+            if measurement is not None:
+                measurement = round(measurement, 8)
+            txt = dimension_text(_dxf_text(group.get("1", [""])[0]), measurement)
+            return txt, _dxf_float(group, "11"), _dxf_float(group, "21")
+        if entity_type == "MTEXT":
+            txt = _dxf_text("".join(group.get("3", [])) + "".join(group.get("1", [])))
+            return txt, _dxf_float(group, "10"), _dxf_float(group, "20")
+        if entity_type in ("TEXT", "ATTRIB"):
+            return _dxf_text(group.get("1", [""])[0]), _dxf_float(group, "10"), _dxf_float(group, "20")
+        return None
+
+    @staticmethod
+    def _label(entity_type, group):
+        """上次回写的序号（LABEL_LAYER 图层上的 (n) 文字）返回 (序号, X, Y)，否则返回 None"""
+        if entity_type != "TEXT" or not is_label_layer(group.get("8", ["0"])[0]):
+            return None
+        seq = label_number(group.get("1", [""])[0])
+        if seq is None:
+            return None
+        return seq, _dxf_float(group, "10", 0.0), _dxf_float(group, "20", 0.0)
+
+    def _scan_labels(self, doc):
+        labels = []
+        for start, end, entity_type, group in doc.iter_entity_spans():
+            label = self._label(entity_type, group)
+            if label is not None and group.get("67", ["0"])[0].strip() != "1":
+                labels.append(((start, end),) + label)
+        return labels
+
+    @staticmethod
+    def _insert_params(group):
+        """INSERT 的 (块名, 插入点, X比例, Y比例, 旋转弧度)"""
+        return (group.get("2", [""])[0].strip(), (_dxf_float(group, "10", 0.0), _dxf_float(group, "20", 0.0)),
+                _dxf_float(group, "41", 1.0), _dxf_float(group, "42", 1.0),
+                math.radians(_dxf_float(group, "50", 0.0)))
+
+    def _block_definitions(self, doc):
+        """BLOCKS 段：{块名: (基点, [(实体类型, 组码), ...])}"""
+        definitions = {}
+        current = None
+        for entity_type, group in doc.iter_entities("BLOCKS"):
+            if entity_type == "BLOCK":
+                current = []
+                origin = (_dxf_float(group, "10", 0.0), _dxf_float(group, "20", 0.0))
+                definitions[group.get("2", [""])[0].strip()] = (origin, current)
+            elif entity_type == "ENDBLK":
+                current = None
+            elif current is not None:
+                current.append((entity_type, group))
+        return definitions
+
+    def iter_annotations(self, doc, stats=None):
+        """逐条产出 (标注内容, X, Y, 附加信息)，与 ZwCAD 的 iter_annotations 一致"""
+        blocks = None
+        if seqno.EXTRACT_BLOCKS:
+            definitions = None
+
+            def read_definition(name):
+                nonlocal definitions
+                if definitions is None:
+                    definitions = self._block_definitions(doc)
+                origin, entities = definitions.get(name, ((0.0, 0.0), []))
+                items = []
+                for entity_type, group in entities:
+                    if entity_type == "INSERT":
+                        inner, (x, y), scale_x, scale_y, rotation = self._insert_params(group)
+                        items.append(("insert", inner, x, y, scale_x, scale_y, rotation,
+                                      sys.intern(group.get("8", ["0"])[0].strip())))
+                    elif entity_type != "ATTRIB":
+                        annotation = self._annotation(entity_type, group)
+                        if annotation is not None:
+                            items.append(("annotation",) + annotation
+                                         + (entity_type, sys.intern(group.get("8", ["0"])[0].strip())))
+                return origin, items
+            blocks = BlockDefinitionCache(read_definition)
+
+        insert_accepted = False
+        insert_layer = None
+        labels = []
+        for start, end, entity_type, group in doc.iter_entity_spans():
+            if stats is not None:
+                stats["entities"] = stats.get("entities", 0) + 1
+            if entity_type == "ATTRIB":
+                # 属性紧跟在所属的块参照之后，随块参照一起筛选；跳过不可见属性
+                if not insert_accepted or int(_dxf_float(group, "70", 0)) & 1:
+                    continue
+            else:
+                insert_accepted = False
+                if entity_type not in ANNOTATION_DXF_TYPES and not (blocks is not None and entity_type == "INSERT"):
+                    continue
+                if group.get("67", ["0"])[0].strip() == "1":
+                    continue  # 图纸空间
+                label = self._label(entity_type, group)
+                if label is not None:
+                    labels.append(((start, end),) + label)
+                    continue
+                # 块参照不按自身图层过滤，展开后按块内实体的图层过滤
+                if (seqno.EXTRACT_LAYERS and entity_type != "INSERT"
+                        and not _layer_matches(group.get("8", ["0"])[0].strip(), seqno.EXTRACT_LAYERS)):
+                    continue
+
+            handle = group.get("5", [""])[0].strip() or None
+            layer = sys.intern(group.get("8", ["0"])[0].strip())
+            if entity_type == "INSERT":
+                insert_accepted = True
+                insert_layer = layer
+                found = []
+                for txt, x, y, entity, inner_layer in blocks.instance_annotations(*self._insert_params(group)):
+                    inner_layer = block_layer(inner_layer, insert_layer)
+                    if seqno.EXTRACT_LAYERS and not _layer_matches(inner_layer, seqno.EXTRACT_LAYERS):
+                        continue
+                    meta = AnnotationMeta(entity, inner_layer, handle) if seqno.EXTRACT_METADATA else None
+                    found.append((txt, x, y, meta, TEXT_ANCHORS.get(entity, ANCHOR_CENTER)))
+            else:
+                if entity_type == "ATTRIB":
+                    layer = block_layer(layer, insert_layer)
+                    if seqno.EXTRACT_LAYERS and not _layer_matches(layer, seqno.EXTRACT_LAYERS):
+                        continue
+                annotation = self._annotation(entity_type, group)
+                if annotation is None:
+                    continue
+                meta = None
+                if seqno.EXTRACT_METADATA:
+                    meta = AnnotationMeta(entity_type, layer, handle)
+                found = [annotation + (meta, TEXT_ANCHORS.get(entity_type, ANCHOR_CENTER))]
+
+            for txt, x, y, meta, anchor in found:
+                record = annotation_record(txt, x, y, meta, anchor)
+                if record is not None:
+                    yield record
+        if blocks is not None and blocks.instances:
+            log_msg(f"  {blocks.summary()}")
+        doc.existing_labels = labels
+
+    def add_labels(self, doc, data):
+        wanted = [(seq, x, y) for seq, (x, y) in enumerate(place_labels(data), 1)]
+        existing = []
+        if seqno.INCREMENTAL_LABELS:
+            existing = doc.existing_labels if doc.existing_labels is not None else self._scan_labels(doc)
+        kept, updates, adds, deletes = diff_labels(existing, wanted)
+        log_label_diff(existing, kept, updates, adds, deletes)
+        for (start, end), i, _, _ in updates:
+            seq, x, y = wanted[i]
+            doc.label_edits[start] = (end, (f"({seq})", x, y))
+        for start, end in deletes:
+            doc.label_edits[start] = (end, None)
+        for i in adds:
+            seq, x, y = wanted[i]
+            doc.new_entities.append((f"({seq})", x, y, seqno.TEXT_HEIGHT, seqno.LABEL_LAYER, seqno.LABEL_COLOR))
+        return len(wanted)
+
+    def save_as(self, doc, path):
+        doc.save_as(path)
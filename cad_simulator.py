@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+
+"""
+模拟CAD：实现本工具用到的ZwCAD COM对象模型子集，可注入延迟、忙拒绝、崩溃与卡死（无CAD环境下测试/压测）
+由 GetCADAnnotInfoAndWriteBackSeqNo 在 SIMULATE_CAD 模式及基准测试中按需导入
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import time
+
+# 配置项会被 apply_config 重新赋值，须经 seqno.名称 读取；函数与常量直接导入
+import GetCADAnnotInfoAndWriteBackSeqNo as seqno
+from GetCADAnnotInfoAndWriteBackSeqNo import (
+    BLOCK_REFERENCE_ENTITY_NAME, RPC_E_CALL_REJECTED, RPC_S_SERVER_UNAVAILABLE, _layer_matches)
+
+# 模拟CAD进程的初始内存（MB）
+SIM_BASE_MEMORY_MB = 200
+
+class SimulatedComError(Exception):
+    """模拟 pywintypes.com_error，args 为 (hresult, 描述, excepinfo, argerr)"""
+    def __init__(self, hresult, message):
+        super().__init__(hresult, message, None, None)
+        self.hresult = hresult
+
+class SimulationProfile:
+    """模拟参数：每次COM调用延迟/抖动（秒）、忙拒绝概率、第N次调用后崩溃、第N次调用后卡死、
+    启动耗时、打开文档的每实体耗时、每打开/新建一个文档增加的进程内存（MB，关闭后不释放）"""
+    def __init__(self, latency=0.0, jitter=0.0, busy_rate=0.0, crash_after=None,
+                 startup_time=0.0, open_latency_per_entity=0.0, seed=0, hang_after=None,
+                 memory_per_document_mb=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.busy_rate = busy_rate
+        self.crash_after = crash_after
+        self.startup_time = startup_time
+        self.open_latency_per_entity = open_latency_per_entity
+        self.seed = seed
+        self.hang_after = hang_after
+        self.memory_per_document_mb = memory_per_document_mb
+
+class _SimCore:
+    """同一模拟CAD实例共享的调用计数、延迟注入和故障注入"""
+    def __init__(self, profile):
+        self.profile = profile
+        self.random = random.Random(profile.seed)
+        self.calls = 0
+        self.rejected = 0
+        self.crashed = False
+        self.started_at = time.perf_counter()
+        self.documents_opened = 0
+
+    @property
+    def memory_mb(self):
+        return SIM_BASE_MEMORY_MB + self.profile.memory_per_document_mb * self.documents_opened
+
+    def tick(self, name):
+        if self.crashed:
+            raise SimulatedComError(RPC_S_SERVER_UNAVAILABLE, f"RPC服务器不可用（{name}）")
+        self.calls += 1
+        profile = self.profile
+        if profile.crash_after is not None and self.calls > profile.crash_after:
+            self.crashed = True
+            raise SimulatedComError(RPC_S_SERVER_UNAVAILABLE, f"CAD进程已崩溃（{name}）")
+        if profile.hang_after is not None and self.calls > profile.hang_after:
+            # 与卡死的COM调用一样永不返回，只能由看门狗结束所在进程
+            while True:
+                time.sleep(1)
+        delay = profile.latency + (self.random.uniform(0, profile.jitter) if profile.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if profile.busy_rate and self.random.random() < profile.busy_rate:
+            self.rejected += 1
+            raise SimulatedComError(RPC_E_CALL_REJECTED, f"应用程序正忙，调用被拒绝（{name}）")
+
+class _SimObject:
+    """属性读写都计为一次跨进程调用；不存在的属性与后期绑定的COM一样抛出 AttributeError"""
+    _kind = "Object"
+    # 主脚本据此把模拟对象当作COM对象处理（见 is_simulated），无需导入本模块
+    _simulated = True
+
+    def __init__(self, core, **props):
+        object.__setattr__(self, "_core", core)
+        object.__setattr__(self, "_props", props)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        self._core.tick(f"{self._kind}.{name}")
+        try:
+            return self._props[name]
+        except KeyError:
+            raise AttributeError(f"<unknown>.{name}")
+
+    def __setattr__(self, name, value):
+        self._core.tick(f"{self._kind}.{name}")
+        self._props[name] = value
+
+def _sim_values(arg):
+    """取出 VARIANT 或普通序列中的值"""
+    return list(getattr(arg, "value", arg) or [])
+
+# 模拟实体类型与DXF名称（选择集过滤用）的对应关系
+SIM_DXF_NAMES = {"AcDbText": "TEXT", "AcDbMText": "MTEXT", "AcDbLine": "LINE", "AcDbArc": "ARC",
+                 "AcDbCircle": "CIRCLE", "AcDbPolyline": "LWPOLYLINE", "AcDbBlockReference": "INSERT"}
+
+def _sim_dxf_name(entity_name):
+    if entity_name.endswith("Dimension"):
+        return "DIMENSION"
+    return SIM_DXF_NAMES.get(entity_name, entity_name.replace("AcDb", "").upper())
+
+class SimEntity(_SimObject):
+    _kind = "Entity"
+
+    def __init__(self, core, doc, record):
+        props = {"EntityName": record["type"], "ObjectName": record["type"],
+                 "Layer": record.get("layer", "0"), "Handle": record["handle"], "Color": record.get("color", 256)}
+        x, y = record.get("x", 0.0), record.get("y", 0.0)
+        definition_point = None
+        if record["type"].endswith("Dimension"):
+            props.update(TextOverride=record.get("override", ""), Measurement=record.get("measurement", 0.0),
+                         TextPosition=(x, y, 0.0))
+            # 定义点（DXF组码10）：选择集的坐标过滤按它比较，不是文字位置
+            definition_point = (record.get("def_x", x), record.get("def_y", y), 0.0)
+        elif record["type"] in ("AcDbText", "AcDbMText"):
+            props.update(TextString=record.get("text", ""), InsertionPoint=(x, y, 0.0),
+                         Height=record.get("height", seqno.TEXT_HEIGHT), StyleName=record.get("style", "Standard"))
+        elif record["type"] == BLOCK_REFERENCE_ENTITY_NAME:
+            props.update(Name=record["name"], InsertionPoint=(x, y, 0.0),
+                         XScaleFactor=record.get("scale_x", 1.0), YScaleFactor=record.get("scale_y", 1.0),
+                         Rotation=record.get("rotation", 0.0), HasAttributes=bool(record.get("attributes")))
+        super().__init__(core, **props)
+        object.__setattr__(self, "_doc", doc)
+        object.__setattr__(self, "_definition_point", definition_point)
+        object.__setattr__(self, "_attributes", [
+            _SimObject(core, EntityName="AcDbAttribute", TagString=a.get("tag", ""), TextString=a.get("text", ""),
+                       InsertionPoint=(a.get("x", 0.0), a.get("y", 0.0), 0.0), Invisible=a.get("invisible", False),
+                       Layer=a.get("layer", "0"), Handle=a.get("handle", ""))
+            for a in record.get("attributes", ())])
+
+    def GetAttributes(self):
+        self._core.tick("Entity.GetAttributes")
+        return tuple(self._attributes)
+
+    def Update(self):
+        self._core.tick("Entity.Update")
+
+    def Delete(self):
+        self._core.tick("Entity.Delete")
+        self._doc._entities.remove(self)
+
+    def _record(self):
+        p = self._props
+        record = {"type": p["EntityName"], "layer": p["Layer"], "handle": p["Handle"], "color": p["Color"]}
+        if "TextPosition" in p:
+            record.update(override=p["TextOverride"], measurement=p["Measurement"],
+                          x=p["TextPosition"][0], y=p["TextPosition"][1],
+                          def_x=self._definition_point[0], def_y=self._definition_point[1])
+        elif "TextString" in p:
+            record.update(text=p["TextString"], x=p["InsertionPoint"][0], y=p["InsertionPoint"][1],
+                          height=p["Height"], style=p["StyleName"])
+        elif p["EntityName"] == BLOCK_REFERENCE_ENTITY_NAME:
+            record.update(name=p["Name"], x=p["InsertionPoint"][0], y=p["InsertionPoint"][1],
+                          scale_x=p["XScaleFactor"], scale_y=p["YScaleFactor"], rotation=p["Rotation"])
+            record["attributes"] = [
+                {"tag": a._props["TagString"], "text": a._props["TextString"], "x": a._props["InsertionPoint"][0],
+                 "y": a._props["InsertionPoint"][1], "invisible": a._props["Invisible"],
+                 "layer": a._props["Layer"], "handle": a._props["Handle"]} for a in self._attributes]
+        return record
+
+class _SimCollection(_SimObject):
+    """TextStyles / Layers 等按名称查找的集合"""
+    def __init__(self, core, kind, names, item_props=None):
+        super().__init__(core)
+        object.__setattr__(self, "_kind", kind)
+        object.__setattr__(self, "_items", [_SimObject(core, Name=n, **(item_props or {})) for n in names])
+        object.__setattr__(self, "_item_props", item_props or {})
+
+    @property
+    def Count(self):
+        self._core.tick(f"{self._kind}.Count")
+        return len(self._items)
+
+    def Item(self, key):
+        self._core.tick(f"{self._kind}.Item")
+        if isinstance(key, int):
+            return self._items[key]
+        for item in self._items:
+            if item._props["Name"].lower() == str(key).lower():
+                return item
+        raise SimulatedComError(-2145386476, f"{self._kind}中不存在「{key}」")
+
+    def Add(self, name):
+        self._core.tick(f"{self._kind}.Add")
+        item = _SimObject(self._core, Name=name, **self._item_props)
+        self._items.append(item)
+        return item
+
+    def __iter__(self):
+        for item in list(self._items):
+            self._core.tick(f"{self._kind}.Next")
+            yield item
+
+class SimBlock(_SimObject):
+    """块定义：基点与定义内的实体"""
+    _kind = "Block"
+
+    def __init__(self, core, doc, name, definition):
+        origin = definition.get("origin", (0.0, 0.0))
+        super().__init__(core, Name=name, Origin=(origin[0], origin[1], 0.0))
+        object.__setattr__(self, "_entities", [SimEntity(core, doc, dict(record, handle=record.get("handle", "0")))
+                                               for record in definition.get("entities", ())])
+
+    @property
+    def Count(self):
+        self._core.tick("Block.Count")
+        return len(self._entities)
+
+    def __iter__(self):
+        for entity in list(self._entities):
+            self._core.tick("Block.Next")
+            yield entity
+
+class SimBlocks(_SimObject):
+    _kind = "Blocks"
+
+    def __init__(self, core, doc, definitions):
+        super().__init__(core)
+        object.__setattr__(self, "_blocks", {name.upper(): SimBlock(core, doc, name, definition)
+                                             for name, definition in definitions.items()})
+
+    def Item(self, name):
+        self._core.tick("Blocks.Item")
+        try:
+            return self._blocks[str(name).upper()]
+        except KeyError:
+            raise SimulatedComError(-2145386476, f"块「{name}」不存在")
+
+def _parse_sim_filter(pairs, closer=None):
+    """把 (组码, 值) 序列解析为条件列表；-4 的 <OR/<AND 分组递归解析，关系运算符与其后的组码10合为一项"""
+    terms = []
+    for code, value in pairs:
+        if code != -4:
+            terms.append((code, value))
+            continue
+        operator = str(value).upper()
+        if operator == closer:
+            return terms
+        if operator in ("<OR", "<AND"):
+            terms.append((operator[1:], _parse_sim_filter(pairs, operator[1:] + ">")))
+        elif "," in operator:
+            _, point = next(pairs)
+            terms.append(("RELATION", (operator.split(","), _sim_values(point))))
+    return terms
+
+_SIM_RELATIONS = {"*": lambda a, b: True, "=": lambda a, b: a == b, "!=": lambda a, b: a != b,
+                  "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b,
+                  ">=": lambda a, b: a >= b}
+
+def _sim_filter_matches(terms, entity, any_of=False):
+    results = (_sim_term_matches(code, value, entity) for code, value in terms)
+    return any(results) if any_of else all(results)
+
+def _sim_term_matches(code, value, entity):
+    p = entity._props
+    if code in ("OR", "AND"):
+        return _sim_filter_matches(value, entity, any_of=code == "OR")
+    if code == 0:
+        return _sim_dxf_name(p["EntityName"]) in {t.strip() for t in str(value).upper().split(",")}
+    if code == 8:
+        return _layer_matches(p["Layer"], [name.strip() for name in str(value).split(",")])
+    if code == "RELATION":
+        # 组码10：尺寸为定义点，文字/块参照为插入点
+        operators, point = value
+        base = entity._definition_point or p.get("InsertionPoint") or (0.0, 0.0, 0.0)
+        return all(_SIM_RELATIONS[op](b, v) for op, b, v in zip(operators, base, point))
+    return True  # 410 等：模拟图纸只有模型空间
+
+class SimSelectionSet(_SimObject):
+    _kind = "SelectionSet"
+
+    def __init__(self, core, doc, name):
+        super().__init__(core, Name=name)
+        object.__setattr__(self, "_doc", doc)
+        object.__setattr__(self, "_items", [])
+
+    @property
+    def Count(self):
+        self._core.tick("SelectionSet.Count")
+        return len(self._items)
+
+    def Select(self, mode, point1=None, point2=None, filter_type=None, filter_data=None):
+        """支持“全部”模式和选择集过滤常用组码：0类型、8图层、410空间、-4 的 <OR/<AND 分组与10坐标关系比较"""
+        self._core.tick("SelectionSet.Select")
+        terms = _parse_sim_filter(iter(zip(_sim_values(filter_type), _sim_values(filter_data))))
+        for entity in self._doc._entities:
+            if _sim_filter_matches(terms, entity):
+                self._items.append(entity)
+
+    def Delete(self):
+        self._core.tick("SelectionSet.Delete")
+        self._doc._selection_sets.pop(self._props["Name"].upper(), None)
+
+    def __iter__(self):
+        for entity in list(self._items):
+            self._core.tick("SelectionSet.Next")
+            yield entity
+
+class SimSelectionSets(_SimObject):
+    _kind = "SelectionSets"
+
+    def __init__(self, core, doc):
+        super().__init__(core)
+        object.__setattr__(self, "_doc", doc)
+
+    def Add(self, name):
+        self._core.tick("SelectionSets.Add")
+        if name.upper() in self._doc._selection_sets:
+            raise SimulatedComError(-2145320851, f"选择集「{name}」已存在")
+        selection_set = SimSelectionSet(self._core, self._doc, name)
+        self._doc._selection_sets[name.upper()] = selection_set
+        return selection_set
+
+    def Item(self, name):
+        self._core.tick("SelectionSets.Item")
+        try:
+            return self._doc._selection_sets[str(name).upper()]
+        except KeyError:
+            raise SimulatedComError(-2145386476, f"选择集「{name}」不存在")
+
+class SimModelSpace(_SimObject):
+    _kind = "ModelSpace"
+
+    def __init__(self, core, doc):
+        super().__init__(core)
+        object.__setattr__(self, "_doc", doc)
+
+    @property
+    def Count(self):
+        self._core.tick("ModelSpace.Count")
+        return len(self._doc._entities)
+
+    def Item(self, index):
+        self._core.tick("ModelSpace.Item")
+        return self._doc._entities[index]
+
+    def AddText(self, text, point, height):
+        self._core.tick("ModelSpace.AddText")
+        x, y = _sim_values(point)[:2]
+        doc = self._doc
+        record = {"type": "AcDbText", "text": text, "x": x, "y": y, "height": height,
+                  "layer": doc._props["ActiveLayer"]._props["Name"],
+                  "style": doc._props["ActiveTextStyle"]._props["Name"],
+                  "handle": doc._new_handle()}
+        entity = SimEntity(self._core, doc, record)
+        color = doc._variables["CECOLOR"].upper()
+        entity._props["Color"] = int(color) if color.isdigit() else {"BYBLOCK": 0}.get(color, 256)
+        doc._entities.append(entity)
+        return entity
+
+    def __iter__(self):
+        for entity in list(self._doc._entities):
+            self._core.tick("ModelSpace.Next")
+            yield entity
+
+class SimDocument(_SimObject):
+    _kind = "Document"
+
+    def __init__(self, core, app, path, records, blocks=None):
+        name = os.path.basename(path) if path else "Drawing1.dwg"
+        super().__init__(core, Name=name, FullName=path or "")
+        object.__setattr__(self, "_app", app)
+        object.__setattr__(self, "_block_definitions", blocks or {})
+        object.__setattr__(self, "_entities", [])
+        object.__setattr__(self, "_selection_sets", {})
+        object.__setattr__(self, "_next_handle", 0x100)
+        object.__setattr__(self, "_variables", {"CECOLOR": "BYLAYER"})
+        for record in records:
+            record = dict(record)
+            record.setdefault("handle", self._new_handle())
+            self._entities.append(SimEntity(core, self, record))
+        text_styles = _SimCollection(core, "TextStyles", ["Standard"], {"FontFile": "txt.shx", "BigFontFile": "", "Height": 0.0})
+        layers = _SimCollection(core, "Layers", ["0"], {"Color": 7})
+        self._props.update(ModelSpace=SimModelSpace(core, self), TextStyles=text_styles, Layers=layers,
+                           SelectionSets=SimSelectionSets(core, self), Blocks=SimBlocks(core, self, blocks or {}),
+                           ActiveLayer=layers._items[0], ActiveTextStyle=text_styles._items[0])
+
+    def _new_handle(self):
+        handle = f"{self._next_handle:X}"
+        object.__setattr__(self, "_next_handle", self._next_handle + 1)
+        return handle
+
+    def Regen(self, which=True):
+        self._core.tick("Document.Regen")
+
+    def GetVariable(self, name):
+        self._core.tick("Document.GetVariable")
+        return self._variables[name.upper()]
+
+    def SetVariable(self, name, value):
+        self._core.tick("Document.SetVariable")
+        self._variables[name.upper()] = value
+
+    def SaveAs(self, path):
+        """保存为JSON格式的模拟图纸，可再次被 Documents.Open 读取"""
+        self._core.tick("Document.SaveAs")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"entities": [e._record() for e in self._entities], "blocks": self._block_definitions},
+                      f, ensure_ascii=False)
+        self._props.update(FullName=path, Name=os.path.basename(path))
+
+    def Close(self, save_changes=False):
+        self._core.tick("Document.Close")
+        self._app._docs.remove(self)
+
+class SimDocuments(_SimObject):
+    _kind = "Documents"
+
+    def __init__(self, core, app):
+        super().__init__(core)
+        object.__setattr__(self, "_app", app)
+
+    @property
+    def Count(self):
+        self._core.tick("Documents.Count")
+        return len(self._app._docs)
+
+    def Item(self, index):
+        self._core.tick("Documents.Item")
+        return self._app._docs[index]
+
+    def Open(self, path):
+        self._core.tick("Documents.Open")
+        records, blocks = load_synthetic_drawing(path)
+        self._core.documents_opened += 1
+        if self._core.profile.open_latency_per_entity:
+            time.sleep(self._core.profile.open_latency_per_entity * len(records))
+        doc = SimDocument(self._core, self._app, path, records, blocks)
+        self._app._docs.append(doc)
+        return doc
+
+    def Add(self):
+        self._core.tick("Documents.Add")
+        self._core.documents_opened += 1
+        doc = SimDocument(self._core, self._app, "", [])
+        self._app._docs.append(doc)
+        return doc
+
+    def __iter__(self):
+        for doc in list(self._app._docs):
+            self._core.tick("Documents.Next")
+            yield doc
+
+class SimulatedCADApplication(_SimObject):
+    """模拟ZwCAD Application：实现本工具用到的COM对象模型子集，并可注入延迟、忙拒绝和崩溃
+
+    Documents.Open 读取 save_synthetic_drawing 生成的JSON图纸；其它路径按路径名生成确定的合成图纸。
+    """
+    _kind = "Application"
+
+    def __init__(self, profile=None):
+        core = _SimCore(profile or SimulationProfile())
+        super().__init__(core, Visible=False, Name="ZWCAD (simulated)")
+        object.__setattr__(self, "_docs", [])
+        self._props["Documents"] = SimDocuments(core, self)
+
+    @property
+    def ActiveDocument(self):
+        self._core.tick("Application.ActiveDocument")
+        return self._docs[-1] if self._docs else None
+
+    @property
+    def call_count(self):
+        return self._core.calls
+
+    @property
+    def memory_mb(self):
+        """模拟的CAD进程内存（不计为COM调用）"""
+        return self._core.memory_mb
+
+    def GetZcadState(self):
+        self._core.tick("Application.GetZcadState")
+        quiescent = time.perf_counter() - self._core.started_at >= self._core.profile.startup_time
+        return _SimObject(self._core, IsQuiescent=quiescent)
+
+    def Quit(self):
+        self._core.tick("Application.Quit")
+        self._docs.clear()
+        self._core.crashed = True
+
+def synthetic_block_definitions():
+    """合成图纸的块定义：标准详图块 DETAIL（尺寸、文字、嵌套的标记块 MARK）"""
+    return {
+        "DETAIL": {"origin": [0.0, 0.0], "entities": [
+            {"type": "AcDbRotatedDimension", "layer": "DIM", "measurement": 20.0, "override": "%%c20",
+             "x": 5.0, "y": 2.0},
+            {"type": "AcDbAlignedDimension", "layer": "DIM", "measurement": 35.5, "override": "", "x": 12.0, "y": 8.0},
+            {"type": "AcDbText", "layer": "TEXT", "text": "详图", "x": 0.0, "y": 15.0},
+            {"type": "AcDbLine", "layer": "0", "x": 0.0, "y": 0.0},
+            {"type": "AcDbCircle", "layer": "0", "x": 10.0, "y": 10.0},
+            {"type": BLOCK_REFERENCE_ENTITY_NAME, "layer": "0", "name": "MARK", "x": 20.0, "y": 0.0},
+        ]},
+        "MARK": {"origin": [0.0, 0.0], "entities": [
+            {"type": "AcDbText", "layer": "TEXT", "text": "M8", "x": 1.0, "y": 1.0},
+            {"type": "AcDbCircle", "layer": "0", "x": 0.0, "y": 0.0},
+        ]},
+    }
+
+def generate_synthetic_drawing(n_dimensions=200, n_texts=100, n_other=2000, seed=0, extent=1000.0, n_block_refs=0):
+    """生成合成图纸的实体记录列表（尺寸、文字、以及占多数的线/圆弧等非标注实体）
+
+    n_block_refs 为 DETAIL 块参照的数量（随机比例与旋转，各带一个编号属性），
+    块定义见 synthetic_block_definitions。
+    """
+    rnd = random.Random(seed)
+    dim_types = ("AcDbRotatedDimension", "AcDbAlignedDimension", "AcDbRadialDimension", "AcDbDiametricDimension")
+    texts = ("Φ20", "R5", "±0.05", "2X45°", "M8", "技术要求", "A-A")
+    records = []
+    for _ in range(n_dimensions):
+        measurement = round(rnd.uniform(1, 500), rnd.choice((0, 1, 2)))
+        x, y = rnd.uniform(0, extent), rnd.uniform(0, extent)
+        # 定义点在被测对象上，文字在其上方的尺寸线处
+        records.append({"type": rnd.choice(dim_types), "layer": "DIM", "measurement": measurement,
+                        "override": rnd.choice(("", "", "", f"%%c{measurement:g}")),
+                        "x": x, "y": y, "def_x": x, "def_y": y - 10.0})
+    for _ in range(n_texts):
+        records.append({"type": rnd.choice(("AcDbText", "AcDbMText")), "layer": "TEXT",
+                        "text": rnd.choice(texts), "x": rnd.uniform(0, extent), "y": rnd.uniform(0, extent)})
+    for _ in range(n_other):
+        records.append({"type": rnd.choice(("AcDbLine", "AcDbArc", "AcDbCircle", "AcDbPolyline")),
+                        "layer": "0", "x": rnd.uniform(0, extent), "y": rnd.uniform(0, extent)})
+    for i in range(n_block_refs):
+        x, y = rnd.uniform(0, extent), rnd.uniform(0, extent)
+        scale = rnd.choice((1.0, 0.5, 2.0))
+        records.append({"type": BLOCK_REFERENCE_ENTITY_NAME, "layer": "0", "name": "DETAIL", "x": x, "y": y,
+                        "scale_x": scale, "scale_y": scale, "rotation": rnd.choice((0.0, math.pi / 2, math.pi)),
+                        "attributes": [{"tag": "NO", "text": f"D-{i + 1}", "x": x, "y": y - 5.0}]})
+    rnd.shuffle(records)
+    return records
+
+def save_synthetic_drawing(path, records, blocks=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"entities": records, "blocks": blocks or {}}, f, ensure_ascii=False)
+
+def load_synthetic_drawing(path):
+    """读取JSON模拟图纸，返回 (实体记录, 块定义)；文件不存在或不是JSON时按路径生成确定的合成图纸"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            drawing = json.load(f)
+        return drawing["entities"], drawing.get("blocks", {})
+    except (OSError, ValueError, KeyError):
+        seed = int(hashlib.md5(path.encode("utf-8")).hexdigest()[:8], 16)
+        return generate_synthetic_drawing(seed=seed), {}
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import GetCADAnnotInfoAndWriteBackSeqNo as seqno_module
+from cad_simulator import generate_synthetic_drawing, save_synthetic_drawing
+
+
+@pytest.fixture
+def seqno():
+    """被测模块；用例中修改的配置项在结束后恢复"""
+    names = seqno_module.USER_SETTING_NAMES + ("COORD_DECIMALS",)
+    saved = {name: getattr(seqno_module, name) for name in names}
+    yield seqno_module
+    for name, value in saved.items():
+        setattr(seqno_module, name, value)
+
+
+@pytest.fixture
+def batch(seqno, tmp_path):
+    """模拟CAD批处理：输入目录、输出目录与不依赖机器环境的配置"""
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    config = {
+        "SIMULATE_CAD": True,
+        "SIMULATION_PROFILE": {"latency": 0.0, "startup_time": 0.0},
+        "WORK_DIR": str(tmp_path / "output"),
+        "WORKER_COUNT": 1,
+        "FILE_TIMEOUT": None,
+        "FILE_RETRIES": 1,
+        "CACHE_DIR": str(tmp_path / "cache"),
+        "STORE_ENABLED": False,
+        "METRICS_EXPORT": False,
+    }
+    os.makedirs(config["WORK_DIR"])
+    # process_batch 结束后恢复配置，读取输出时使用同一输出目录
+    seqno.WORK_DIR = config["WORK_DIR"]
+
+    def make_drawings(sizes, seed=0):
+        paths = []
+        for i, n_dimensions in enumerate(sizes):
+            path = str(input_dir / f"d{i}.dwg")
+            save_synthetic_drawing(path, generate_synthetic_drawing(
+                n_dimensions, 0, 20, seed=seed + i, extent=100.0))
+            paths.append(path)
+        return paths
+
+    def run(paths, **overrides):
+        return seqno.process_batch(paths, dict(config, **overrides))
+
+    return make_drawings, run
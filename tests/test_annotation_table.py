@@ -0,0 +1,44 @@
+import pickle
+
+
+def test_table_behaves_like_tuple_list(seqno):
+    rows = [("Φ20", 1.234, 2.0), ("R5", 3.0, 4.567), ("Φ20", 5.0, 6.0)]
+    data = seqno.AnnotationTable(rows)
+    # 坐标加入时按 COORD_DECIMALS 取整，重复文字只保存一次
+    assert list(data) == [("Φ20", 1.23, 2.0), ("R5", 3.0, 4.57), ("Φ20", 5.0, 6.0)]
+    assert len(data) == 3
+    assert data[1] == ("R5", 3.0, 4.57)
+    assert data.strings == ["Φ20", "R5"]
+    assert data.texts() == ["Φ20", "R5", "Φ20"]
+    assert list(data[1:]) == list(data)[1:]
+    assert list(data.take([2, 0])) == [list(data)[2], list(data)[0]]
+    assert seqno.AnnotationTable.coerce(data) is data
+    assert list(seqno.AnnotationTable.coerce(rows)) == list(data)
+
+
+def test_meta_column_is_created_lazily(seqno):
+    data = seqno.AnnotationTable([("a", 0.0, 0.0), ("b", 1.0, 1.0)])
+    assert data.meta is None
+    meta = seqno.AnnotationMeta("AcDbText", "TEXT", "1F")
+    data.append("c", 2.0, 2.0, meta)
+    assert data.meta == [None, None, meta]
+    assert data.take([2]).meta == [meta]
+    assert data[:2].meta == [None, None]
+
+
+def test_table_survives_pickling(seqno):
+    meta = seqno.AnnotationMeta("AcDbMText", "TEXT", "2A")
+    data = seqno.AnnotationTable([("a", 0.0, 0.0), ("b", 1.0, 1.0, meta, seqno.ANCHOR_UPPER_LEFT)])
+    copy = pickle.loads(pickle.dumps(data))
+    assert list(copy) == list(data)
+    assert list(copy.anchors) == list(data.anchors)
+    assert repr(copy.meta[1]) == repr(meta)
+    # 还原后的文字表可以继续追加
+    copy.append("a", 2.0, 2.0)
+    assert copy.strings == ["a", "b"]
+
+
+def test_table_uses_less_memory_than_tuples(seqno):
+    result = seqno.benchmark_annotation_table(n=20000, distinct=50)
+    assert result["annotations"] == 20000
+    assert result["table_mb"] < result["tuples_mb"]
@@ -0,0 +1,25 @@
+import functools
+import json
+
+from cad_simulator import SimulationProfile
+
+
+def test_benchmarks_run_with_small_inputs(seqno):
+    assert seqno.benchmark_text_normalization(n=200, distinct=20)["texts"] == 200
+    assert seqno.benchmark_annotation_table(n=1000, distinct=20)["annotations"] == 1000
+    assert seqno.benchmark_label_placement(n=200)["labels"] == 200
+    result = seqno.benchmark_simulated_batch(n_files=2, profile=SimulationProfile(),
+                                             n_dimensions=5, n_texts=5, n_other=10)
+    assert result["files"] == 2 and result["failures"] == 0
+    assert result["labels"] == result["annotations"] > 0
+
+
+def test_benchmark_cli_prints_json(seqno, monkeypatch, capsys):
+    monkeypatch.setitem(seqno.BENCHMARKS, "labels", functools.partial(seqno.benchmark_label_placement, n=100))
+    monkeypatch.setitem(seqno.BENCHMARKS, "table",
+                        functools.partial(seqno.benchmark_annotation_table, n=100, distinct=10))
+    assert seqno.main(["--benchmark", "labels"]) == 0
+    assert list(json.loads(capsys.readouterr().out)) == ["labels"]
+    monkeypatch.setattr(seqno, "BENCHMARKS", {name: seqno.BENCHMARKS[name] for name in ("labels", "table")})
+    assert seqno.main(["--benchmark"]) == 0
+    assert list(json.loads(capsys.readouterr().out)) == ["labels", "table"]
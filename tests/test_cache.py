@@ -0,0 +1,86 @@
+import json
+import os
+
+
+def output_records(seqno, path):
+    with open(os.path.join(seqno.WORK_DIR, os.path.basename(path)), encoding="utf-8") as f:
+        return json.load(f)["entities"]
+
+
+def test_unchanged_drawings_restore_cached_output(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 10])
+    first = run(paths)
+    outputs = [output_records(seqno, path) for path in paths]
+    for path in paths:
+        os.remove(os.path.join(seqno.WORK_DIR, os.path.basename(path)))
+
+    second = run(paths)
+    assert [r["status"] for r in second["files"]] == ["cached"] * 2
+    assert [r["labels"] for r in second["files"]] == [r["labels"] for r in first["files"]]
+    # 回写后的图纸从缓存复制回输出目录
+    assert [output_records(seqno, path) for path in paths] == outputs
+
+
+def test_changed_settings_invalidate_cache(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5])
+    run(paths)
+    assert run(paths)["files"][0]["status"] == "cached"
+    assert run(paths, TEXT_HEIGHT=7.0)["files"][0]["status"] == "done"
+    # 不影响结果的配置项不参与缓存键
+    assert run(paths, TEXT_HEIGHT=7.0, WORKER_COUNT=2)["files"][0]["status"] == "cached"
+
+
+def test_journal_resumes_same_batch_only(seqno, tmp_path):
+    paths = []
+    for name in ("a.dwg", "b.dwg"):
+        path = tmp_path / name
+        path.write_bytes(b"drawing " + name.encode())
+        paths.append(str(path))
+    journal_path = str(tmp_path / "journal.json")
+
+    journal = seqno.BatchJournal(journal_path, paths)
+    assert not journal.resumed
+    journal.record(paths[0], "key-a", "done")
+    journal.record(paths[1], "key-b", "failed")
+
+    # 中断后以同一批文件（顺序无关）重新运行：已完成的图纸直接取回缓存键
+    resumed = seqno.BatchJournal(journal_path, list(reversed(paths)))
+    assert resumed.resumed
+    assert resumed.done_count() == 1
+    assert resumed.done_key(paths[0]) == "key-a"
+    assert resumed.done_key(paths[1]) is None
+    assert not seqno.BatchJournal(journal_path, paths[:1]).resumed
+
+    # 中断后被修改的图纸重新处理
+    with open(paths[0], "ab") as f:
+        f.write(b" changed")
+    assert resumed.done_key(paths[0]) is None
+
+    resumed.finish()
+    assert not os.path.exists(journal_path)
+
+
+def test_resumed_batch_skips_hashing_done_drawings(seqno, tmp_path, monkeypatch):
+    seqno.WORK_DIR = str(tmp_path / "output")
+    paths = []
+    for name in ("a.dwg", "b.dwg"):
+        path = tmp_path / name
+        path.write_bytes(b"drawing " + name.encode())
+        paths.append(str(path))
+    cache = seqno.AnnotationCache(str(tmp_path / "cache"))
+    key = cache.key_for(paths[0])
+    cache.store(key, paths[0], seqno.AnnotationTable([("Φ20", 1.0, 2.0)]), 0)
+    journal = seqno.BatchJournal(os.path.join(cache.root, "journal.json"), paths)
+    journal.record(paths[0], key, "done")
+
+    hashed = []
+    file_sha256 = seqno.file_sha256
+    monkeypatch.setattr(seqno, "file_sha256", lambda path: (hashed.append(path), file_sha256(path))[1])
+    resumed = seqno.BatchJournal(os.path.join(cache.root, "journal.json"), paths)
+    keys, hits = seqno.plan_cached_batch(paths, cache, resumed)
+    assert keys[0] == key
+    assert list(hits) == [0]
+    assert hits[0]["annotations"].strings == ["Φ20"]
+    assert hashed == [paths[1]]
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+
+from cad_simulator import SimulatedCADApplication, SimulationProfile
+
+
+class FakeCom:
+    """带 _oleobj_ 的对象被当作COM对象包装"""
+    def __init__(self):
+        self._oleobj_ = object()
+        self.received = None
+
+    def Take(self, value):
+        self.received = value
+
+
+def calls(seqno):
+    return {(row["call"], row["caller"]): row["count"] for row in seqno.com_profiler.report()["by_call"]}
+
+
+def test_proxy_counts_reads_writes_calls_and_iteration(seqno):
+    seqno.COM_PROFILE = True
+    seqno.COM_TRACE = False
+    seqno.com_profiler.reset()
+    app = seqno.profile_com(SimulatedCADApplication(SimulationProfile(startup_time=0.0)))
+    assert seqno.profile_com(app) is app
+    doc = app.Documents.Add()
+    model_space = doc.ModelSpace
+    for i in range(3):
+        text = model_space.AddText(f"({i})", seqno.make_point(i, 0.0), 2.5)
+    text.Color = 1
+    assert len(list(model_space)) == 3
+
+    me = "test_proxy_counts_reads_writes_calls_and_iteration"
+    assert calls(seqno) == {
+        ("Application.Documents", me): 1, ("Documents.Add()", me): 1, ("Document.ModelSpace", me): 1,
+        ("ModelSpace.AddText()", me): 3, ("Entity.Color=", me): 1,
+        ("ModelSpace._NewEnum", me): 1, ("ModelSpace.Next", me): 4,
+    }
+    assert seqno.com_profiler.report(entities=3)["calls_per_entity"] == round(12 / 3, 2)
+
+
+def test_proxy_unwraps_values_passed_to_com(seqno):
+    target, other = FakeCom(), FakeCom()
+    proxy = seqno.ComProxy(target, "Application")
+    proxy.Take(seqno.ComProxy(other, "Document"))
+    assert target.received is other
+    proxy.Owner = seqno.ComProxy(other, "Document")
+    assert target.Owner is other
+
+    app = SimulatedCADApplication(SimulationProfile(startup_time=0.0))
+    doc = seqno.ComProxy(app, "Application").Documents.Add()
+    layer = doc.Layers.Add("SEQ")
+    assert isinstance(layer, seqno.ComProxy)
+    doc.ActiveLayer = layer
+    assert seqno.unwrap_com(doc)._props["ActiveLayer"] is seqno.unwrap_com(layer)
+
+
+def test_profiled_batch_writes_reports(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5])
+    summary = run(paths, COM_PROFILE=True, CACHE_ENABLED=False)
+    report_path = os.path.join(seqno.WORK_DIR, "profile", "d0.com.json")
+    with open(report_path, encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["calls"] == summary["files"][0]["counts"]["com_calls"] > 0
+    assert report["drawing"] == paths[0]
+
+
+def test_simulator_and_dxf_backend_are_imported_on_demand(seqno):
+    script = ("import sys, GetCADAnnotInfoAndWriteBackSeqNo as m; "
+              "print(sorted(n for n in ('cad_backends', 'cad_simulator') if n in sys.modules)); "
+              "m.is_simulated(object()); m.backend_for_file('a.dwg', None); "
+              "print(sorted(n for n in ('cad_backends', 'cad_simulator') if n in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(seqno.__file__),
+                         capture_output=True, text=True, check=True).stdout.split("\n")
+    assert out[:2] == ["[]", "[]"]
+    assert seqno.is_simulated(SimulatedCADApplication()) and not seqno.is_simulated(FakeCom())
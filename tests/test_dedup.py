@@ -0,0 +1,39 @@
+import random
+
+
+def table(seqno, rows):
+    return seqno.AnnotationTable(rows)
+
+
+def test_merges_within_tolerance_across_grid_cells(seqno):
+    data = table(seqno, [("Φ20", 0.99, 5.0), ("%%c20", 1.05, 5.02),  # 相邻网格、规范化后相同
+                         ("Φ20", 1.2, 5.0),                           # 超出容差
+                         ("R5", 1.0, 5.0),                            # 文字不同
+                         ("Φ20", 0.99, 5.1)])                         # 恰好等于容差
+    kept, merged = seqno.dedupe_annotations(data, tolerance=0.1)
+    assert [(txt, x, y) for txt, x, y in kept] == [("Φ20", 0.99, 5.0), ("Φ20", 1.2, 5.0), ("R5", 1.0, 5.0)]
+    assert [(dropped[0], kept_item[:3]) for dropped, kept_item in merged] == [
+        ("%%c20", ("Φ20", 0.99, 5.0)), ("Φ20", ("Φ20", 0.99, 5.0))]
+
+
+def test_negative_coordinates_use_neighbouring_cells(seqno):
+    data = table(seqno, [("A", -0.02, -0.02), ("A", 0.03, 0.03), ("A", 0.09, 0.09)])
+    kept, merged = seqno.dedupe_annotations(data, tolerance=0.05)
+    assert [(x, y) for _, x, y in kept] == [(-0.02, -0.02), (0.09, 0.09)]
+    assert len(merged) == 1
+
+
+def test_matches_pairwise_reference(seqno):
+    rnd = random.Random(0)
+    rows = [(rnd.choice(("Φ20", "%%c20", "R5", "M8")), round(rnd.uniform(0, 3), 2), round(rnd.uniform(0, 3), 2))
+            for _ in range(400)]
+    tolerance = 0.15
+    expected = []
+    for txt, x, y in rows:
+        value = seqno.normalize_annotation_text(txt).value
+        if not any(seqno.normalize_annotation_text(k[0]).value == value
+                   and abs(k[1] - x) <= tolerance and abs(k[2] - y) <= tolerance for k in expected):
+            expected.append((txt, x, y))
+    kept, merged = seqno.dedupe_annotations(table(seqno, rows), tolerance=tolerance)
+    assert [tuple(item) for item in kept] == expected
+    assert len(merged) == len(rows) - len(expected)
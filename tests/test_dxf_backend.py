@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from cad_backends import DxfBackend
+from cad_simulator import SimulatedCADApplication, save_synthetic_drawing
+
+
+def dxf_text(tags):
+    return "".join(f"{code:>3}\n{value}\n" for code, value in tags)
+
+
+def write_dxf(path, version="AC1009", handseed=None):
+    header = [(0, "SECTION"), (2, "HEADER"), (9, "$ACADVER"), (1, version)]
+    if handseed:
+        header += [(9, "$HANDSEED"), (5, handseed)]
+    header.append((0, "ENDSEC"))
+    entities = [
+        (0, "SECTION"), (2, "ENTITIES"),
+        (0, "DIMENSION"), (5, "A1"), (8, "DIM"), (70, 0), (10, 0.0), (20, 0.0), (11, 10.0), (21, 20.0), (42, 25.0),
+        (0, "DIMENSION"), (5, "A2"), (8, "DIM"), (70, 4), (11, 30.0), (21, 20.0), (42, 5.0), (1, "R<>"),
+        (0, "TEXT"), (5, "A3"), (8, "TEXT"), (10, 50.0), (20, 20.0), (40, 2.5), (1, "%%c20"),
+        (0, "MTEXT"), (5, "A4"), (8, "TEXT"), (10, 70.0), (20, 20.0), (3, "技术"), (1, "要求"),
+        (0, "LINE"), (5, "A5"), (8, "0"), (10, 0.0), (20, 0.0), (11, 100.0), (21, 0.0),
+        (0, "TEXT"), (5, "A6"), (8, "TEXT"), (67, 1), (10, 5.0), (20, 5.0), (1, "图纸空间"),
+        (0, "ENDSEC"), (0, "EOF"),
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(dxf_text(header + entities))
+    return str(path)
+
+
+def labels(seqno, path):
+    backend = DxfBackend()
+    doc = backend.open(path)
+    return sorted((group["1"][0], group.get("5", [None])[0]) for entity_type, group in doc.iter_entities()
+                  if entity_type == "TEXT" and group["8"][0] == seqno.LABEL_LAYER)
+
+
+@pytest.fixture
+def dxf_batch(seqno, batch):
+    _, run = batch
+    return lambda paths, **overrides: run(paths, CAD_BACKEND="auto", CACHE_ENABLED=False, **overrides)
+
+
+def test_dxf_batch_runs_without_cad(seqno, dxf_batch, tmp_path):
+    path = write_dxf(tmp_path / "part.dxf")
+    summary = dxf_batch([path], SIMULATE_CAD=False)
+    result = summary["files"][0]
+    assert result["status"] == "done"
+    assert result["annotations"] == 4
+    assert "cad_start" not in summary["metrics"]["batch"]["timings"]
+
+    doc = DxfBackend().open(path)
+    found = [record[:3] for record in DxfBackend().iter_annotations(doc)]
+    assert found == [("25.0", 10.0, 20.0), ("R5.0", 30.0, 20.0), ("%%c20", 50.0, 20.0), ("技术要求", 70.0, 20.0)]
+    output = os.path.join(seqno.WORK_DIR, "part.dxf")
+    assert [text for text, _ in labels(seqno, output)] == ["(1)", "(2)", "(3)", "(4)"]
+
+
+def test_dxf_rerun_keeps_labels(seqno, dxf_batch, tmp_path):
+    path = write_dxf(tmp_path / "part.dxf")
+    dxf_batch([path], SIMULATE_CAD=False)
+    output = os.path.join(seqno.WORK_DIR, "part.dxf")
+    rerun = str(tmp_path / "rerun.dxf")
+    os.replace(output, rerun)
+    first_labels = labels(seqno, rerun)
+
+    summary = dxf_batch([rerun], SIMULATE_CAD=False)
+    assert summary["files"][0]["annotations"] == 4
+    assert labels(seqno, os.path.join(seqno.WORK_DIR, "rerun.dxf")) == first_labels
+
+
+def test_dxf_labels_get_new_handles(seqno, tmp_path):
+    seqno.WORK_DIR = str(tmp_path)
+    path = write_dxf(tmp_path / "r2000.dxf", version="AC1015", handseed="100")
+    backend = DxfBackend()
+    doc = backend.open(path)
+    data = seqno.AnnotationTable(list(backend.iter_annotations(doc)))
+    assert backend.add_labels(doc, data) == 4
+    output = str(tmp_path / "out.dxf")
+    backend.save_as(doc, output)
+
+    saved = backend.open(output)
+    assert [handle for _, handle in labels(seqno, output)] == ["100", "101", "102", "103"]
+    assert saved.header_value("$HANDSEED") == "104"
+
+
+def test_dimension_override_matches_zwcad(seqno, tmp_path):
+    # 替代文字为空、为 <>、含 <> 或不含 <> 时两个后端读出的标注内容一致
+    overrides = ["", "<>", "R<>", "%%c20"]
+    tags = [(0, "SECTION"), (2, "ENTITIES")]
+    records = []
+    for i, override in enumerate(overrides):
+        tags += [(0, "DIMENSION"), (8, "DIM"), (70, 0), (11, 10.0 * i), (21, 0.0), (42, 12.5), (1, override)]
+        records.append({"type": "AcDbRotatedDimension", "layer": "DIM", "measurement": 12.5, "override": override,
+                        "x": 10.0 * i, "y": 0.0})
+    dxf_path = tmp_path / "dims.dxf"
+    dxf_path.write_text(dxf_text(tags + [(0, "ENDSEC"), (0, "EOF")]), encoding="utf-8")
+    sim_path = str(tmp_path / "dims.dwg")
+    save_synthetic_drawing(sim_path, records)
+
+    backend = DxfBackend()
+    from_dxf = [record[0] for record in backend.iter_annotations(backend.open(str(dxf_path)))]
+    from_com = [record[0] for record in seqno.iter_annotations(SimulatedCADApplication().Documents.Open(sim_path))]
+    assert from_dxf == from_com == ["12.5", "12.5", "R12.5", "%%c20"]
@@ -0,0 +1,37 @@
+import openpyxl
+import pytest
+
+
+@pytest.mark.parametrize("write_only", [True, False], ids=["write_only", "workbook"])
+def test_sheet_split_at_row_limit(seqno, tmp_path, monkeypatch, write_only):
+    monkeypatch.setattr(seqno, "EXCEL_MAX_ROWS", 4)  # 表头 + 3行数据
+    seqno.USE_BRACKET_NUMBERS = True
+    data = seqno.AnnotationTable((f"Φ{i}", float(i), 0.0) for i in range(1, 8))
+    path = str(tmp_path / "report.xlsx")
+    writer = seqno.ExcelReportWriter(path, write_only=write_only)
+    assert writer.add_sheet("图纸", data) == ["图纸", "图纸(续2)", "图纸(续3)"]
+    writer.close()
+
+    workbook = openpyxl.load_workbook(path)
+    try:
+        assert workbook.sheetnames == ["说明", "图纸", "图纸(续2)", "图纸(续3)"]
+        rows = []
+        for title in workbook.sheetnames[1:]:
+            sheet_rows = list(workbook[title].iter_rows(values_only=True))
+            assert sheet_rows[0] == seqno.EXCEL_HEADER
+            assert len(sheet_rows) <= 4
+            rows.extend(sheet_rows[1:])
+        # 续表中的序号接着上一张表编号
+        assert [row[0] for row in rows] == [f"({i})" for i in range(1, 8)]
+        assert [row[1] for row in rows] == [f"Φ{i}" for i in range(1, 8)]
+        assert workbook["图纸(续3)"]["C2"].number_format == "0.00"
+    finally:
+        workbook.close()
+
+
+def test_long_sheet_names_keep_suffix(seqno, tmp_path, monkeypatch):
+    monkeypatch.setattr(seqno, "EXCEL_MAX_ROWS", 2)
+    writer = seqno.ExcelReportWriter(str(tmp_path / "report.xlsx"), write_only=True)
+    titles = writer.add_sheet("长" * 40, seqno.AnnotationTable([("a", 0.0, 0.0), ("b", 1.0, 0.0)]))
+    writer.close()
+    assert titles == ["长" * 31, "长" * 27 + "(续2)"]
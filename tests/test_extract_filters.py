@@ -0,0 +1,67 @@
+import pytest
+
+from cad_simulator import SimulatedCADApplication, save_synthetic_drawing
+
+BLOCKS = {"B": {"origin": [0.0, 0.0], "entities": [
+    {"type": "AcDbText", "layer": "0", "text": "随块参照", "x": 500.0, "y": 500.0},
+    {"type": "AcDbText", "layer": "WANT", "text": "块内", "x": 1.0, "y": 1.0},
+    {"type": "AcDbText", "layer": "OTHER", "text": "块内其它", "x": 2.0, "y": 2.0},
+]}}
+
+
+def drawing(seqno, tmp_path):
+    records = [
+        {"type": "AcDbText", "layer": "WANT", "text": "范围内", "x": 5.0, "y": 5.0, "handle": "1"},
+        {"type": "AcDbText", "layer": "WANT", "text": "范围外", "x": 5000.0, "y": 5.0, "handle": "2"},
+        {"type": "AcDbText", "layer": "OTHER", "text": "其它图层", "x": 5.0, "y": 5.0, "handle": "3"},
+        {"type": seqno.BLOCK_REFERENCE_ENTITY_NAME, "layer": "WANT", "name": "B", "x": -300.0, "y": -300.0,
+         "handle": "4", "attributes": [{"tag": "T", "text": "属性", "x": 3.0, "y": 3.0, "layer": "0"},
+                                       {"tag": "U", "text": "属性其它", "x": 3.0, "y": 3.0, "layer": "OTHER"}]},
+        {"type": seqno.BLOCK_REFERENCE_ENTITY_NAME, "layer": "OTHER", "name": "B", "x": 0.0, "y": 0.0,
+         "handle": "5"},
+    ]
+    path = str(tmp_path / "filters.dwg")
+    save_synthetic_drawing(path, records, BLOCKS)
+    return SimulatedCADApplication().Documents.Open(path)
+
+
+@pytest.mark.parametrize("use_selection_set", [True, False])
+def test_layers_and_window_with_blocks(seqno, tmp_path, use_selection_set):
+    seqno.EXTRACT_USE_SELECTION_SET = use_selection_set
+    seqno.EXTRACT_BLOCKS = True
+    seqno.EXTRACT_LAYERS = ["WANT"]
+    seqno.EXTRACT_WINDOW = (0.0, 0.0, 1000.0, 1000.0)
+    doc = drawing(seqno, tmp_path)
+    found = sorted(a[0] for a in seqno.iter_annotations(doc))
+    assert found == sorted(["范围内", "随块参照", "属性", "块内"])
+    assert not doc._selection_sets
+
+
+def test_window_pushed_down_with_blocks(seqno):
+    codes, values = seqno.build_annotation_filter(["WANT"], (0.0, 0.0, 1000.0, 1000.0))
+    assert codes.count(10) == 2
+    assert "INSERT" not in values
+
+
+def test_window_selects_dimensions_by_text_position(seqno, tmp_path):
+    seqno.EXTRACT_USE_SELECTION_SET = True
+    seqno.EXTRACT_LAYERS = None
+    seqno.EXTRACT_WINDOW = (0.0, 0.0, 100.0, 100.0)
+    # 选择集按定义点比较坐标：定义点在范围外、文字在范围内的尺寸也要取到
+    records = [
+        {"type": "AcDbRotatedDimension", "layer": "DIM", "measurement": 10.0, "x": 50.0, "y": 5.0,
+         "def_x": 50.0, "def_y": -20.0},
+        {"type": "AcDbRotatedDimension", "layer": "DIM", "measurement": 20.0, "x": 50.0, "y": 150.0,
+         "def_x": 50.0, "def_y": 90.0},
+        {"type": "AcDbText", "layer": "TEXT", "text": "范围内", "x": 5.0, "y": 5.0},
+        {"type": "AcDbText", "layer": "TEXT", "text": "范围外", "x": 500.0, "y": 5.0},
+    ]
+    path = str(tmp_path / "dims.dwg")
+    save_synthetic_drawing(path, records)
+    doc = SimulatedCADApplication().Documents.Open(path)
+
+    selection_set = seqno.select_annotation_entities(doc, None, seqno.EXTRACT_WINDOW)
+    selected = {entity.Handle for entity in selection_set._items}
+    assert len(selected) == 3  # 两个尺寸与范围内的文字
+    selection_set.Delete()
+    assert sorted(a[0] for a in seqno.iter_annotations(doc)) == ["10.0", "范围内"]
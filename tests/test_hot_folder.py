@@ -0,0 +1,135 @@
+import os
+
+import openpyxl
+import pytest
+
+from cad_simulator import generate_synthetic_drawing, save_synthetic_drawing
+
+
+def write_file(path, content=b"x"):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_watcher_reports_files_once_stable(seqno, tmp_path):
+    watcher = seqno.HotFolderWatcher(str(tmp_path), settle=5.0)
+    path = write_file(tmp_path / "a.dwg")
+    assert watcher.poll(now=0.0) == []
+    assert watcher.poll(now=4.0) == []
+    ready = watcher.poll(now=5.0)
+    assert [item[0] for item in ready] == [os.path.abspath(path)]
+    assert watcher.poll(now=100.0) == []
+
+
+def test_watcher_restarts_settle_time_while_copying(seqno, tmp_path):
+    watcher = seqno.HotFolderWatcher(str(tmp_path), settle=5.0)
+    path = write_file(tmp_path / "a.dwg")
+    watcher.poll(now=0.0)
+    write_file(path, b"xx")
+    assert watcher.poll(now=5.0) == []
+    assert watcher.poll(now=9.0) == []
+    assert len(watcher.poll(now=10.0)) == 1
+
+    # 已报告的图纸内容变化后再次报告；删除后重新出现也视为新图纸
+    write_file(path, b"xxx")
+    watcher.poll(now=20.0)
+    assert len(watcher.poll(now=25.0)) == 1
+    os.remove(path)
+    assert watcher.poll(now=30.0) == []
+    assert watcher.pending == {} and watcher.reported == {}
+
+
+def test_queue_requeues_changed_and_interrupted_drawings(seqno, tmp_path):
+    jobs = seqno.HotFolderQueue(str(tmp_path / "queue.sqlite"))
+    try:
+        path = write_file(tmp_path / "a.dwg")
+        assert jobs.offer(path, 1, 100)
+        assert not jobs.offer(path, 1, 100)
+        assert jobs.take(10) == [path]
+        assert jobs.take(10) == []
+        assert jobs.recover() == 1
+        assert jobs.take(10) == [path]
+        assert jobs.attempts(path) == 2
+        jobs.finish(path, "done")
+        assert jobs.offer(path, 2, 200)
+        assert jobs.attempts(path) == 0
+        os.remove(path)
+        assert jobs.take(10) == []
+        assert jobs.counts() == {}
+    finally:
+        jobs.close()
+
+
+def batch_summary(paths, error=None):
+    return {"error": error, "files": [
+        {"file": path, "status": "failed", "error": error or "坏图纸", "output": None} for path in paths]}
+
+
+def test_failed_batches_are_retried_then_marked_failed(seqno, tmp_path):
+    seqno.FILE_RETRIES = 1
+    seqno.STORE_ENABLED = False
+    outbox = str(tmp_path / "outbox")
+    jobs = seqno.HotFolderQueue(str(tmp_path / "queue.sqlite"))
+    try:
+        path = write_file(tmp_path / "a.dwg")
+        jobs.offer(path, 1, 100)
+        # 批次整体失败（如CAD无法启动）：重新排队，超过重试次数后记为失败并发布
+        assert seqno.finish_hot_folder_batch(jobs, batch_summary(jobs.take(10), "CAD无法启动"), outbox) == 1
+        assert jobs.counts() == {"queued": 1}
+        assert not os.path.exists(os.path.join(outbox, "a.json"))
+        assert seqno.finish_hot_folder_batch(jobs, batch_summary(jobs.take(10), "CAD无法启动"), outbox) == 0
+        assert jobs.counts() == {"failed": 1}
+        assert os.path.exists(os.path.join(outbox, "a.json"))
+
+        # 单张图纸失败不重试
+        other = write_file(tmp_path / "b.dwg")
+        jobs.offer(other, 1, 100)
+        assert seqno.finish_hot_folder_batch(jobs, batch_summary(jobs.take(10)), outbox) == 0
+        assert jobs.counts() == {"failed": 2}
+    finally:
+        jobs.close()
+
+
+def test_watch_dirs_must_differ(seqno, tmp_path):
+    seqno.WORK_DIR = str(tmp_path / "output")
+    seqno.check_watch_dirs(str(tmp_path / "inbox"), os.path.join(seqno.WORK_DIR, "outbox"))
+    for inbox, outbox in ((seqno.WORK_DIR, str(tmp_path / "outbox")),
+                          (str(tmp_path / "inbox"), seqno.WORK_DIR),
+                          (str(tmp_path / "inbox"), str(tmp_path / "inbox"))):
+        with pytest.raises(ValueError):
+            seqno.check_watch_dirs(inbox, outbox)
+    os.makedirs(seqno.WORK_DIR)
+    with pytest.raises(ValueError):
+        seqno.serve_hot_folder(seqno.WORK_DIR)
+
+
+def test_service_batches_share_cad_and_keep_outputs(seqno, tmp_path):
+    seqno.apply_config({"SIMULATE_CAD": True, "SIMULATION_PROFILE": {"latency": 0.0, "startup_time": 0.0},
+                        "WORK_DIR": str(tmp_path / "output"), "WORKER_COUNT": 1, "FILE_TIMEOUT": None,
+                        "CACHE_ENABLED": False, "STORE_ENABLED": False, "LOG_FILE": False})
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"d{i}.dwg")
+        save_synthetic_drawing(path, generate_synthetic_drawing(5, 0, 5, seed=i, extent=100.0))
+        paths.append(path)
+    status_q = seqno._ConsoleQueue(types=())
+    service = seqno.ServiceResources()
+    try:
+        first = seqno.run_process_async(paths[:1], None, status_q, open_folder=False, service=service)
+        cad = service.cad
+        assert cad is not None
+        second = seqno.run_process_async(paths[1:], None, status_q, open_folder=False, service=service)
+        assert service.cad is cad
+        assert "cad_start" in first["metrics"]["batch"]["timings"]
+        assert "cad_start" not in second["metrics"]["batch"]["timings"]
+        # 第二批不清空输出目录，第一批回写的图纸仍在
+        assert os.path.exists(os.path.join(seqno.WORK_DIR, "d0.dwg"))
+        assert os.path.exists(os.path.join(seqno.WORK_DIR, "d1.dwg"))
+    finally:
+        service.close()
+    workbook = openpyxl.load_workbook(os.path.join(seqno.WORK_DIR, seqno.EXCEL_NAME), read_only=True)
+    try:
+        assert [name for name in workbook.sheetnames if name != "说明"] == ["d0", "d1"]
+    finally:
+        workbook.close()
@@ -0,0 +1,79 @@
+from cad_simulator import SimulationProfile
+
+
+def overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def test_text_box_follows_anchor(seqno):
+    width = 4 * 2.0 * seqno.LABEL_CHAR_WIDTH
+    assert seqno.estimate_text_box("ABCD", 10.0, 20.0, 2.0, seqno.ANCHOR_LOWER_LEFT) == (10.0, 20.0, 10.0 + width, 22.0)
+    assert seqno.estimate_text_box("ABCD", 10.0, 20.0, 2.0, seqno.ANCHOR_UPPER_LEFT) == (10.0, 18.0, 10.0 + width, 20.0)
+    assert seqno.estimate_text_box("ABCD", 10.0, 20.0, 2.0) == (10.0 - width / 2, 19.0, 10.0 + width / 2, 21.0)
+
+
+def test_labels_avoid_left_aligned_text(seqno):
+    seqno.LABEL_AVOID_OVERLAP = True
+    seqno.LABEL_CANDIDATE_OFFSETS = None
+    data = seqno.AnnotationTable()
+    # 单行文字向右延伸：尺寸序号的默认位置（上方）落在文字上
+    data.append("ABCDEFGHIJ", 0.0, 0.0, None, seqno.ANCHOR_LOWER_LEFT)
+    data.append("20", 14.0, -seqno.TEXT_OFFSET_Y)
+    text_box = seqno.estimate_text_box("ABCDEFGHIJ", 0.0, 0.0, seqno.TEXT_HEIGHT, seqno.ANCHOR_LOWER_LEFT)
+    width = len("(2)") * seqno.TEXT_HEIGHT * seqno.LABEL_CHAR_WIDTH
+
+    x, y = seqno.place_labels(data)[1]
+    assert not overlaps((x, y, x + width, y + seqno.TEXT_HEIGHT), text_box)
+
+
+def test_anchors_survive_reordering(seqno):
+    data = seqno.AnnotationTable([("a", 0.0, 0.0), ("b", 1.0, 0.0, None, seqno.ANCHOR_UPPER_LEFT)])
+    assert list(data.anchors) == [seqno.ANCHOR_CENTER, seqno.ANCHOR_UPPER_LEFT]
+    assert list(data.take([1, 0]).anchors) == [seqno.ANCHOR_UPPER_LEFT, seqno.ANCHOR_CENTER]
+    assert list(data[1:].anchors) == [seqno.ANCHOR_UPPER_LEFT]
+    assert seqno.AnnotationTable([("a", 0.0, 0.0)]).anchors is None
+
+
+def test_diff_labels_keeps_moves_adds_and_deletes(seqno):
+    existing = [("keep", 1, 0.0, 0.0), ("renumber", 5, 10.0, 0.0), ("move", 3, 30.0, 0.0),
+                ("stale", 9, 90.0, 0.0), ("spare", 7, 70.0, 0.0)]
+    wanted = [(1, 0.0004, 0.0), (2, 10.0, 0.0), (3, 35.0, 0.0), (4, 40.0, 0.0), (5, 50.0, 0.0), (6, 60.0, 0.0)]
+    kept, updates, adds, deletes = seqno.diff_labels(existing, wanted)
+    assert kept == 1
+    by_entity = {entity: (i, renumber, move) for entity, i, renumber, move in updates}
+    assert by_entity["renumber"] == (1, True, False)
+    assert by_entity["move"] == (2, False, True)
+    # 无法按位置或序号匹配的旧序号改号并移动，仍不足的新增
+    assert {by_entity["stale"], by_entity["spare"]} == {(3, True, True), (4, True, True)}
+    assert adds == [5]
+    assert deletes == []
+
+    kept, updates, adds, deletes = seqno.diff_labels(existing, wanted[:1])
+    assert (kept, updates, adds) == (1, [], [])
+    assert sorted(deletes) == ["move", "renumber", "spare", "stale"]
+
+
+def test_fallback_labels_use_label_layer(seqno, monkeypatch):
+    seqno.LABEL_LAYER = "SEQ_LABELS"
+    app = seqno.start_simulated_cad(SimulationProfile(startup_time=0.0))
+    doc = app.Documents.Add()
+    doc.Layers.Add("SEQ_LABELS")
+    # 设置当前图层/样式失败时逐个设置文字属性
+    monkeypatch.setattr(seqno, "prepare_label_context", lambda doc, style: None)
+    assert seqno.add_label_texts(doc, [(1, 0.0, 0.0), (2, 5.0, 0.0)]) == 2
+    for entity in doc.ModelSpace:
+        assert entity.Layer == "SEQ_LABELS"
+        assert entity.Color == seqno.LABEL_COLOR
+
+
+def test_labels_use_label_color_on_existing_layer(seqno):
+    seqno.LABEL_LAYER = "SEQ_LABELS"
+    seqno.LABEL_COLOR = 1
+    app = seqno.start_simulated_cad(SimulationProfile(startup_time=0.0))
+    doc = app.Documents.Add()
+    # 图纸中已有的序号图层是其他颜色，随层会得到绿色序号
+    doc.Layers.Add("SEQ_LABELS").Color = 3
+    assert seqno.add_label_texts(doc, [(1, 0.0, 0.0), (2, 5.0, 0.0)]) == 2
+    assert [(entity.Layer, entity.Color) for entity in doc.ModelSpace] == [("SEQ_LABELS", 1)] * 2
+    assert doc.GetVariable("CECOLOR") == "BYLAYER"
+    assert doc.ActiveLayer.Name == "0"
@@ -0,0 +1,42 @@
+import logging
+
+
+def put_all(buffer, records):
+    for record in records:
+        buffer.put(("LOG", record))
+
+
+def drain_all(buffer):
+    drained = []
+    while True:
+        batch = buffer.drain(3)
+        if not batch:
+            return drained
+        drained.extend(batch)
+
+
+def test_errors_kept_in_chronological_order(seqno):
+    buffer = seqno.LogBuffer(capacity=4)
+    records = [(logging.INFO, "a"), (logging.ERROR, "E1"), (logging.INFO, "b"), (logging.INFO, "c"),
+               (logging.ERROR, "E2"), (logging.INFO, "d"), (logging.INFO, "e")]
+    put_all(buffer, records)
+    drained = drain_all(buffer)
+    assert drained[0][1].startswith("⚠️")
+    assert [text for _, text in drained[1:]] == ["E1", "E2", "d", "e"]
+
+
+def test_interleaved_drain_and_put(seqno):
+    buffer = seqno.LogBuffer(capacity=3)
+    put_all(buffer, [(logging.INFO, "a"), (logging.INFO, "b")])
+    assert [text for _, text in buffer.drain(1)] == ["a"]
+    put_all(buffer, [(logging.ERROR, "E"), (logging.INFO, "c"), (logging.INFO, "d")])
+    assert [text for _, text in drain_all(buffer)[1:]] == ["E", "c", "d"]
+
+
+def test_memory_bounded_without_drain(seqno):
+    buffer = seqno.LogBuffer(capacity=10)
+    put_all(buffer, [(logging.ERROR, "E")])
+    put_all(buffer, [(logging.INFO, str(i)) for i in range(1000)])
+    assert len(buffer.items) <= 20
+    drained = drain_all(buffer)
+    assert [text for _, text in drained[1:]] == ["E"] + [str(i) for i in range(991, 1000)]
@@ -0,0 +1,35 @@
+import pytest
+
+CASES = [
+    ("20", ("20", "number", "0")),
+    ("1,200.5", ("1200.50", "number", "0.00")),
+    ("%%c20", ("Φ20", "diameter", None)),
+    ("2-%%C8", ("2-Φ8", "diameter", None)),
+    ("R5", ("R5", "radius", None)),
+    ("20%%p0.05", ("20±0.05", "tolerance", None)),
+    ("30%%d", ("30°", "text", None)),
+    ("-5", ("-5", "text", None)),
+    # MText 格式码：字体/对齐、堆叠公差、换行、下划线开关、转义字符
+    ("{\\fSimSun|b0;Φ20}", ("Φ20", "diameter", None)),
+    ("\\A1;R5", ("R5", "radius", None)),
+    ("20\\S+0.1^-0.2;", ("20+0.1/-0.2", "tolerance", None)),
+    ("∅12\\P深5", ("Φ12 深5", "diameter", None)),
+    ("\\LM8\\l", ("M8", "text", None)),
+    ("\\\\路径\\{x\\}", ("\\路径{x}", "text", None)),
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES, ids=[c[0] for c in CASES])
+def test_normalize_annotation_text(seqno, text, expected):
+    assert tuple(seqno.normalize_annotation_text(text)) == expected
+
+
+def test_cached_and_uncached_results_match(seqno):
+    texts = [text for text, _ in CASES] * 3
+    seqno.normalize_annotation_text.cache_clear()
+    uncached = [seqno._normalize_uncached(text) for text in texts]
+    assert seqno.normalize_texts(texts) == uncached
+    # 缓存已命中时结果不变
+    assert seqno.normalize_texts(texts) == uncached
+    assert seqno.normalize_annotation_text.cache_info().hits > 0
+    assert [seqno.convert_to_numeric(text) for text in texts] == [result.value for result in uncached]
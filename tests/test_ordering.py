@@ -0,0 +1,58 @@
+import math
+import random
+
+import pytest
+
+
+def brute_force_path(xs, ys, indices):
+    """与 _order_path 相同的起点与并列规则，逐个线性查找最近的剩余点"""
+    indices = list(indices)
+    points = [(xs[i], ys[i]) for i in indices]
+    current = min(range(len(points)), key=lambda i: (points[i][0] - points[i][1], -points[i][1]))
+    remaining = set(range(len(points))) - {current}
+    order = [current]
+    while remaining:
+        x, y = points[current]
+        current = min(remaining, key=lambda k: (math.hypot(points[k][0] - x, points[k][1] - y), k))
+        remaining.remove(current)
+        order.append(current)
+    return [indices[i] for i in order]
+
+
+def random_points(n, seed, extent=1000.0):
+    rng = random.Random(seed)
+    return ([round(rng.uniform(0, extent), 2) for _ in range(n)],
+            [round(rng.uniform(0, extent), 2) for _ in range(n)])
+
+
+CASES = {
+    "two": ([0.0, 10.0], [0.0, 10.0]),
+    "single": ([5.0], [5.0]),
+    "row": ([float(i * 7) for i in range(300)], [12.5] * 300),
+    "column": ([3.0] * 10, [float(i) for i in range(10)]),
+    "duplicates": ([1.0, 1.0, 1.0, 4.0, 4.0], [2.0, 2.0, 2.0, 2.0, 2.0]),
+    "far_cluster": ([0.0] + [1e6 + i * 0.01 for i in range(40)], [0.0] + [1e6] * 40),
+    "random": random_points(500, seed=1),
+    "random_dense": random_points(2000, seed=2, extent=50.0),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_order_path_matches_brute_force(seqno, name):
+    xs, ys = CASES[name]
+    assert seqno._order_path(xs, ys, range(len(xs))) == brute_force_path(xs, ys, range(len(xs)))
+
+
+def test_order_path_keeps_original_indices(seqno):
+    xs, ys = random_points(50, seed=3)
+    indices = list(range(0, 50, 2))
+    result = seqno._order_path(xs, ys, indices)
+    assert sorted(result) == indices
+    assert result == brute_force_path(xs, ys, indices)
+
+
+def test_order_annotations_two_per_zone(seqno):
+    seqno.SEQUENCE_ORDER = "path"
+    seqno.SEQUENCE_ZONES = [(0, 0, 100, 100), (200, 0, 300, 100)]
+    data = seqno.AnnotationTable([("a", 10, 10), ("b", 50, 50), ("c", 210, 10), ("d", 250, 10)])
+    assert [row[0] for row in seqno.order_annotations(data)] == ["b", "a", "c", "d"]
@@ -0,0 +1,73 @@
+import threading
+
+
+def test_tasks_run_in_order_on_another_thread(seqno):
+    stage = seqno.OutputStage(2)
+    done, errors = [], []
+
+    def task(n):
+        if n == 2:
+            raise ValueError("写入失败")
+        done.append((n, threading.current_thread().name))
+
+    for n in range(5):
+        stage.submit(task, n, on_error=errors.append)
+    stage.close()
+    assert [n for n, _ in done] == [0, 1, 3, 4]
+    assert {name for _, name in done} == {"output-stage"}
+    assert [str(e) for e in errors] == ["写入失败"]
+
+
+def test_submit_blocks_when_stage_is_full(seqno):
+    stage = seqno.OutputStage(1)
+    release = threading.Event()
+    started = threading.Event()
+    stage.submit(lambda: (started.set(), release.wait(10)))
+    started.wait(10)
+    stage.submit(lambda: None)  # 占满队列
+
+    submitter = threading.Thread(target=stage.submit, args=(lambda: None,))
+    submitter.start()
+    submitter.join(0.2)
+    assert submitter.is_alive()
+    release.set()
+    submitter.join(10)
+    assert not submitter.is_alive()
+    stage.close()
+
+
+def test_zero_depth_runs_inline(seqno):
+    stage = seqno.OutputStage(0)
+    threads = []
+    stage.submit(lambda: threads.append(threading.current_thread()))
+    stage.close()
+    assert threads == [threading.current_thread()]
+
+
+def test_excel_failure_only_fails_its_drawing(seqno, batch, monkeypatch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 10, 15])
+    write_to_excel = seqno.write_to_excel
+
+    def failing_write(sheet_name, data):
+        if sheet_name == "d1":
+            raise OSError("磁盘已满")
+        write_to_excel(sheet_name, data)
+
+    monkeypatch.setattr(seqno, "write_to_excel", failing_write)
+    summary = run(paths)
+    assert [r["status"] for r in summary["files"]] == ["done", "failed", "done"]
+    assert "磁盘已满" in summary["files"][1]["error"]
+
+    # 失败的图纸不写入缓存，下次重新处理
+    monkeypatch.setattr(seqno, "write_to_excel", write_to_excel)
+    assert [r["status"] for r in run(paths)["files"]] == ["cached", "done", "cached"]
+
+
+def test_pipelined_and_inline_outputs_match(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 10, 15])
+    inline = run(paths, PIPELINE_DEPTH=0, CACHE_ENABLED=False)
+    pipelined = run(paths, PIPELINE_DEPTH=2, CACHE_ENABLED=False)
+    assert [(r["status"], r["annotations"], r["labels"]) for r in pipelined["files"]] == \
+        [(r["status"], r["annotations"], r["labels"]) for r in inline["files"]]
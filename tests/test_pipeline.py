@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+
+import openpyxl
+import pytest
+
+from cad_simulator import SimulationProfile
+
+# 每张图纸约160次COM调用（20个尺寸 + 20个非标注实体）
+DRAWING_CALLS = 160
+
+
+class StatusQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+
+def sheet_names(seqno):
+    workbook = openpyxl.load_workbook(os.path.join(seqno.WORK_DIR, seqno.EXCEL_NAME), read_only=True)
+    try:
+        return [name for name in workbook.sheetnames if name != "说明"]
+    finally:
+        workbook.close()
+
+
+def output_records(seqno, path):
+    with open(os.path.join(seqno.WORK_DIR, os.path.basename(path)), encoding="utf-8") as f:
+        return json.load(f)["entities"]
+
+
+def test_pool_schedules_largest_first(seqno, batch):
+    make_drawings, _ = batch
+    paths = make_drawings([5, 40, 10, 20])
+    seqno.apply_config({"SIMULATE_CAD": True, "SIMULATION_PROFILE": {"startup_time": 0.0},
+                        "EXCEL_ENABLED": False})
+    order = []
+    seqno.run_worker_pool(paths, 1, StatusQueue(),
+                          on_result=lambda index, dwg, data, write_count, error: order.append(index))
+    assert order == [1, 3, 2, 0]
+
+
+def test_pool_merges_results_in_input_order(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 40, 10, 20, 15])
+    serial = run(paths, CACHE_ENABLED=False)
+    serial_outputs = [output_records(seqno, path) for path in paths]
+
+    pooled = run(paths, WORKER_COUNT=2, CACHE_ENABLED=False)
+    assert [r["sheet"] for r in pooled["files"]] == ["d0", "d1", "d2", "d3", "d4"]
+    assert [r["status"] for r in pooled["files"]] == ["done"] * 5
+    assert [r["annotations"] for r in pooled["files"]] == [r["annotations"] for r in serial["files"]]
+    assert sheet_names(seqno) == ["d0", "d1", "d2", "d3", "d4"]
+    assert [output_records(seqno, path) for path in paths] == serial_outputs
+
+
+@pytest.mark.parametrize("file_timeout", [None, 60], ids=["serial", "pool"])
+def test_crash_recycles_cad_and_retries(seqno, batch, file_timeout):
+    make_drawings, run = batch
+    paths = make_drawings([20, 20, 20, 20])
+    # 每个CAD实例在第二张图纸中途崩溃：重启CAD后重试，之后的图纸不受影响
+    # （设置 FILE_TIMEOUT 时单个工作进程也走进程池，重试的图纸排到队尾，可能再次成为第二张）
+    summary = run(paths, FILE_TIMEOUT=file_timeout, FILE_RETRIES=2, CACHE_ENABLED=False,
+                  SIMULATION_PROFILE={"startup_time": 0.0, "crash_after": DRAWING_CALLS + 50})
+    assert summary["error"] is None
+    assert [r["status"] for r in summary["files"]] == ["done"] * 4
+    assert summary["metrics"]["batch"]["counts"]["file_retries"] >= 1
+    assert summary["metrics"]["batch"]["counts"]["cad_recycles"] >= 1
+    assert sheet_names(seqno) == ["d0", "d1", "d2", "d3"]
+
+
+def test_crash_fails_after_retries(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([20, 20])
+    summary = run(paths, CACHE_ENABLED=False, SIMULATION_PROFILE={"startup_time": 0.0, "crash_after": 50})
+    assert summary["error"] is None
+    assert [r["status"] for r in summary["files"]] == ["failed"] * 2
+    assert str(seqno.RPC_S_SERVER_UNAVAILABLE) in summary["files"][0]["error"]
+    assert summary["metrics"]["batch"]["counts"]["file_retries"] == 2
+
+
+def test_hang_is_timed_out_and_retried(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([20, 20])
+    # 每个CAD实例处理完一张图纸后在下一张卡死，看门狗换新实例重试
+    summary = run(paths, FILE_TIMEOUT=1, SIMULATION_PROFILE={"startup_time": 0.0,
+                                                             "hang_after": DRAWING_CALLS + 50})
+    assert [r["status"] for r in summary["files"]] == ["done"] * 2
+    assert summary["metrics"]["batch"]["counts"]["file_timeouts"] == 1
+
+
+def test_hang_fails_after_retries(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([20])
+    summary = run(paths, FILE_TIMEOUT=1, FILE_RETRIES=1,
+                  SIMULATION_PROFILE={"startup_time": 0.0, "hang_after": 50})
+    assert summary["files"][0]["status"] == "failed"
+    assert "超时" in summary["files"][0]["error"]
+    assert summary["metrics"]["batch"]["counts"]["file_timeouts"] == 2
+
+
+def test_rerun_uses_cache_for_unchanged_drawings(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 10, 15])
+    first = run(paths)
+    assert [r["status"] for r in first["files"]] == ["done"] * 3
+
+    second = run(paths)
+    assert [r["status"] for r in second["files"]] == ["cached"] * 3
+    assert [r["annotations"] for r in second["files"]] == [r["annotations"] for r in first["files"]]
+    assert sheet_names(seqno) == ["d0", "d1", "d2"]
+
+    make_drawings([5, 12], seed=100)
+    third = run(paths)
+    assert [r["status"] for r in third["files"]] == ["done", "done", "cached"]
+
+
+def test_incremental_rerun_keeps_existing_labels(seqno, batch, tmp_path):
+    make_drawings, run = batch
+    paths = make_drawings([20])
+    first = run(paths, CACHE_ENABLED=False)
+    labelled = output_records(seqno, paths[0])
+
+    rerun_input = str(tmp_path / "rerun.dwg")
+    shutil.copy(os.path.join(seqno.WORK_DIR, "d0.dwg"), rerun_input)
+    calls = []
+    app = seqno.start_simulated_cad(SimulationProfile())
+    tick = app._core.tick
+    app._core.tick = lambda name: (calls.append(name), tick(name))[1]
+    data, write_count = seqno.process_dwg(rerun_input, app)
+
+    assert len(data) == first["files"][0]["annotations"]
+    assert write_count == len(data)
+    assert "ModelSpace.AddText" not in calls
+    assert output_records(seqno, rerun_input) == labelled
+
+
+def test_drawing_timings_and_counts_are_separate(seqno, batch):
+    make_drawings, run = batch
+    paths = make_drawings([5, 10])
+    summary = run(paths, WORKER_COUNT=2, CACHE_ENABLED=False, METRICS_EXPORT=True)
+    for result in summary["files"]:
+        assert set(result["timings"]) <= set(seqno.METRIC_STAGES)
+        assert result["counts"]["annotations"] == result["annotations"]
+        assert result["counts"]["labels"] == result["labels"]
+        # 工作进程中记录的就绪等待随统计一起交回主进程
+        assert result["ready_wait"] == round(result["timings"]["ready_wait"], 3)
+    totals = summary["metrics"]["totals"]
+    assert totals["counts"]["annotations"] == sum(r["annotations"] for r in summary["files"])
+    assert set(totals["timings"]) == set(seqno.METRIC_STAGES)
+    assert "cad_start" in summary["metrics"]["batch"]["timings"]
+    with open(os.path.join(seqno.WORK_DIR, "metrics.json"), encoding="utf-8") as f:
+        assert set(json.load(f)["drawings"][paths[0]]) == {"timings", "counts"}
+
+
+def test_batch_config_does_not_leak(seqno, batch):
+    make_drawings, run = batch
+    seqno.TEXT_HEIGHT = 2.5
+    seqno.WORK_DIR = "unchanged"
+    summary = run(make_drawings([5]), TEXT_HEIGHT=7.0)
+    assert summary["files"][0]["status"] == "done"
+    assert seqno.TEXT_HEIGHT == 2.5
+    assert seqno.WORK_DIR == "unchanged"
+    with pytest.raises(ValueError):
+        seqno.process_batch([], {"TEXT_HEIGHT": 3.0, "NO_SUCH_SETTING": 1})
+    assert seqno.TEXT_HEIGHT == 2.5
+
+
+class _State:
+    def __init__(self, read):
+        self.read = read
+
+    @property
+    def IsQuiescent(self):
+        return self.read()
+
+
+class _Cad:
+    def __init__(self, read):
+        self.state = _State(read)
+
+    def GetZcadState(self):
+        return self.state
+
+
+def test_quiescent_state_read_failure_means_busy(seqno):
+    def busy():
+        raise RuntimeError("调用被拒绝")
+    assert seqno.is_cad_quiescent(_Cad(lambda: True))
+    assert not seqno.is_cad_quiescent(_Cad(busy))
+    assert seqno.is_cad_quiescent(object())
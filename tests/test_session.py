@@ -0,0 +1,90 @@
+import json
+import multiprocessing
+import os
+import queue
+import threading
+
+import pytest
+
+from cad_simulator import SimulationProfile, save_synthetic_drawing
+
+
+@pytest.fixture
+def session(seqno):
+    """一个会话实例进程（模拟CAD）加上转发线程，返回租用后的 RemoteCADBackend"""
+    seqno.SIMULATE_CAD = True
+    seqno.SIMULATION_PROFILE = {"latency": 0.0, "startup_time": 0.0}
+    settings = {name: getattr(seqno, name) for name in seqno.USER_SETTING_NAMES}
+    instance = seqno._SessionInstance(multiprocessing.get_context("spawn"), 1, settings)
+    free_instances = queue.Queue()
+    free_instances.put(instance)
+    client_conn, server_conn = multiprocessing.Pipe()
+    thread = threading.Thread(target=seqno._serve_session_client, args=(server_conn, free_instances), daemon=True)
+    thread.start()
+    backend = seqno.RemoteCADBackend(client_conn)
+    backend.lease()
+    yield backend
+    backend.quit()
+    thread.join(timeout=30)
+    instance.stop()
+
+
+def test_session_places_labels_like_local_run(seqno, session, tmp_path):
+    records = [
+        {"type": "AcDbText", "layer": "TEXT", "text": "ABCDEFGHIJ", "x": 0.0, "y": 0.0, "handle": "1"},
+        {"type": "AcDbRotatedDimension", "layer": "DIM", "measurement": 20.0, "override": "",
+         "x": 14.0, "y": -seqno.TEXT_OFFSET_Y, "handle": "2"},
+        {"type": "AcDbMText", "layer": "TEXT", "text": "技术要求", "x": 30.0, "y": 10.0, "handle": "3"},
+    ]
+    source = str(tmp_path / "anchors.dwg")
+    save_synthetic_drawing(source, records)
+
+    outputs = {}
+    for mode, backend in (("local", seqno.start_simulated_cad(SimulationProfile())), ("session", session)):
+        seqno.WORK_DIR = str(tmp_path / mode)
+        os.makedirs(seqno.WORK_DIR)
+        seqno.process_dwg(source, backend)
+        with open(os.path.join(seqno.WORK_DIR, "anchors.dwg"), encoding="utf-8") as f:
+            outputs[mode] = [(e["text"], e["x"], e["y"]) for e in json.load(f)["entities"]
+                             if e.get("layer") == seqno.LABEL_LAYER]
+    assert len(outputs["local"]) == 3
+    assert outputs["session"] == outputs["local"]
+
+
+@pytest.fixture
+def key_home(seqno, monkeypatch, tmp_path):
+    """口令文件放到临时目录，且不受本机环境变量影响"""
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    monkeypatch.delenv(seqno.SESSION_AUTHKEY_ENV, raising=False)
+    seqno.CAD_SESSION_AUTHKEY = None
+    return tmp_path
+
+
+def test_session_authkey_has_no_default(seqno, key_home):
+    with pytest.raises(RuntimeError):
+        seqno.session_authkey()
+    seqno.CAD_SESSION_ADDRESS = "127.0.0.1:1"
+    assert seqno.connect_cad_session() is None
+    assert not os.path.exists(seqno.get_session_key_path())
+
+
+def test_session_authkey_prefers_config_then_environment(seqno, key_home, monkeypatch):
+    monkeypatch.setenv(seqno.SESSION_AUTHKEY_ENV, "from-env")
+    assert seqno.session_authkey() == b"from-env"
+    seqno.CAD_SESSION_AUTHKEY = "from-config"
+    assert seqno.session_authkey(create=True) == b"from-config"
+    assert not os.path.exists(seqno.get_session_key_path())
+
+
+def test_session_authkey_is_generated_once_per_user(seqno, key_home):
+    key = seqno.session_authkey(create=True)
+    assert len(key) == 64
+    path = seqno.get_session_key_path()
+    if os.name == "posix":
+        assert os.stat(path).st_mode & 0o777 == 0o600
+    assert seqno.session_authkey() == key
+    assert seqno.session_authkey(create=True) == key
+    if os.name == "posix":
+        os.chmod(path, 0o644)
+        with pytest.raises(RuntimeError):
+            seqno.session_authkey()
@@ -0,0 +1,66 @@
+import json
+import os
+
+import openpyxl
+
+
+def test_record_query_and_replace(seqno, tmp_path):
+    store = seqno.AnnotationStore(str(tmp_path / "store" / "annotations.sqlite"))
+    try:
+        a, b = str(tmp_path / "a.dwg"), str(tmp_path / "b.dwg")
+        store.record(a, seqno.AnnotationTable([("%%c20", 1.0, 2.0), ("R5", 3.0, 4.0), ("Φ20", 5.0, 6.0)]), 3)
+        store.record(b, seqno.AnnotationTable([("∅20", 0.0, 0.0)]), 1)
+        # 查询值与保存值都按同样规则规范化
+        assert store.find_drawings("Φ20") == [(a, 2), (b, 1)]
+        assert store.find_drawings("%%C20") == [(a, 2), (b, 1)]
+        assert store.find_drawings("R5") == [(a, 1)]
+        assert [tuple(item) for item in store.annotations(a)] == [("%%c20", 1.0, 2.0), ("R5", 3.0, 4.0),
+                                                                  ("Φ20", 5.0, 6.0)]
+
+        # 重新处理的图纸整体替换
+        store.record(a, seqno.AnnotationTable([("M8", 7.0, 8.0)]), 1)
+        assert store.find_drawings("Φ20") == [(b, 1)]
+        assert [tuple(item) for item in store.annotations(a)] == [("M8", 7.0, 8.0)]
+        assert store.drawings() == [(a, "a"), (b, "b")]
+    finally:
+        store.close()
+
+
+def test_export_excel(seqno, tmp_path):
+    store = seqno.AnnotationStore(str(tmp_path / "annotations.sqlite"))
+    try:
+        a, b = str(tmp_path / "a.dwg"), str(tmp_path / "b.dwg")
+        store.record(a, seqno.AnnotationTable([("%%c20", 1.0, 2.0), ("12.5", 3.0, 4.0)]), 2)
+        store.record(b, seqno.AnnotationTable([("R5", 0.0, 0.0)]), 1)
+        excel_path = str(tmp_path / "report.xlsx")
+        assert store.export_excel(excel_path) == 2
+        assert store.export_excel(str(tmp_path / "only_b.xlsx"), paths={b}) == 1
+    finally:
+        store.close()
+    workbook = openpyxl.load_workbook(excel_path, read_only=True)
+    try:
+        assert workbook.sheetnames == ["说明", "a", "b"]
+        rows = list(workbook["a"].iter_rows(min_row=2, values_only=True))
+        assert [row[1:] for row in rows] == [("Φ20", 1, 2), ("12.50", 3, 4)]
+    finally:
+        workbook.close()
+
+
+def test_batch_records_and_cli_queries(seqno, batch, capsys):
+    make_drawings, run = batch
+    paths = make_drawings([5, 8])
+    summary = run(paths, STORE_ENABLED=True)
+    store = seqno.AnnotationStore(summary["store"])
+    try:
+        assert [path for path, _ in store.drawings()] == [os.path.abspath(path) for path in paths]
+        assert [len(store.annotations(path)) for path in paths] == [r["annotations"] for r in summary["files"]]
+        value = store.annotations(paths[0]).strings[0]
+    finally:
+        store.close()
+
+    assert seqno.main(["--work-dir", seqno.WORK_DIR, "--query", value]) == 0
+    found = json.loads(capsys.readouterr().out)
+    assert os.path.abspath(paths[0]) in [item["file"] for item in found]
+    excel_path = os.path.join(seqno.WORK_DIR, "from_store.xlsx")
+    assert seqno.main(["--work-dir", seqno.WORK_DIR, "--export-excel", excel_path]) == 0
+    assert json.loads(capsys.readouterr().out)["sheets"] == 2